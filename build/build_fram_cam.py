@@ -47,7 +47,7 @@ include_files = [
     # did adding opencv resolve the need for this?
     ['resources/icons', 'lib/icons']
 ]
-packages = ["PySide6", "pyzbar", "cv2", 'araviq6', 'sqlite3', "encodings", 'piexif', 'PIL']
+packages = ["PySide6", "pyzbar", "cv2", 'sqlite3', "encodings", 'piexif', 'PIL']
 path = []
 
 # Dependencies are automatically detected, but it might need fine tuning.
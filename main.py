@@ -1,5 +1,6 @@
 
 import sys
+import multiprocessing
 from py.app import FramCamPlus
 
 
@@ -8,4 +9,5 @@ def run_app():
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # barcode decoder pool spawns processes, frozen exe needs this on windows
     run_app()
\ No newline at end of file
@@ -15,6 +15,7 @@ from py.qsqlite import QSqlite
 from py.style import Style
 from py.settings import Settings
 from py.cloud_uploader import CloudUploader
+from py.thumbnails import ThumbnailProvider, PROVIDER_NAME as THUMBNAIL_PROVIDER_NAME
 from qrc import qresources  # need this to import compiled qrc resources
 
 # 3rd party imports
@@ -97,6 +98,9 @@ class FramCamPlus(QObject):
         self.image_manager = ImageManager(self.sqlite.db, self)
         self.cloud_uploader = CloudUploader(self.sqlite.db, self)
 
+        self.app.aboutToQuit.connect(self.cam_controls.shutdown)  # stop frame processing threads/processes
+        self.app.aboutToQuit.connect(self.image_manager.shutdown)  # store captures still in the write pipeline
+
         self.context.setContextProperty('state', self.state)
         self.context.setContextProperty('settings', self.settings)
         self.context.setContextProperty('appStyle', self.style)
@@ -105,6 +109,10 @@ class FramCamPlus(QObject):
         self.context.setContextProperty('imageManager', self.image_manager)
         self.context.setContextProperty('cloudUploader', self.cloud_uploader)
 
+        self.thumbnail_provider = ThumbnailProvider()  # engine takes ownership, keep a python ref anyway
+        self.engine.addImageProvider(THUMBNAIL_PROVIDER_NAME, self.thumbnail_provider)
+        self.image_manager.imagesModel.imageRemoved.connect(self.thumbnail_provider.invalidate)
+
         # lastly, load up qml
         self.engine.load('qrc:/windows/MainWindow.qml')
 
@@ -0,0 +1,296 @@
+"""
+barcode_corpus.py: render synthetic vial tags / whole specimen tags for decode accuracy and latency benchmarks.
+
+Tags are drawn from scratch (no barcode font/library needed) in the two symbologies the scanner looks for:
+    code 128:   16 digit whole specimen tags, e.g. 2022008900067006 (code set C)
+    code 39:    short alphanumeric vial labels
+
+Each tag is pasted onto a deck-like background with controlled scale, rotation, perspective, blur, glare and
+noise, and the ground truth (barcode value, symbology, corner points and augmentation params) is written to
+labels.json next to the images.  Score decode strategies against a corpus with:
+
+    python -m py.barcode_corpus data/bench/tags --count 500 --seed 1
+    python -m py.benchmark decode data/bench/tags
+"""
+# standard imports
+import argparse
+import json
+from pathlib import Path
+
+# local imports
+from py.logger import Logger
+
+# 3rd party imports
+import cv2
+import numpy as np
+
+LABELS_FILE = 'labels.json'
+
+# code 128 bar/space module widths for symbol values 0-106 (103-105 are start A/B/C, 106 is stop)
+CODE128_PATTERNS = (
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213', '122312', '132212', '221213',
+    '221312', '231212', '112232', '122132', '122231', '113222', '123122', '123221', '223211', '221132',
+    '221231', '213212', '223112', '312131', '311222', '321122', '321221', '312212', '322112', '322211',
+    '212123', '212321', '232121', '111323', '131123', '131321', '112313', '132113', '132311', '211313',
+    '231113', '231311', '112133', '112331', '132131', '113123', '113321', '133121', '313121', '211331',
+    '231131', '213113', '213311', '213131', '311123', '311321', '331121', '312113', '312311', '332111',
+    '314111', '221411', '431111', '111224', '111422', '121124', '121421', '141122', '141221', '112214',
+    '112412', '122114', '122411', '142112', '142211', '241211', '221114', '413111', '241112', '134111',
+    '111242', '121142', '121241', '114212', '124112', '124211', '411212', '421112', '421211', '212141',
+    '214121', '412121', '111143', '111341', '131141', '114113', '114311', '411113', '411311', '113141',
+    '114131', '311141', '411131', '211412', '211214', '211232', '2331112'
+)
+CODE128_START_B, CODE128_START_C, CODE128_STOP = 104, 105, 106
+
+# code 39 wide (1) / narrow (0) flags for bar, space, bar, ... (9 elements, 3 wide)
+CODE39_PATTERNS = {
+    '0': '000110100', '1': '100100001', '2': '001100001', '3': '101100000', '4': '000110001',
+    '5': '100110000', '6': '001110000', '7': '000100101', '8': '100100100', '9': '001100100',
+    'A': '100001001', 'B': '001001001', 'C': '101001000', 'D': '000011001', 'E': '100011000',
+    'F': '001011000', 'G': '000001101', 'H': '100001100', 'I': '001001100', 'J': '000011100',
+    'K': '100000011', 'L': '001000011', 'M': '101000010', 'N': '000010011', 'O': '100010010',
+    'P': '001010010', 'Q': '000000111', 'R': '100000110', 'S': '001000110', 'T': '000010110',
+    'U': '110000001', 'V': '011000001', 'W': '111000000', 'X': '010010001', 'Y': '110010000',
+    'Z': '011010000', '-': '010000101', '.': '110000100', ' ': '011000100', '*': '010010100',
+    '$': '010101000', '/': '010100010', '+': '010001010', '%': '000101010'
+}
+CODE39_WIDE = 3  # wide element width in modules, 2-3x narrow is in spec
+
+QUIET_ZONE_MODULES = 10
+
+
+def code128_modules(value: str) -> np.ndarray:
+    """
+    :param value: str to encode; all digit, even length strings use code set C (how whole specimen tags are
+        printed), anything else code set B
+    :return: 1d uint8 array, 1 for each dark module, 0 for light, without quiet zone
+    """
+    if value.isdigit() and len(value) % 2 == 0:
+        _symbols = [CODE128_START_C] + [int(value[i:i + 2]) for i in range(0, len(value), 2)]
+    else:
+        _symbols = [CODE128_START_B] + [ord(c) - 32 for c in value]
+        if any(s < 0 or s > 95 for s in _symbols[1:]):
+            raise ValueError(f"Unable to encode {value} in code 128 set B")
+
+    _checksum = (_symbols[0] + sum(i * s for i, s in enumerate(_symbols[1:], start=1))) % 103
+    _symbols += [_checksum, CODE128_STOP]
+
+    _modules = []
+    for _symbol in _symbols:
+        for i, _width in enumerate(CODE128_PATTERNS[_symbol]):
+            _modules += [1 - i % 2] * int(_width)  # patterns alternate bar, space, starting with a bar
+    return np.array(_modules, dtype=np.uint8)
+
+
+def code39_modules(value: str) -> np.ndarray:
+    """
+    :param value: str of code 39 characters (uppercase, digits, -. $/+%), no check digit
+    :return: 1d uint8 array, 1 for each dark module, 0 for light, without quiet zone
+    """
+    _unknown = [c for c in value if c not in CODE39_PATTERNS or c == '*']
+    if _unknown:
+        raise ValueError(f"Unable to encode {_unknown} in code 39")
+
+    _modules = []
+    for _char in f'*{value}*':
+        for i, _wide in enumerate(CODE39_PATTERNS[_char]):
+            _modules += [1 - i % 2] * (CODE39_WIDE if _wide == '1' else 1)
+        _modules.append(0)  # narrow gap between characters
+    return np.array(_modules[:-1], dtype=np.uint8)
+
+
+def render_tag(value: str, symbology: int, module_px: int = 3, bar_height_px: int = 90, text: bool = True) -> np.ndarray:
+    """
+    draw a tag: white label with the barcode, quiet zones and (optionally) human readable text underneath
+    :param value: str to encode
+    :param symbology: int, 128 or 39 (zbar symbol ids, see barcode_scanner.BARCODE_SYMBOLS)
+    :param module_px: int, width of narrowest bar in px
+    :param bar_height_px: int, height of bars in px
+    :param text: bool, print value under the bars like the real tags
+    :return: single channel uint8 image of the tag
+    """
+    _modules = code128_modules(value) if symbology == 128 else code39_modules(value)
+    _modules = np.pad(_modules, QUIET_ZONE_MODULES)
+    _row = np.where(np.repeat(_modules, module_px) == 1, 0, 255).astype(np.uint8)
+
+    _margin = module_px * 4
+    _text_px = 28 if text else 0
+    _tag = np.full((bar_height_px + 2 * _margin + _text_px, len(_row)), 255, dtype=np.uint8)
+    _tag[_margin:_margin + bar_height_px] = _row
+    if text:
+        _scale = 0.7
+        (_w, _h), _ = cv2.getTextSize(value, cv2.FONT_HERSHEY_SIMPLEX, _scale, 2)
+        _org = ((len(_row) - _w) // 2, _margin + bar_height_px + _h + 6)
+        cv2.putText(_tag, value, _org, cv2.FONT_HERSHEY_SIMPLEX, _scale, 0, 2, cv2.LINE_AA)
+    return _tag
+
+
+def deck_background(rng: np.random.Generator, size: tuple) -> np.ndarray:
+    """
+    wet, dirty, unevenly lit deck/tote/table surface: low frequency blotches, a lighting gradient and grain
+    :param rng: numpy random Generator
+    :param size: (width, height)
+    :return: RGB uint8 image
+    """
+    _width, _height = size
+    _base = rng.uniform(40, 170, size=3)  # overall color, anything from dark steel to orange totes
+    _blotches = cv2.resize(rng.normal(0, 25, (6, 8, 3)).astype(np.float32), (_width, _height),
+                           interpolation=cv2.INTER_CUBIC)
+    _gradient = np.linspace(rng.uniform(-40, 0), rng.uniform(0, 40), _width, dtype=np.float32)[None, :, None]
+    _grain = rng.normal(0, 6, (_height, _width, 3)).astype(np.float32)
+    return np.clip(_base + _blotches + _gradient + _grain, 0, 255).astype(np.uint8)
+
+
+def sample_params(rng: np.random.Generator) -> dict:
+    """
+    :return: dict of random augmentation params for one sample, stored with its label
+    """
+    return {
+        'scale': float(rng.uniform(0.5, 1.4)),
+        'rotation_deg': float(rng.choice([rng.uniform(-15, 15), rng.uniform(-180, 180)], p=[0.7, 0.3])),
+        'perspective': float(rng.uniform(0, 0.15)),
+        'blur_sigma': float(rng.choice([0, rng.uniform(0.5, 1.5), rng.uniform(1.5, 3.5)], p=[0.4, 0.4, 0.2])),
+        'motion_blur_px': int(rng.choice([0, rng.integers(3, 12)], p=[0.8, 0.2])),
+        'glare': float(rng.choice([0, rng.uniform(0.3, 1.0)], p=[0.6, 0.4])),
+        'noise_sigma': float(rng.uniform(0, 8)),
+        'jpeg_quality': int(rng.integers(60, 96))
+    }
+
+
+def random_value(rng: np.random.Generator, symbology: int) -> str:
+    """
+    :return: whole specimen tag (code 128) like 2022008900067006, or a short vial label (code 39) like 2304512
+    """
+    if symbology == 128:
+        _year = rng.integers(2019, 2031)
+        return f'{_year}' + ''.join(str(d) for d in rng.integers(0, 10, 12))
+    return ''.join(str(d) for d in rng.integers(0, 10, int(rng.integers(5, 10))))
+
+
+def compose_sample(rng: np.random.Generator, value: str, symbology: int, params: dict, size: tuple = (640, 480)):
+    """
+    render a tag and place it on a background with the given augmentations
+    :param rng: numpy random Generator
+    :param value: str to encode
+    :param symbology: int, 128 or 39
+    :param params: dict from sample_params
+    :param size: (width, height) of output image
+    :return: tuple (RGB uint8 image, 4x2 float32 tag corners in image coords: top left, top right, bottom right, bottom left)
+    """
+    _width, _height = size
+    _tag = render_tag(value, symbology)
+    _tag_h, _tag_w = _tag.shape
+
+    # fit the tag to ~60% of the frame width, then apply scale
+    _fit = min(0.6 * _width / _tag_w, 0.6 * _height / _tag_h) * params['scale']
+    _corners = np.array([[0, 0], [_tag_w, 0], [_tag_w, _tag_h], [0, _tag_h]], np.float32)
+    _dest = (_corners - [_tag_w / 2, _tag_h / 2]) * _fit
+
+    # perspective: jitter each corner by up to perspective * tag size
+    _jitter = rng.uniform(-1, 1, (4, 2)) * params['perspective'] * [_tag_w * _fit, _tag_h * _fit]
+    _dest = _dest + _jitter
+
+    _theta = np.deg2rad(params['rotation_deg'])
+    _rotation = np.array([[np.cos(_theta), -np.sin(_theta)], [np.sin(_theta), np.cos(_theta)]], np.float32)
+    _dest = _dest @ _rotation.T
+
+    # random placement, keeping the tag inside the frame where possible
+    _half = np.abs(_dest).max(axis=0)
+    _center = [rng.uniform(min(_half[0], _width / 2), max(_width - _half[0], _width / 2)),
+               rng.uniform(min(_half[1], _height / 2), max(_height - _half[1], _height / 2))]
+    _dest = (_dest + _center).astype(np.float32)
+
+    _transform = cv2.getPerspectiveTransform(_corners, _dest)
+    _warped = cv2.warpPerspective(_tag, _transform, size, flags=cv2.INTER_LINEAR, borderValue=0)
+    _mask = cv2.warpPerspective(np.full_like(_tag, 255), _transform, size, flags=cv2.INTER_LINEAR, borderValue=0)
+
+    _image = deck_background(rng, size).astype(np.float32)
+    _alpha = (_mask.astype(np.float32) / 255)[:, :, None]
+    _paper = rng.uniform(0.8, 1.0, 3).astype(np.float32)  # slightly off white labels
+    _image = _image * (1 - _alpha) + (_warped[:, :, None].astype(np.float32) * _paper) * _alpha
+
+    if params['glare'] > 0:  # specular highlight from deck lights on wet/laminated tags
+        _yy, _xx = np.mgrid[0:_height, 0:_width].astype(np.float32)
+        _gx, _gy = _dest[rng.integers(0, 4)] * 0.5 + np.array(_center, np.float32) * 0.5
+        _radius = rng.uniform(0.05, 0.2) * _width
+        _image += (params['glare'] * 255 * np.exp(-((_xx - _gx) ** 2 + (_yy - _gy) ** 2) / (2 * _radius ** 2)))[:, :, None]
+
+    if params['blur_sigma'] > 0:
+        _image = cv2.GaussianBlur(_image, (0, 0), params['blur_sigma'])
+
+    if params['motion_blur_px'] > 0:
+        _kernel = np.zeros((params['motion_blur_px'], params['motion_blur_px']), np.float32)
+        _kernel[params['motion_blur_px'] // 2, :] = 1 / params['motion_blur_px']
+        _center_k = (params['motion_blur_px'] / 2, params['motion_blur_px'] / 2)
+        _kernel = cv2.warpAffine(_kernel, cv2.getRotationMatrix2D(_center_k, rng.uniform(0, 180), 1), _kernel.shape)
+        _image = cv2.filter2D(_image, -1, _kernel / max(_kernel.sum(), 1e-6))
+
+    if params['noise_sigma'] > 0:
+        _image += rng.normal(0, params['noise_sigma'], _image.shape).astype(np.float32)
+
+    return np.clip(_image, 0, 255).astype(np.uint8), _dest
+
+
+def generate_corpus(out_dir: str, count: int = 200, seed: int = 0, size: tuple = (640, 480),
+                    code39_fraction: float = 0.3) -> list:
+    """
+    write count jpgs and labels.json to out_dir.  The same seed always produces the same corpus.
+    :param out_dir: str, directory to write to (created if needed)
+    :param count: int, number of samples
+    :param seed: int, random seed
+    :param size: (width, height) of images
+    :param code39_fraction: float, fraction of samples that are code 39 vial labels
+    :return: list of label dicts, as written to labels.json
+    """
+    _logger = Logger.get_root()
+    _out = Path(out_dir)
+    _out.mkdir(parents=True, exist_ok=True)
+    _rng = np.random.default_rng(seed)
+
+    _labels = []
+    for i in range(count):
+        _symbology = 39 if _rng.uniform() < code39_fraction else 128
+        _value = random_value(_rng, _symbology)
+        _params = sample_params(_rng)
+        _image, _corners = compose_sample(_rng, _value, _symbology, _params, size)
+
+        _file_name = f'tag_{i:05d}.jpg'
+        cv2.imwrite(str(_out / _file_name), cv2.cvtColor(_image, cv2.COLOR_RGB2BGR),
+                    [cv2.IMWRITE_JPEG_QUALITY, _params['jpeg_quality']])
+        _labels.append({
+            'file': _file_name,
+            'barcode': _value,
+            'symbology': _symbology,
+            'corners': np.round(_corners, 1).tolist(),
+            'params': _params
+        })
+
+    with open(_out / LABELS_FILE, 'w') as f:
+        json.dump({'seed': seed, 'size': list(size), 'samples': _labels}, f, indent=2)
+    _logger.info(f"Wrote {count} synthetic barcode samples to {_out}")
+    return _labels
+
+
+def load_corpus(corpus_dir: str) -> list:
+    """
+    :param corpus_dir: str, directory written by generate_corpus
+    :return: list of label dicts, each with an added 'path' key
+    """
+    _dir = Path(corpus_dir)
+    with open(_dir / LABELS_FILE) as f:
+        _samples = json.load(f)['samples']
+    for _sample in _samples:
+        _sample['path'] = str(_dir / _sample['file'])
+    return _samples
+
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser(description='Generate a synthetic code 128/39 tag corpus with ground truth labels')
+    _parser.add_argument('out_dir')
+    _parser.add_argument('--count', type=int, default=200)
+    _parser.add_argument('--seed', type=int, default=0)
+    _parser.add_argument('--width', type=int, default=640)
+    _parser.add_argument('--height', type=int, default=480)
+    _parser.add_argument('--code39-fraction', type=float, default=0.3)
+    _args = _parser.parse_args()
+    generate_corpus(_args.out_dir, _args.count, _args.seed, (_args.width, _args.height), _args.code39_fraction)
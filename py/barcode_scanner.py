@@ -0,0 +1,575 @@
+"""
+barcode_scanner.py: helpers used by CVFrameWorker to find and decode barcodes in camera frames.
+
+Kept out of cam_controls.py so they can be used without a camera/capture session (e.g. on still images).
+"""
+# standard imports
+from collections import deque
+import time
+
+# local imports
+from py.logger import Logger
+from py.buffer_pool import FrameBufferPool
+from py.pipeline_stats import PipelineStats, RollingHistogram
+
+# 3rd party imports
+import cv2
+import numpy as np
+import pyzbar.pyzbar
+
+BARCODE_SYMBOLS = [128, 39]  # zbar symbol ids: code 128 (whole specimen tags) and code 39 (vials)
+DECODE_STAGES = ('grayscale', 'otsu', 'adaptive_gaussian', 'opencv')  # default cascade order, cheapest first
+GATE_WIDTH = 160  # px width frames are downsampled to before scoring sharpness/motion
+
+
+class BarcodeRoiTracker:
+    """
+    Remember where the last barcode was found, so the next N scans only need to look at a
+    crop around it.  When a tech holds a vial tag steady in front of the camera, the tag
+    only takes up a small part of the frame, so there's no point thresholding/decoding the rest.
+
+    Usage per scan:
+        1.) crop, offset = tracker.crop(frame)  (returns the whole frame if we aren't tracking)
+        2.) decode the crop, add offset to any points found
+        3.) tracker.hit(points, frame.shape) or tracker.miss()
+    """
+    def __init__(self, track_for_n: int = 15, margin: float = 0.5, min_size: int = 96):
+        """
+        :param track_for_n: int, number of scans we stick to the ROI after a hit before forcing a full frame scan
+        :param margin: float, grow the last barcode bounding box by this fraction of its size on each side
+        :param min_size: int, smallest ROI width/height in px, small crops are prone to cutting off tag edges
+        """
+        self._logger = Logger.get_root()
+        self._track_for_n = track_for_n
+        self._margin = margin
+        self._min_size = min_size
+        self._roi = None  # (x0, y0, x1, y1) in full frame pixels
+        self._scans_left = 0
+        self._roi_hits = 0
+        self._roi_misses = 0
+
+    @property
+    def is_tracking(self) -> bool:
+        return self._roi is not None and self._scans_left > 0
+
+    @property
+    def roi(self):
+        return self._roi
+
+    @property
+    def stats(self) -> dict:
+        return {'roi_hits': self._roi_hits, 'roi_misses': self._roi_misses}
+
+    def reset(self):
+        self._roi = None
+        self._scans_left = 0
+
+    def crop(self, array: np.ndarray):
+        """
+        :param array: full frame image array
+        :return: tuple (view of array to scan, (x, y) offset of view in full frame)
+        """
+        if not self.is_tracking:
+            return array, (0, 0)
+
+        _x0, _y0, _x1, _y1 = self._roi
+        self._scans_left -= 1
+        return array[_y0:_y1, _x0:_x1], (_x0, _y0)
+
+    def hit(self, points: np.ndarray, frame_shape: tuple, from_roi: bool = False):
+        """
+        barcode found, (re)center the ROI on it
+        :param points: Nx2 array of barcode polygon points, full frame coords
+        :param frame_shape: shape of full frame array
+        :param from_roi: bool, was this found in the ROI crop (vs a full frame scan)?
+        """
+        if from_roi:
+            self._roi_hits += 1
+
+        _height, _width = frame_shape[:2]
+        _x0, _y0 = points.min(axis=0)
+        _x1, _y1 = points.max(axis=0)
+        _pad_x = max(int((_x1 - _x0) * self._margin), (self._min_size - (_x1 - _x0)) // 2, 0)
+        _pad_y = max(int((_y1 - _y0) * self._margin), (self._min_size - (_y1 - _y0)) // 2, 0)
+        self._roi = (
+            int(max(_x0 - _pad_x, 0)),
+            int(max(_y0 - _pad_y, 0)),
+            int(min(_x1 + _pad_x, _width)),
+            int(min(_y1 + _pad_y, _height))
+        )
+        self._scans_left = self._track_for_n
+
+    def miss(self, from_roi: bool = False):
+        """
+        nothing found; if we were scanning the ROI, drop it so the next scan covers the whole frame
+        :param from_roi: bool, was the failed scan of the ROI crop?
+        """
+        if from_roi:
+            self._roi_misses += 1
+            self._logger.debug(f"Barcode not found in ROI {self._roi}, falling back to full frame scan")
+        self.reset()
+
+
+class SharpnessGate:
+    """
+    Cheap check, run before the decode cascade, that skips frames too blurry to decode.  On deck most frames
+    are smeared by moving hands and fish, and a failed decode costs as much as a successful one.
+
+    Both scores are computed on a ~160px wide downsample:
+        sharpness:  variance of the Laplacian, drops off sharply with focus/motion blur
+        motion:     mean absolute difference from the previous frame's downsample
+
+    Thresholds adapt to the scene, since lighting and camera change the absolute numbers: a frame passes if its
+    sharpness is at least sharpness_ratio of the recent p90 sharpness, and its motion isn't much above recent
+    typical motion.  After max_skips blocked frames in a row, one is let through regardless so decode never starves.
+    """
+    def __init__(self, sharpness_ratio: float = 0.5, motion_ratio: float = 2.0, motion_floor: float = 4.0,
+                 max_skips: int = 15, window: int = 90, buffers: FrameBufferPool = None):
+        """
+        :param sharpness_ratio: float, fraction of recent p90 sharpness a frame needs to pass
+        :param motion_ratio: float, frames moving more than this multiple of recent median motion are blocked
+        :param motion_floor: float, motion (mean abs px difference) always considered still enough
+        :param max_skips: int, let a frame through after this many blocked in a row
+        :param window: int, number of recent frames thresholds are based on
+        :param buffers: FrameBufferPool for the downsample/laplacian buffers
+        """
+        self._buffers = buffers if buffers is not None else FrameBufferPool()
+        self._sharpness_ratio = sharpness_ratio
+        self._motion_ratio = motion_ratio
+        self._motion_floor = motion_floor
+        self._max_skips = max_skips
+        self._recent_sharpness = RollingHistogram(window)
+        self._recent_motion = RollingHistogram(window)
+        self._has_previous = False
+        self._skips_in_row = 0
+        self._passed = 0
+        self._skipped = 0
+        self._last = {}
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: dict of passed/skipped counts, pass rate, and the last scores/thresholds
+        """
+        _total = self._passed + self._skipped
+        return {
+            'passed': self._passed,
+            'skipped': self._skipped,
+            'pass_rate': round(self._passed / _total, 3) if _total else 1.0,
+            **self._last
+        }
+
+    def reset(self):
+        self._has_previous = False
+        self._skips_in_row = 0
+
+    def score(self, gray: np.ndarray) -> tuple:
+        """
+        :param gray: single channel image array
+        :return: tuple (sharpness, motion); motion is 0 if there's no previous frame of the same size
+        """
+        _height, _width = gray.shape
+        _small_size = (GATE_WIDTH, max(1, round(_height * GATE_WIDTH / _width)))
+        _small = cv2.resize(gray, _small_size, dst=self._buffers.get('gate_small', _small_size[::-1]),
+                            interpolation=cv2.INTER_AREA)
+
+        _laplacian = cv2.Laplacian(_small, cv2.CV_16S, dst=self._buffers.get('gate_laplacian', _small.shape, np.int16))
+        _mean, _std = cv2.meanStdDev(_laplacian)
+        _sharpness = float(_std[0, 0]) ** 2
+
+        _previous = self._buffers.get('gate_previous', _small.shape)
+        _motion = 0.0
+        if self._has_previous:
+            _diff = cv2.absdiff(_small, _previous, dst=self._buffers.get('gate_diff', _small.shape))
+            _motion = float(cv2.mean(_diff)[0])
+        np.copyto(_previous, _small)
+        self._has_previous = True
+        return _sharpness, _motion
+
+    def check(self, gray: np.ndarray) -> bool:
+        """
+        :param gray: single channel image array
+        :return: bool, is this frame worth decoding?
+        """
+        _sharpness, _motion = self.score(gray)
+        _sharpness_min = self._sharpness_ratio * self._recent_sharpness.percentiles((90,)).get('p90', 0.0)
+        _motion_max = max(self._motion_floor, self._motion_ratio * self._recent_motion.percentiles((50,)).get('p50', 0.0))
+        self._recent_sharpness.record(_sharpness)
+        self._recent_motion.record(_motion)
+
+        _is_sharp = _sharpness >= _sharpness_min and _motion <= _motion_max
+        _passes = _is_sharp or self._skips_in_row >= self._max_skips
+        self._skips_in_row = 0 if _passes else self._skips_in_row + 1
+        if _passes:
+            self._passed += 1
+        else:
+            self._skipped += 1
+
+        self._last = {
+            'sharpness': round(_sharpness, 1),
+            'sharpness_min': round(_sharpness_min, 1),
+            'motion': round(_motion, 2),
+            'motion_max': round(_motion_max, 2)
+        }
+        return _passes
+
+
+class DetectionVoter:
+    """
+    Debounce decode results before they leave the frame worker.  Every emitted barcode costs a cross-thread
+    signal, a DataSelector lookup and a refilter of the catch/project/bio comboboxes, and a single misread picks
+    the wrong specimen, so a barcode is only accepted once it's been read in k of the last n decodes (misses count
+    as decodes) within window_s seconds.  Once accepted, the same code isn't accepted again until a different code
+    is, reset() is called, or it hasn't been seen for rearm_s (tag left the frame and came back).
+
+        barcode = voter.vote(decoded_barcode_or_None)  # barcode to emit, or None
+    """
+    def __init__(self, k: int = 2, n: int = 4, window_s: float = 1.0, rearm_s: float = 3.0):
+        """
+        :param k: int, matching reads needed
+        :param n: int, number of recent decodes considered
+        :param window_s: float, reads older than this many seconds don't count
+        :param rearm_s: float, an accepted code unseen this long can be accepted again
+        """
+        self._k = k
+        self._window_s = window_s
+        self._rearm_s = rearm_s
+        self._recent = deque(maxlen=n)  # (perf_counter time, barcode or None)
+        self._accepted = None
+        self._accepted_last_seen = 0.0
+        self._counts = {'votes': 0, 'accepted': 0, 'repeats_suppressed': 0, 'below_quorum': 0}
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._counts)
+
+    def reset(self):
+        """
+        forget recent reads and the accepted code, e.g. when the user clears the current barcode
+        """
+        self._recent.clear()
+        self._accepted = None
+
+    def vote(self, barcode, now: float = None):
+        """
+        :param barcode: str decoded barcode, or None if the decode found nothing
+        :param now: float, perf_counter time of the decode
+        :return: str, barcode to emit if it just won the vote, else None
+        """
+        now = time.perf_counter() if now is None else now
+        self._counts['votes'] += 1
+        self._recent.append((now, barcode))
+        if barcode is None:
+            return None
+
+        if barcode == self._accepted:
+            _is_rearmed = now - self._accepted_last_seen > self._rearm_s
+            self._accepted_last_seen = now
+            if not _is_rearmed:
+                self._counts['repeats_suppressed'] += 1
+                return None
+
+        _matches = sum(1 for t, b in self._recent if b == barcode and now - t <= self._window_s)
+        if _matches < self._k:
+            self._counts['below_quorum'] += 1
+            return None
+
+        self._accepted, self._accepted_last_seen = barcode, now
+        self._counts['accepted'] += 1
+        return barcode
+
+
+def to_gray(array: np.ndarray, dst: np.ndarray = None) -> np.ndarray:
+    """
+    :param array: cv image array, RGB or already single channel
+    :param dst: optional single channel array to write into, see FrameBufferPool
+    :return: single channel array (the same array if it was already gray)
+    """
+    if array.ndim == 2:
+        return array
+    return cv2.cvtColor(array, cv2.COLOR_RGB2GRAY, dst=dst)
+
+
+class ZbarPixels:
+    """
+    Pixels in the (pixels, width, height) form pyzbar.decode takes, pointing zbar at an array's own memory.
+    Handed an ndarray, pyzbar copies it with tobytes() on every decode, i.e. a whole image per cascade attempt.
+    """
+    __slots__ = ('_array', '_as_parameter_')
+
+    def __init__(self, array: np.ndarray):
+        """
+        :param array: C contiguous single channel uint8 array, must stay unchanged until the decode returns
+        """
+        self._array = array  # keeps the memory alive while zbar reads it
+        self._as_parameter_ = array.ctypes.data  # what ctypes.cast(pixels, c_void_p) in pyzbar picks up
+
+    def __len__(self):
+        return self._array.size
+
+
+def zbar_decode(gray: np.ndarray) -> tuple:
+    """
+    :param gray: single channel uint8 image array, copied first if its rows aren't back to back (e.g. a crop)
+    :return: tuple (barcode str, Nx2 int32 array of polygon points), or (None, None) if nothing decoded
+    """
+    gray = np.ascontiguousarray(gray)
+    r = pyzbar.pyzbar.decode((ZbarPixels(gray), gray.shape[1], gray.shape[0]), symbols=BARCODE_SYMBOLS)
+    if not r:
+        return None, None
+
+    return r[0].data.decode('utf-8'), np.array([[p.x, p.y] for p in r[0].polygon], np.int32)
+
+
+class DecodeStageStats:
+    """
+    hit rate and cost of one cascade stage.  Counts decay with each attempt so that the stats (and the
+    cascade order built from them) follow changes in lighting rather than averaging over the whole trip.
+    """
+    def __init__(self, decay: float = 0.99):
+        self._decay = decay
+        self._attempts = 0.0  # decayed counts used for ranking
+        self._hits = 0.0
+        self._seconds = 0.0
+        self.total_attempts = 0  # raw counts for reporting
+        self.total_hits = 0
+
+    def record(self, is_hit: bool, seconds: float):
+        self._attempts = self._attempts * self._decay + 1
+        self._hits = self._hits * self._decay + int(is_hit)
+        self._seconds = self._seconds * self._decay + seconds
+        self.total_attempts += 1
+        self.total_hits += int(is_hit)
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        laplace smoothed, so stages we haven't tried much still get a fair shot
+        """
+        return (self._hits + 1) / (self._attempts + 2)
+
+    @property
+    def avg_ms(self) -> float:
+        return 1000 * self._seconds / self._attempts if self._attempts else 0.0
+
+    @property
+    def cost_per_hit(self) -> float:
+        """
+        expected ms spent in this stage per successful decode, lowest should run first
+        """
+        return self.avg_ms / self.hit_rate
+
+    def as_dict(self) -> dict:
+        """
+        hit_rate is the real rate over every attempt; ranking_hit_rate is the decayed, smoothed one the
+        cascade is ordered by, only reported so the order can be explained
+        """
+        return {
+            'attempts': self.total_attempts,
+            'hits': self.total_hits,
+            'hit_rate': round(self.total_hits / self.total_attempts, 3) if self.total_attempts else 0.0,
+            'ranking_hit_rate': round(self.hit_rate, 3),
+            'avg_ms': round(self.avg_ms, 3)
+        }
+
+
+class DecodeCascade:
+    """
+    Try a series of preprocessing/decode strategies on a grayscale frame, stopping at the first one
+    that decodes a barcode:
+
+        grayscale:          zbar on the raw gray image, cheapest, works in good light
+        otsu:               global otsu binarization, handles uneven exposure across the whole frame
+        adaptive_gaussian:  local threshold, handles glare/shadows across the tag
+        opencv:             cv2.barcode.BarcodeDetector locates (possibly rotated) barcodes, which are
+                            straightened and handed to zbar
+
+    Each stage records its hit rate and cost, and with auto_rank on the order is periodically re-sorted by
+    expected cost per hit, so whatever works best for the current deck lighting gets tried first.
+    Binarized images are written into re-used buffers, so results from one decode are overwritten by the next.
+    """
+    def __init__(self, stages=DECODE_STAGES, auto_rank: bool = True, rerank_every: int = 50,
+                 buffers: FrameBufferPool = None, timings: PipelineStats = None):
+        """
+        :param stages: iterable of stage names to use, in initial order
+        :param auto_rank: bool, re-order stages based on measured cost per hit
+        :param rerank_every: int, re-order after this many decode calls
+        :param buffers: FrameBufferPool to take threshold outputs from, shared with the frame worker if given
+        :param timings: PipelineStats to record threshold and per stage decode times to, if given
+        """
+        self._logger = Logger.get_root()
+        self._buffers = buffers if buffers is not None else FrameBufferPool()
+        self._timings = timings
+        self._stage_funcs = {
+            'grayscale': self._decode_grayscale,
+            'otsu': self._decode_otsu,
+            'adaptive_gaussian': self._decode_adaptive_gaussian,
+            'opencv': self._decode_opencv
+        }
+        self._stages = []
+        self._stats = {}
+        self._auto_rank = auto_rank
+        self._rerank_every = rerank_every
+        self._decodes_since_rank = 0
+        self._cv_barcode_detector = None  # built on first use, only needed for opencv stage
+        self.stages = stages
+
+    @property
+    def stages(self) -> list:
+        return list(self._stages)
+
+    @stages.setter
+    def stages(self, stage_names):
+        _unknown = [s for s in stage_names if s not in self._stage_funcs]
+        if _unknown:
+            raise ValueError(f"Unknown barcode decode stage(s): {_unknown}")
+
+        self._stages = list(stage_names)
+        self._stats = {s: self._stats.get(s, DecodeStageStats()) for s in self._stages}
+
+    @property
+    def auto_rank(self) -> bool:
+        return self._auto_rank
+
+    @auto_rank.setter
+    def auto_rank(self, status: bool):
+        self._auto_rank = status
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: dict of stage name --> dict of attempts, hits, hit_rate, avg_ms, in current cascade order
+        """
+        return {s: self._stats[s].as_dict() for s in self._stages}
+
+    def decode(self, gray: np.ndarray) -> tuple:
+        """
+        :param gray: single channel image array
+        :return: tuple (barcode str, Nx2 int32 polygon points, name of stage that decoded it), or (None, None, None)
+        """
+        _result = (None, None, None)
+        for _stage in self._stages:
+            _start = time.perf_counter()
+            _barcode, _points = self._stage_funcs[_stage](gray)
+            _seconds = time.perf_counter() - _start
+            self._stats[_stage].record(_barcode is not None, _seconds)
+            if self._timings is not None:
+                self._timings.record(f'decode:{_stage}', _seconds)
+            if _barcode is not None:
+                _result = (_barcode, _points, _stage)
+                break
+
+        self._decodes_since_rank += 1
+        if self._auto_rank and self._decodes_since_rank >= self._rerank_every:
+            self.rerank()
+
+        return _result
+
+    def decode_with_stage(self, stage: str, gray: np.ndarray) -> tuple:
+        """
+        run a single stage, without early exit/stat bookkeeping; used to benchmark strategies against each other
+        :param stage: str, name of stage
+        :param gray: single channel image array
+        :return: tuple (barcode str, Nx2 int32 polygon points), or (None, None)
+        """
+        return self._stage_funcs[stage](gray)
+
+    def rerank(self):
+        """
+        sort stages by expected ms per hit.  Sort is stable, so ties keep the current (cheapest first) order
+        """
+        self._decodes_since_rank = 0
+        _new_order = sorted(self._stages, key=lambda s: self._stats[s].cost_per_hit)
+        if _new_order != self._stages:
+            self._logger.info(f"Barcode decode cascade re-ranked: {self._stages} --> {_new_order}")
+            self._stages = _new_order
+
+    def _zbar_decode(self, gray: np.ndarray) -> tuple:
+        """
+        zbar_decode, with non contiguous input (ROI crops, pooled views narrower than their buffer) copied into
+        a pooled buffer rather than a fresh one
+        """
+        if not gray.flags.c_contiguous:
+            _contiguous = self._buffers.get('zbar_input', (1, gray.size))[0].reshape(gray.shape)
+            np.copyto(_contiguous, gray)
+            gray = _contiguous
+        return zbar_decode(gray)
+
+    def _decode_grayscale(self, gray: np.ndarray) -> tuple:
+        return self._zbar_decode(gray)
+
+    def binarize_otsu(self, gray: np.ndarray, name: str = 'otsu') -> np.ndarray:
+        """
+        https://docs.opencv.org/3.0-beta/doc/py_tutorials/py_imgproc/py_thresholding/py_thresholding.html
+        :param gray: single channel image array
+        :param name: str, buffer to write into
+        :return: binary image, a view of a pooled buffer
+        """
+        _start = time.perf_counter()
+        _ret, _binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU,
+                                      dst=self._buffers.like(name, gray))
+        self._record_threshold(_start)
+        return _binary
+
+    def binarize_adaptive_gaussian(self, gray: np.ndarray) -> np.ndarray:
+        """
+        :param gray: single channel image array
+        :return: binary image, a view of a pooled buffer
+        """
+        _start = time.perf_counter()
+        _binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2,
+                                        dst=self._buffers.like('adaptive_gaussian', gray))
+        self._record_threshold(_start)
+        return _binary
+
+    def _record_threshold(self, started: float):
+        if self._timings is not None:
+            self._timings.record('threshold', time.perf_counter() - started)
+
+    def _decode_otsu(self, gray: np.ndarray) -> tuple:
+        return self._zbar_decode(self.binarize_otsu(gray))
+
+    def _decode_adaptive_gaussian(self, gray: np.ndarray) -> tuple:
+        return self._zbar_decode(self.binarize_adaptive_gaussian(gray))
+
+    def _decode_opencv(self, gray: np.ndarray) -> tuple:
+        """
+        opencv's detector finds barcode quads regardless of rotation, but doesn't decode code 128/39 itself.
+        Warp each quad to an upright patch with a bit of white quiet zone and let zbar decode it.
+        """
+        if self._cv_barcode_detector is None:
+            self._cv_barcode_detector = cv2.barcode.BarcodeDetector()
+
+        _ok, _corners = self._cv_barcode_detector.detect(gray)
+        if not _ok or _corners is None:
+            return None, None
+
+        for _quad in _corners.reshape(-1, 4, 2):
+            _patch = self._straighten_quad(gray, _quad)
+            if _patch is None:
+                continue
+            _barcode, _points = self._zbar_decode(self.binarize_otsu(_patch, name='opencv_patch_binary'))
+            if _barcode is not None:
+                return _barcode, _quad.astype(np.int32)  # report the quad in frame coords, not patch coords
+
+        return None, None
+
+    def _straighten_quad(self, gray: np.ndarray, quad: np.ndarray, quiet_zone: int = 20):
+        """
+        :param gray: single channel image array
+        :param quad: 4x2 corners from cv2.barcode.BarcodeDetector (bottom left, top left, top right, bottom right)
+        :param quiet_zone: int, px of white border added around the patch, zbar wants margins around the bars
+        :return: upright patch as array, or None if the quad is degenerate
+        """
+        _width = int(np.linalg.norm(quad[2] - quad[1]))
+        _height = int(np.linalg.norm(quad[1] - quad[0]))
+        if _width < 8 or _height < 4:
+            return None
+
+        _dest = np.array([[0, _height - 1], [0, 0], [_width - 1, 0], [_width - 1, _height - 1]], np.float32)
+        _transform = cv2.getPerspectiveTransform(quad.astype(np.float32), _dest)
+        _patch = cv2.warpPerspective(gray, _transform, (_width, _height), flags=cv2.INTER_LINEAR,
+                                     dst=self._buffers.get('opencv_patch', (_height, _width)))
+        _bordered = self._buffers.get('opencv_patch_border', (_height + 2 * quiet_zone, _width + 2 * quiet_zone))
+        return cv2.copyMakeBorder(_patch, quiet_zone, quiet_zone, quiet_zone, quiet_zone, cv2.BORDER_CONSTANT,
+                                  dst=_bordered, value=255)
@@ -0,0 +1,412 @@
+"""
+benchmark.py: headless benchmarks for the image pipeline, no camera or display needed.
+
+Run from the project root, e.g.:
+
+    python -m py.benchmark --out frames.json frames data/bench/deck_footage.mp4 --barcode
+    python -m py.benchmark frames data/bench/deck_jpgs --barcode --blur --sketch
+    python -m py.benchmark decode data/bench/tags  (corpus from py/barcode_corpus.py)
+    python -m py.benchmark taxon --source data/bench/deck_footage.mp4  (stub model unless --model is given)
+    python -m py.benchmark copy data/images --workers 1,2,4,8  (to a temp dir unless --dest is given)
+    python -m py.benchmark exif data/images  (lossless exif tagging vs a PIL re-save)
+
+Results are printed (and optionally written) as JSON, so runs can be diffed on a build box.
+"""
+# standard imports
+import argparse
+from collections import Counter
+import json
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')  # must be set before Qt is imported
+
+# local imports
+from py.barcode_scanner import to_gray, DecodeCascade, DECODE_STAGES
+from py.barcode_corpus import load_corpus
+from py.pipeline_stats import PipelineStats, RollingHistogram
+from py.taxon_classifier import TaxonClassifier, downsize_sample, STUB_MODEL, BATCH_SIZE
+from py.images_manager import CopyFilesWorker
+from py.jpeg_exif import tag_jpg_with_json, image_digest
+
+# 3rd party imports
+import cv2
+import numpy as np
+from PIL import Image
+import piexif
+from PySide6.QtCore import QCoreApplication
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def iter_source_frames(source: str, max_frames: int = None):
+    """
+    :param source: str, path to a video file or a directory of images (sorted by name)
+    :param max_frames: int, stop after this many frames
+    :return: generator of RGB image arrays, the same layout frame_bridge hands to CVFrameWorker
+    """
+    _path = Path(source)
+    _count = 0
+    if _path.is_dir():
+        for _file in sorted(p for p in _path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS):
+            if max_frames is not None and _count >= max_frames:
+                return
+            _bgr = cv2.imread(str(_file))
+            if _bgr is None:
+                continue
+            _count += 1
+            yield cv2.cvtColor(_bgr, cv2.COLOR_BGR2RGB)
+        return
+
+    _capture = cv2.VideoCapture(str(_path))
+    if not _capture.isOpened():
+        raise FileNotFoundError(f"Unable to open video or image directory: {source}")
+    try:
+        while max_frames is None or _count < max_frames:
+            _ok, _bgr = _capture.read()
+            if not _ok:
+                return
+            _count += 1
+            yield cv2.cvtColor(_bgr, cv2.COLOR_BGR2RGB)
+    finally:
+        _capture.release()
+
+
+def counts_since(counts: dict, start: dict, keys=None) -> dict:
+    """
+    :param counts: dict of running counters (and other stats, passed through as is)
+    :param start: dict, the same counters at an earlier point, e.g. the end of warmup
+    :param keys: iterable of the counter keys, default every int value
+    :return: dict, counts with the counters made relative to start
+    """
+    _keys = set(keys) if keys is not None else {k for k, v in counts.items() if isinstance(v, int)}
+    return {k: v - start.get(k, 0) if k in _keys else v for k, v in counts.items()}
+
+
+def bench_frames(args) -> dict:
+    """
+    replay frames through CVFrameWorker.processArray, with whatever processing is turned on
+    """
+    from py.cam_controls import CVFrameWorker  # after QT_QPA_PLATFORM is set
+
+    _worker = CVFrameWorker()  # no scheduler, so every frame is scanned
+    _worker.enable_barcode_scanner(args.barcode)
+    _worker.enable_gaussian_blur(args.blur)
+    _worker.enable_pencil_sketch(args.sketch)
+    _worker.enable_roi_tracking(not args.no_roi)
+    _worker.enable_sharpness_gate(not args.no_gate)
+    if args.stages:
+        _worker.set_decode_stages(args.stages.split(','), auto_rank=not args.no_rank)
+
+    _barcodes = Counter()
+    _worker.barcodeDetected.connect(lambda barcode: _barcodes.update([barcode]))
+
+    _frames = 0
+    _seconds = 0.0
+    _warm_scan_counts = {}  # worker counters at the end of warmup, subtracted so results only cover timed frames
+    _warm_gate_counts = {}
+    for i, _rgb in enumerate(iter_source_frames(args.source, args.max_frames)):
+        # live frames are luminance views unless blur is on (see CVFrameWorker.processVideoFrame)
+        _array = _rgb if args.blur else np.ascontiguousarray(to_gray(_rgb))
+        if i == args.warmup:
+            _worker.timings.reset()
+            _warm_scan_counts = _worker.barcode_stats
+            _warm_gate_counts = _worker.sharpness_gate_stats
+            _barcodes.clear()
+            _frames, _seconds = 0, 0.0
+        _start = time.perf_counter()
+        _worker.processArray(_array)
+        _seconds += time.perf_counter() - _start
+        _frames += 1
+
+    _scan_counts = counts_since(_worker.barcode_stats, _warm_scan_counts)
+    _gate_stats = counts_since(_worker.sharpness_gate_stats, _warm_gate_counts, ('passed', 'skipped'))
+    _gate_total = _gate_stats['passed'] + _gate_stats['skipped']
+    _gate_stats['pass_rate'] = round(_gate_stats['passed'] / _gate_total, 3) if _gate_total else 1.0
+    _gate_stats['est_saved_ms'] = round(
+        _gate_stats['skipped'] * _worker.timings.snapshot().get('decode', {}).get('p50', 0.0), 1)
+    return {
+        'benchmark': 'frames',
+        'source': str(args.source),
+        'settings': {'barcode': args.barcode, 'blur': args.blur, 'sketch': args.sketch, 'roi': not args.no_roi,
+                     'sharpness_gate': not args.no_gate, 'warmup': args.warmup},
+        'frames': _frames,
+        'seconds': round(_seconds, 3),
+        'fps': round(_frames / _seconds, 2) if _seconds else 0.0,
+        'stages': _worker.timings.snapshot(),
+        'barcode': {
+            **_scan_counts,
+            'hit_rate': round(_scan_counts['frames_decoded'] / _scan_counts['frames_scanned'], 4)
+            if _scan_counts['frames_scanned'] else 0.0,
+            'cascade': _worker.decode_stats,
+            'sharpness_gate': _gate_stats,
+            'emitted': dict(_barcodes)
+        } if args.barcode else None
+    }
+
+
+def _score(hits: int, wrong: int, total: int, times: RollingHistogram) -> dict:
+    return {
+        'recall': round(hits / total, 4) if total else 0.0,
+        'misreads': wrong,
+        'ms': times.percentiles()
+    }
+
+
+def bench_decode(args) -> dict:
+    """
+    score each decode cascade stage on its own (and the full cascade) against a labelled synthetic corpus
+    """
+    _samples = load_corpus(args.corpus)[:args.max_samples]
+    _stages = args.stages.split(',') if args.stages else list(DECODE_STAGES)
+    _cascade = DecodeCascade(_stages, auto_rank=not args.no_rank)
+    _runs = _stages + ['cascade']
+
+    _times = {r: RollingHistogram(window=max(len(_samples), 1)) for r in _runs}
+    _hits = Counter()
+    _wrong = Counter()
+    _by_symbology = {}  # symbology --> Counter of hits per run, plus sample count under 'total'
+
+    for _sample in _samples:
+        _bgr = cv2.imread(_sample['path'])
+        if _bgr is None:
+            continue
+        _gray = cv2.cvtColor(_bgr, cv2.COLOR_BGR2GRAY)
+        _symbology = _by_symbology.setdefault(str(_sample['symbology']), Counter())
+        _symbology['total'] += 1
+
+        for _run in _runs:
+            _start = time.perf_counter()
+            if _run == 'cascade':
+                _barcode, _points, _stage = _cascade.decode(_gray)
+            else:
+                _barcode, _points = _cascade.decode_with_stage(_run, _gray)
+            _times[_run].record((time.perf_counter() - _start) * 1000)
+
+            if _barcode == _sample['barcode']:
+                _hits[_run] += 1
+                _symbology[_run] += 1
+            elif _barcode is not None:
+                _wrong[_run] += 1
+
+    _total = sum(c['total'] for c in _by_symbology.values())
+    return {
+        'benchmark': 'decode',
+        'source': str(args.corpus),
+        'samples': _total,
+        'stages': {r: _score(_hits[r], _wrong[r], _total, _times[r]) for r in _runs},
+        'recall_by_symbology': {
+            sym: {r: round(c[r] / c['total'], 4) for r in _runs} for sym, c in _by_symbology.items()
+        },
+        'cascade_order': _cascade.stages,
+        'cascade_stats': _cascade.stats
+    }
+
+
+def bench_taxon(args) -> dict:
+    """
+    time the taxon classifier: the per-sample cost on the frame thread (downsize) and the per-batch cost on the
+    worker thread (normalize + inference), on real frames or random noise
+    """
+    _classifier = TaxonClassifier(args.model)
+    if args.source:
+        _frames = iter_source_frames(args.source, args.max_frames)
+    else:
+        _rng = np.random.default_rng(0)
+        _frames = (_rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(args.max_frames or 200))
+
+    _sample_ms = RollingHistogram(window=10000)
+    _batch_ms = RollingHistogram(window=10000)
+    _predictions = Counter()
+    _batch = []
+    _n_batches = 0
+    for _rgb in _frames:
+        _start = time.perf_counter()
+        _batch.append(downsize_sample(_rgb, _classifier.input_size))
+        _sample_ms.record((time.perf_counter() - _start) * 1000)
+        if len(_batch) < args.batch:
+            continue
+
+        _start = time.perf_counter()
+        _taxon, _confidence = _classifier.predict(_batch)
+        _n_batches += 1
+        if _n_batches > args.warmup:  # first calls include session/graph setup
+            _batch_ms.record((time.perf_counter() - _start) * 1000)
+        _predictions[_taxon] += 1
+        _batch = []
+
+    _p50_batch = _batch_ms.percentiles().get('p50', 0.0)
+    return {
+        'benchmark': 'taxon',
+        'model': args.model,
+        'source': str(args.source) if args.source else 'random',
+        'batch_size': args.batch,
+        'batches': _n_batches,
+        'sample_ms': _sample_ms.percentiles(),  # frame thread cost per sample
+        'batch_ms': _batch_ms.percentiles(),  # worker thread cost per batch
+        'ms_per_sample': round(_p50_batch / args.batch, 3),
+        'predictions': dict(_predictions)
+    }
+
+
+def bench_copy(args) -> dict:
+    """
+    time CopyFilesWorker (exif tag + write + read back to verify) over a folder of jpgs at each pool size, then an
+    unchanged re-sync (manifest check only); point --dest at a mapped wheelhouse drive to measure the real thing, a
+    local temp dir stands in otherwise.  Per file write and verify ms are reported separately, since every byte
+    written is read back over the share before the copy is renamed into place (see resumable_transfer.py)
+    """
+    _files = sorted(p for p in Path(args.source).iterdir() if p.suffix.lower() in ('.jpg', '.jpeg'))[:args.max_files]
+    _items = [{'full_path': str(p), 'file_name': p.name, 'haul_number': 'bench'} for p in _files]
+    _mb = sum(p.stat().st_size for p in _files) / 1024 / 1024
+
+    _runs = []
+    for _workers in (int(w) for w in args.workers.split(',')):
+        _dest = tempfile.mkdtemp(prefix='fram_cam_copy_', dir=args.dest)
+        _timings = PipelineStats(window=10000)
+        _worker = CopyFilesWorker(max_workers=_workers, timings=_timings)
+        _ended = []
+        _worker.copyEnded.connect(lambda ok, failed: _ended.append((ok, failed)))  # no thread, emitted inline
+        _worker.destination_folder = _dest
+        _worker.files_to_copy = _items
+
+        _start = time.perf_counter()
+        _worker.run()
+        _elapsed = time.perf_counter() - _start
+        _stages = _timings.snapshot()
+        _readback_mb = sum(p.stat().st_size for p in Path(_dest, 'images').iterdir()) / 1024 / 1024
+        _start = time.perf_counter()
+        _worker.run()  # nothing changed, everything should be skipped
+        _resync_elapsed = time.perf_counter() - _start
+        _ok, _failed = _ended[0]
+        _runs.append({
+            'workers': _workers,
+            'seconds': round(_elapsed, 3),
+            'files_per_s': round(_ok / _elapsed, 1) if _elapsed else 0.0,
+            'mb_per_s': round(_mb / _elapsed, 1) if _elapsed else 0.0,
+            'write_ms': {k: v for k, v in _stages.get('write', {}).items() if k != 'count'},
+            'verify_ms': {k: v for k, v in _stages.get('verify', {}).items() if k != 'count'},
+            'readback_mb': round(_readback_mb, 1),
+            'resync_seconds': round(_resync_elapsed, 3),
+            'copied': _ok,
+            'failed': _failed
+        })
+        shutil.rmtree(_dest, ignore_errors=True)
+
+    return {
+        'benchmark': 'copy',
+        'source': str(args.source),
+        'dest': args.dest or tempfile.gettempdir(),
+        'files': len(_files),
+        'mb': round(_mb, 1),
+        'runs': _runs
+    }
+
+
+def bench_exif(args) -> dict:
+    """
+    time tagging a folder of jpgs with exif json: lossless segment rewrite (jpeg_exif.py) vs the PIL open/save
+    the wheelhouse copy used to do, and check the lossless copies' image data is byte identical to the source
+    """
+    _files = sorted(p for p in Path(args.source).iterdir() if p.suffix.lower() in ('.jpg', '.jpeg'))[:args.max_files]
+    _data = {'haul_number': 'bench', 'catch_display_name': 'Sablefish', 'project_name': 'Benchmark'}
+    _pil_ms = RollingHistogram(window=10000)
+    _lossless_ms = RollingHistogram(window=10000)
+    _identical = 0
+    with tempfile.TemporaryDirectory() as _dir:
+        for _file in _files:
+            _dest = os.path.join(_dir, _file.name)
+
+            _start = time.perf_counter()
+            with Image.open(_file) as _img:
+                _exif_dict = piexif.load(_img.info['exif']) if 'exif' in _img.info else {}
+                _exif_dict['Exif'] = {piexif.ExifIFD.UserComment: json.dumps(_data).encode('utf-8')}
+                _img.save(_dest, 'jpeg', exif=piexif.dump(_exif_dict))
+            _pil_ms.record((time.perf_counter() - _start) * 1000)
+
+            _start = time.perf_counter()
+            tag_jpg_with_json(str(_file), _data, _dest, verify=args.verify)
+            _lossless_ms.record((time.perf_counter() - _start) * 1000)
+            _identical += image_digest(_dest) == image_digest(str(_file))
+
+    _pil_p50 = _pil_ms.percentiles().get('p50', 0.0)
+    _lossless_p50 = _lossless_ms.percentiles().get('p50', 0.0)
+    return {
+        'benchmark': 'exif',
+        'source': str(args.source),
+        'files': len(_files),
+        'verify': args.verify,
+        'pil_resave_ms': _pil_ms.percentiles(),
+        'lossless_ms': _lossless_ms.percentiles(),
+        'speedup': round(_pil_p50 / _lossless_p50, 1) if _lossless_p50 else None,
+        'identical_image_data': _identical  # should equal files
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    _parser = argparse.ArgumentParser(prog='python -m py.benchmark', description=__doc__.split('\n')[1])
+    _parser.add_argument('--out', help='also write JSON results to this file')
+    _subparsers = _parser.add_subparsers(dest='command', required=True)
+
+    _frames = _subparsers.add_parser('frames', help='replay a video/image folder through CVFrameWorker.processArray')
+    _frames.add_argument('source', help='video file, or directory of jpg/png frames')
+    _frames.add_argument('--barcode', action='store_true', help='scan for barcodes')
+    _frames.add_argument('--blur', action='store_true', help='apply gaussian blur')
+    _frames.add_argument('--sketch', action='store_true', help='apply pencil sketch')
+    _frames.add_argument('--no-roi', action='store_true', help='disable barcode ROI tracking')
+    _frames.add_argument('--no-gate', action='store_true', help='decode every frame, even blurry ones')
+    _frames.add_argument('--stages', help='comma separated decode cascade stages, e.g. grayscale,otsu')
+    _frames.add_argument('--no-rank', action='store_true', help='keep decode stages in the given order')
+    _frames.add_argument('--max-frames', type=int, help='stop after this many frames')
+    _frames.add_argument('--warmup', type=int, default=5, help='frames excluded from timings')
+    _frames.set_defaults(func=bench_frames)
+
+    _decode = _subparsers.add_parser('decode', help='score decode stages against a barcode_corpus.py corpus')
+    _decode.add_argument('corpus', help='directory with labels.json, see py/barcode_corpus.py')
+    _decode.add_argument('--stages', help='comma separated decode cascade stages to score')
+    _decode.add_argument('--no-rank', action='store_true', help='keep cascade stages in the given order')
+    _decode.add_argument('--max-samples', type=int, help='only score the first N samples')
+    _decode.set_defaults(func=bench_decode)
+
+    _taxon = _subparsers.add_parser('taxon', help='time taxon classification, on a stub model by default')
+    _taxon.add_argument('--source', help='video file or directory of frames, random noise if not given')
+    _taxon.add_argument('--model', default=STUB_MODEL, help=f'.onnx model path, or "{STUB_MODEL}" (default)')
+    _taxon.add_argument('--batch', type=int, default=BATCH_SIZE, help='samples per inference call')
+    _taxon.add_argument('--max-frames', type=int, help='stop after this many frames (default 200 if random)')
+    _taxon.add_argument('--warmup', type=int, default=2, help='batches excluded from timings')
+    _taxon.set_defaults(func=bench_taxon)
+
+    _copy = _subparsers.add_parser('copy', help='time the wheelhouse copy (exif tag + write + verify read back) at several pool sizes')
+    _copy.add_argument('source', help='directory of jpgs, e.g. data/images')
+    _copy.add_argument('--dest', help='copy under this directory, e.g. the mapped wheelhouse drive (default temp)')
+    _copy.add_argument('--workers', default='1,2,4,8', help='comma separated pool sizes to time')
+    _copy.add_argument('--max-files', type=int, help='only copy the first N files')
+    _copy.set_defaults(func=bench_copy)
+
+    _exif = _subparsers.add_parser('exif', help='time lossless exif tagging against a PIL decode/re-save')
+    _exif.add_argument('source', help='directory of jpgs, e.g. data/images')
+    _exif.add_argument('--verify', action='store_true', help='include reading each copy back to check it')
+    _exif.add_argument('--max-files', type=int, help='only tag the first N files')
+    _exif.set_defaults(func=bench_exif)
+
+    return _parser
+
+
+def main(argv=None) -> dict:
+    _args = build_parser().parse_args(argv)
+    _app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])  # QObjects/signals want an app instance
+    _results = _args.func(_args)
+
+    _json = json.dumps(_results, indent=2, default=str)
+    print(_json)
+    if _args.out:
+        Path(_args.out).write_text(_json)
+    return _results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+buffer_pool.py: reusable output arrays for the per-frame OpenCV pipeline.
+
+Every cv2 call in the frame pipeline used to return a freshly allocated array, so at 30 fps we churned through
+a few hundred MB/s of short lived buffers.  Pipeline steps now ask the pool for a named buffer and pass it to
+cv2 as dst=, so in steady state frames are processed without allocating anything.
+"""
+# standard imports
+import threading
+
+# local imports
+from py.logger import Logger
+
+# 3rd party imports
+import numpy as np
+
+
+class FrameBufferPool:
+    """
+    Named, grow-only output buffers.  get('blur', shape) returns a view of the 'blur' buffer with exactly that
+    shape; the buffer is only reallocated when a bigger shape (or a different dtype/channel count) is requested,
+    so variable sized crops (e.g. a barcode ROI) re-use the full frame buffer.  Call clear() when the camera
+    format changes so the old sizes are released.
+
+    Views returned for a name are overwritten the next time that name is requested, so anything that has to
+    outlive the current frame (signals to other threads, async decodes) must copy.
+    """
+    def __init__(self):
+        self._logger = Logger.get_root()
+        self._buffers = {}  # name --> ndarray
+        self._lock = threading.Lock()  # clear() is called from the main thread, get() from the frame worker
+        self._allocations = 0
+        self._requests = 0
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: dict of request/allocation counts and bytes currently held
+        """
+        return {
+            'requests': self._requests,
+            'allocations': self._allocations,
+            'bytes': sum(b.nbytes for b in self._buffers.values())
+        }
+
+    def get(self, name: str, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        """
+        :param name: str, one name per pipeline step output
+        :param shape: tuple, shape of the array needed
+        :param dtype: numpy dtype
+        :return: array of the requested shape, contents undefined
+        """
+        shape = tuple(shape)  # no-op for the usual tuple; rebuilding it (e.g. to cast to int) allocates every call
+        with self._lock:
+            self._requests += 1
+            _buf = self._buffers.get(name)
+            if _buf is None or _buf.dtype != np.dtype(dtype) or _buf.shape[2:] != shape[2:] \
+                    or _buf.shape[0] < shape[0] or _buf.shape[1] < shape[1]:
+                _alloc_shape = shape if _buf is None or _buf.shape[2:] != shape[2:] else \
+                    (max(shape[0], _buf.shape[0]), max(shape[1], _buf.shape[1])) + shape[2:]
+                self._logger.debug(f"Allocating frame buffer {name}: {_alloc_shape} {np.dtype(dtype)}")
+                _buf = np.empty(_alloc_shape, dtype=dtype)
+                self._buffers[name] = _buf
+                self._allocations += 1
+
+        if _buf.shape == shape:
+            return _buf
+        return _buf[:shape[0], :shape[1]]
+
+    def like(self, name: str, array: np.ndarray) -> np.ndarray:
+        """
+        :param name: str, buffer name
+        :param array: array to match shape and dtype of
+        :return: buffer view with the same shape/dtype as array
+        """
+        return self.get(name, array.shape, array.dtype)
+
+    def clear(self):
+        """
+        drop all buffers, use when the frame size changes for good (e.g. camera/resolution switch)
+        """
+        with self._lock:
+            self._buffers = {}
+
+
+if __name__ == '__main__':
+    # steady state allocation check: run the frame pipeline, barcode decoding included, over synthetic frames and
+    # make sure that once warmed up tracemalloc sees (close to) nothing allocated per frame, and nothing kept
+    import tracemalloc
+    from py.barcode_corpus import compose_sample
+    from py.cam_controls import CVFrameWorker
+
+    _worker = CVFrameWorker()
+    _worker.enable_barcode_scanner(True)
+    _worker.enable_sharpness_gate(False)  # decode every frame, the worst case
+    _worker.enable_gaussian_blur(True)
+    _worker.enable_pencil_sketch(True)
+    _rng = np.random.default_rng(0)
+    _clean = {'scale': 1.0, 'rotation_deg': 0.0, 'perspective': 0.0, 'blur_sigma': 0, 'motion_blur_px': 0,
+              'glare': 0, 'noise_sigma': 0, 'jpeg_quality': 95}
+    _frames = [compose_sample(_rng, f'20220089000670{i:02d}', 128, _clean, (1280, 720))[0] for i in range(2)] + \
+        [_rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8) for _ in range(2)]  # tags, and nothing to find
+
+    def _run_frame(frame):
+        _worker.processArray(frame)
+        _gray = _worker._to_gray(_worker.resize_image(frame))
+        _worker._decode_cascade.binarize_otsu(_gray)
+        _worker._decode_cascade.binarize_adaptive_gaussian(_gray)
+
+    for i in range(200):  # warm up, buffers get allocated here
+        _run_frame(_frames[i % len(_frames)])
+
+    _n_frames = 300
+    _allocations = _worker.buffer_stats['allocations']
+    tracemalloc.start()
+    for i in range(200):  # and again under tracemalloc, so interpreter free lists refilled while tracing settle
+        _run_frame(_frames[i % len(_frames)])
+    _start_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for i in range(_n_frames):
+        _run_frame(_frames[i % len(_frames)])
+    _end_current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    _decode_bytes = _worker._to_gray(_worker.resize_image(_frames[0])).nbytes  # what the decode cascade works on
+    _growth = _end_current - _start_current
+    print(f"Buffer pool: {_worker.buffer_stats}")
+    print(f"Barcode scans: {_worker.barcode_stats}")
+    print(f"Net growth over {_n_frames} frames: {_growth} bytes ({_growth / _n_frames:.1f} bytes/frame)")
+    print(f"Peak transient allocation: {_peak - _start_current} bytes ({(_peak - _start_current) / _decode_bytes:.3f} decode images)")
+    assert _worker.barcode_stats['frames_decoded'] > 0, "barcode path didn't decode anything, check isn't covering it"
+    assert _worker.buffer_stats['allocations'] == _allocations, "buffer pool reallocated after warm up"
+    # zbar's results (symbol points, hull) are a few KB of python objects per hit, copying an image is a whole one
+    assert _peak - _start_current < 0.25 * _decode_bytes, "frame pipeline is copying images per frame"
+    assert _growth < 16 * _n_frames, "frame pipeline memory keeps growing once warmed up"
@@ -0,0 +1,149 @@
+"""
+burst_capture.py: keep only the sharpest image out of a quick burst of captures.
+
+On a rolling deck a single capture is often smeared.  CamControls grabs a few stills into memory, and a
+BurstWorker scores them on a background thread and writes only the best one to disk; the rest are dropped
+without ever being saved.  The winner has to be encoded from its QImage, so what the camera reported with it
+(QImageCapture.imageMetadataAvailable, see capture_metadata) is written into its exif as it's saved.
+"""
+# standard imports
+from datetime import datetime
+import io
+
+# local imports
+from py.logger import Logger
+from py.frame_bridge import qimage_to_rgb
+from py.jpeg_exif import tagged_header
+
+# 3rd party imports
+import cv2
+import numpy as np
+import piexif
+from PySide6.QtCore import QDateTime, QObject, Signal
+from PySide6.QtMultimedia import QMediaMetaData
+
+SCORE_WIDTH = 640  # px width images are downsampled to before scoring, plenty to rank blur
+JPEG_QUALITY = 95
+EXIF_DATE_FORMAT = '%Y:%m:%d %H:%M:%S'
+METADATA_KEYS = {  # capture_metadata name --> QMediaMetaData key, each only kept if the camera backend set it
+    'date': QMediaMetaData.Key.Date,
+    'description': QMediaMetaData.Key.Description,
+    'author': QMediaMetaData.Key.Author,
+    'copyright': QMediaMetaData.Key.Copyright
+}
+EXIF_TAGS = {  # capture_metadata name --> (exif ifd, tag)
+    'camera': ('0th', piexif.ImageIFD.Model),
+    'description': ('0th', piexif.ImageIFD.ImageDescription),
+    'author': ('0th', piexif.ImageIFD.Artist),
+    'copyright': ('0th', piexif.ImageIFD.Copyright),
+    'date': ('Exif', piexif.ExifIFD.DateTimeOriginal)
+}
+
+
+def sharpness_score(array: np.ndarray, width: int = SCORE_WIDTH) -> float:
+    """
+    variance of the laplacian, higher is sharper; only meaningful relative to other shots of the same scene
+    :param array: RGB or single channel image array
+    :param width: int, downsample to this width first
+    :return: float
+    """
+    _gray = array if array.ndim == 2 else cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
+    _height, _width = _gray.shape
+    if _width > width:
+        _gray = cv2.resize(_gray, (width, max(1, round(_height * width / _width))), interpolation=cv2.INTER_AREA)
+    _mean, _std = cv2.meanStdDev(cv2.Laplacian(_gray, cv2.CV_16S))
+    return float(_std[0, 0]) ** 2
+
+
+def capture_metadata(metadata: QMediaMetaData) -> dict:
+    """
+    call on the camera's thread, QImageCapture.imageMetadataAvailable only lends metadata for the call
+    :param metadata: QMediaMetaData
+    :return: dict of plain str values, see METADATA_KEYS
+    """
+    _values = {}
+    for _name, _key in METADATA_KEYS.items():
+        _value = metadata.value(_key)
+        if isinstance(_value, QDateTime):
+            _value = _value.toString('yyyy:MM:dd HH:mm:ss') if _value.isValid() else None
+        elif isinstance(_value, datetime):
+            _value = _value.strftime(EXIF_DATE_FORMAT)
+        if _value:
+            _values[_name] = str(_value)
+    return _values
+
+
+def metadata_exif(metadata: dict) -> bytes:
+    """
+    :param metadata: dict, from capture_metadata, plus 'camera' for the device name
+    :return: bytes, exif for save_jpg, None if there's nothing to write
+    """
+    _exif_dict = {'0th': {}, 'Exif': {}, 'GPS': {}, 'Interop': {}, '1st': {}}
+    for _name, (_ifd, _tag) in EXIF_TAGS.items():
+        if metadata.get(_name):
+            _exif_dict[_ifd][_tag] = metadata[_name].encode('ascii', 'replace')  # exif ascii tags
+    if metadata.get('date'):
+        _exif_dict['0th'][piexif.ImageIFD.DateTime] = _exif_dict['Exif'][piexif.ExifIFD.DateTimeOriginal]
+    return piexif.dump(_exif_dict) if any(_exif_dict.values()) else None
+
+
+def save_jpg(array: np.ndarray, path: str, quality: int = JPEG_QUALITY, exif_bytes: bytes = None):
+    """
+    :param array: RGB or single channel image array
+    :param path: str, full path to write
+    :param quality: int, jpeg quality 0-100
+    :param exif_bytes: bytes, e.g. from metadata_exif, put in the jpg as it's written (one write, no re-tag)
+    """
+    _bgr = array if array.ndim == 2 else cv2.cvtColor(array, cv2.COLOR_RGB2BGR)
+    _ok, _jpg = cv2.imencode('.jpg', _bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not _ok:
+        raise IOError(f"Unable to encode image for {path}")
+    _header, _sos_offset = b'', 0
+    if exif_bytes:
+        _header, _sos_offset, _ = tagged_header(io.BytesIO(_jpg), exif_bytes)
+    with open(path, 'wb') as f:
+        f.write(_header)
+        f.write(_jpg[_sos_offset:])
+
+
+class BurstWorker(QObject):
+    """
+    worker class to score a burst of images and save the sharpest, run on its own QThread:
+    set images/save_path in the constructor, connect QThread.started to run
+    """
+    burstSaved = Signal(str, int, arguments=['path', 'best_index'])  # best image written to path
+    burstFailed = Signal(str, str, arguments=['path', 'error'])
+    finished = Signal()
+
+    def __init__(self, images: list, save_path: str, quality: int = JPEG_QUALITY, metadata: list = None):
+        """
+        :param images: list of QImage or RGB arrays, in capture order
+        :param save_path: str, full path the best image is written to
+        :param quality: int, jpeg quality
+        :param metadata: list of dict (or None), per image, see metadata_exif
+        """
+        super().__init__()
+        self._logger = Logger.get_root()
+        self._images = images
+        self._metadata = metadata or [None] * len(images)
+        self._save_path = save_path
+        self._quality = quality
+
+    def run(self):
+        try:
+            _arrays = [i if isinstance(i, np.ndarray) else qimage_to_rgb(i) for i in self._images]
+            _scores = [sharpness_score(a) for a in _arrays]
+            _best = int(np.argmax(_scores))
+            _metadata = self._metadata[_best]
+            save_jpg(_arrays[_best], self._save_path, self._quality, metadata_exif(_metadata) if _metadata else None)
+            self._logger.info(f"Burst of {len(_arrays)} saved frame {_best} to {self._save_path}, "
+                              f"sharpness scores = {[round(s, 1) for s in _scores]}")
+            self.burstSaved.emit(self._save_path, _best)
+
+        except Exception as e:
+            self._logger.error(f"Unable to save best image of burst to {self._save_path}: {e}")
+            self.burstFailed.emit(self._save_path, str(e))
+
+        finally:
+            self._images, self._metadata = [], []  # let go of the rest of the burst as soon as we're done
+            self.finished.emit()
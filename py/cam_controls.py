@@ -3,17 +3,27 @@
 
 """
 # standard imports
-import os
+from datetime import datetime
 from pathlib import Path
-import re
+import time
 
 # local imports
 from py.logger import Logger
 from py.utils import Utils
-from py.config import IMAGES_DIR
+from py.config import IMAGES_DIR, TAXON_MODEL_PATH
+from py.frame_scheduler import FrameScheduler
+from py.barcode_scanner import BarcodeRoiTracker, DecodeCascade, DetectionVoter, SharpnessGate, DECODE_STAGES, to_gray
+from py.decoder_pool import DecoderPool
+from py.buffer_pool import FrameBufferPool
+from py.frame_bridge import MappedFrame, luma_view, frame_to_rgb, array_to_qvideoframe
+from py.pipeline_stats import PipelineStats, format_stats
+from py.burst_capture import BurstWorker, capture_metadata, EXIF_DATE_FORMAT
+from py.frame_ring_buffer import FrameRingBuffer, DEFAULT_BUFFER_MB
+from py.image_names import ImageNameAllocator
+from py.taxon_classifier import TaxonWorker, downsize_sample, is_classifier_available, SAMPLE_INTERVAL_S
+from py.processing_tiers import ProcessingTierTuner, PROCESSING_TIERS, AUTO_TIER, DEFAULT_TIER, time_ms
 
 # 3rd party imports
-from araviq6 import VideoFrameWorker, VideoFrameProcessor, array2qvideoframe
 import cv2
 from PySide6.QtQml import QJSValue
 from PySide6.QtCore import (
@@ -21,7 +31,9 @@ from PySide6.QtCore import (
     Slot,
     Property,
     Signal,
-    QJsonValue
+    QJsonValue,
+    QThread,
+    QTimer
 )
 from PySide6.QtMultimedia import (
     QCamera,
@@ -32,56 +44,67 @@ from PySide6.QtMultimedia import (
     QVideoFrame
 )
 import numpy as np
-import pyzbar.pyzbar
-# import tensorflow as tf
 
 
-class CVFrameWorker(VideoFrameWorker):
+class CVFrameWorker(QObject):
     """
-    VideoFrameWorker class to apply opencv effects/processing to frames received from
-    camera.
-
-    This class is used with VideoFrameProcessor, and works as follows:
-
-    1.) create this frame worker and a VideoFrameProcessor
-    2.) add the worker to the processor: VideoFrameProcessor.setWorker(your_worker)
-    3.) connect QCaptureSession videoSink.videoFrameChanged to processor.processVideoFrame to send frames from cam
-    4.) process image array via this class's processArray method
-    5.) receive processed array via the processors videoFrameProcessed signal
+    Worker class to apply opencv effects/processing to frames received from
+    camera.  Runs on its own QThread, and works as follows:
+
+    1.) create this frame worker and move it to a QThread
+    2.) connect FrameScheduler.frameDispatched to this class's processVideoFrame to send frames from cam
+    3.) connect frameProcessed back to FrameScheduler.frame_done so it can send the next frame
+    4.) processVideoFrame maps the frame and runs processArray on a numpy view of its pixels (see frame_bridge.py);
+        barcode scanning only needs the luminance plane, so most frames are never copied or color converted
+    5.) frames changed by an effect are converted back and emitted via sendFrameToDisplay
     6.) call videoSink.setVideoFrame(your_processed_frame) with sink associated with QML video output to display in UI
 
-    camera -> session source sink -> frame -> processArray -> target sink -> video output
+    camera -> session source sink -> scheduler -> frame -> processArray -> target sink -> video output
 
     https://gist.github.com/eyllanesc/6486dc26eebb1f1b71469959d086a649#gistcomment-3920960
-    https://araviq6.readthedocs.io/en/stable/examples/frame.camera.html
-
-    TODO: extract code from araviq6 package to eliminate dependency??
     """
-    barcodeDetected = Signal("QVariant", "QVariant", arguments=['barcode', "barcode_coords"])  # a barcode was detected, notify others
-    taxonDetected = Signal(str, arguments=['taxon_name'])  # a taxon class was detected
-    feedFrozen = Signal()  # frame feed was stopped (setting pencil sketch effect)
-    feedUnfrozen = Signal()  # frame feed resumed (unset pencil sketch effect)
+    barcodeDetected = Signal(str, arguments=['barcode'])  # a barcode won the vote, notify others
+    barcodeOutlined = Signal("QVariant", arguments=['outline'])  # where a barcode was read, see _barcode_outline
+    taxonDetected = Signal(str, float, arguments=['taxon_name', 'confidence'])  # a taxon class was detected
+    taxonSampled = Signal("QVariant")  # downsized frame queued to the taxon worker thread
+    frameFrozen = Signal(QVideoFrame, arguments=['frame'])  # pencil sketch of the freeze frame, built once
     processingChanged = Signal()  # check if we actually need to pipe frame to CV worker
     isProcessingNecessary = Signal(bool, arguments=['status'])  # just go direct to UI? false means no processing
-    sendFrameToDisplay = Signal("QVariant", arguments=['frame'])
+    sendFrameToDisplay = Signal(QVideoFrame, arguments=['frame'])
+    frameProcessed = Signal()  # done with the last dispatched frame, ready for another
+    processingTierChanged = Signal(str, arguments=['tier'])  # resolution frames are processed at changed
 
-    BARCODE_THROTTLE_COUNT = 10000  # use me to slow down emit sequence when we get a burst of detections
+    ROI_TRACK_FOR_N = 15  # after a hit, only scan around the last barcode for this many scans
 
-    def __init__(self):
-        VideoFrameWorker.__init__(self)
+    def __init__(self, scheduler: FrameScheduler = None, parent=None):
+        super().__init__(parent)
         self._logger = Logger.get_root()
-        self._barcode_polys = None  # array of coordinates defining bounding polygons for barcode detected
-        self._last_barcode_scanned = None  # hold latest barcode scan here
+        self._scheduler = scheduler  # if set, decides how often we can afford to scan; else scan every frame
+        self._barcode_voter = DetectionVoter()  # only emit barcodes read consistently, and only once
         self._barcode_frames_scanned = 0  # use to count/limit frames scanned to boost performance, if needed
+        self._barcode_frames_decoded = 0  # scans that found a barcode, for hit rate
         self._taxon_frames_scanned = 0  # use to count/limit frames scanned to boost performance, if needed
         self._do_scan_barcode = False  # if true, scan image for barcode
+        self._do_track_roi = True  # if true, scan near the last barcode found before scanning the full frame
+        self._roi_tracker = BarcodeRoiTracker(track_for_n=self.ROI_TRACK_FOR_N)
+        self._buffers = FrameBufferPool()  # re-used output arrays for each step, so frames don't allocate
+        self._timings = PipelineStats()  # rolling ms percentiles for each step
+        self._decode_cascade = DecodeCascade(DECODE_STAGES, buffers=self._buffers, timings=self._timings)
+        self._do_sharpness_gate = True  # if true, skip decoding frames that are too blurry/moving to read
+        self._sharpness_gate = SharpnessGate(buffers=self._buffers)
+        self._processing_tier = DEFAULT_TIER  # PROCESSING_TIERS key resize_image downsizes to
+        self._is_auto_tier = False  # if true, tier is calibrated at startup and tuned to keep up with camera
+        self._tier_tuner = ProcessingTierTuner()
+        self._calibration_pending = False  # calibrate auto tier on the next frame we get
+        self._decoder_pool = None  # if set, decodes run async in other processes instead of on this thread
         self._do_scan_taxon = False  # if true, scan image for taxon
+        self._taxon_worker = None  # classifies sampled frames on its own thread, see taxon_classifier.py
+        self._taxon_thread = None
+        self._next_taxon_sample_ts = 0.0  # perf_counter time the next taxon sample is due
         self._do_gaussian_blur = False  # if true, apply gaussian blur
         self._do_pencil_sketch = False  # if true, apply pencil sketch effect
-        self._freeze_requested = False  # if true, apply pencil sketch and emit
         self._do_process = None  # if false, send frames direct to UI
         self.processingChanged.connect(self.check_processor_status)  # whenever a config changes, this emits
-        self.cv_barcode_detector = cv2.barcode.BarcodeDetector()
 
     @property
     def do_process(self) -> bool:
@@ -96,29 +119,32 @@ class CVFrameWorker(VideoFrameWorker):
 
     def check_processor_status(self):
         self.do_process = self._do_scan_barcode or self._do_scan_taxon or self._do_pencil_sketch or self._do_gaussian_blur
+        if self._scheduler is not None:
+            # effects are redrawn on every frame, scans alone only need the frames the scheduler says are due
+            # taxon samples are time based (SAMPLE_INTERVAL_S), so they don't need every frame either
+            self._scheduler.process_every_frame = self._do_pencil_sketch or self._do_gaussian_blur
 
-    def request_freeze_frame(self):
+    @Slot(QVideoFrame)
+    def freeze_frame(self, frame: QVideoFrame):
         """
-        allows us to do the following, synchronously:
-        1. process one last frame using the pencil sketch effect
-        2. tell processArray method that, once finished, emit signal to freeze processing
-        3. this signal can then be picked up / connected to elsewhere to stop the camera
+        build the pencil sketch of the freeze frame once and emit it via frameFrozen.  Effect/scan settings are
+        left alone, so freezing doesn't toggle the processor connection and unfreezing has nothing to rebuild.
+        :param frame: QVideoFrame, last frame from camera before freezing
         """
-        self._logger.info(f"Frame processing freeze requested")
-        self.enable_pencil_sketch(True)
-        self._freeze_requested = True
+        self._logger.info(f"Building freeze frame")
+        try:
+            with MappedFrame(frame) as _mapped:
+                if not _mapped.is_mapped:
+                    return
+                _array = luma_view(frame)
+                if _array is None:
+                    _array = frame_to_rgb(frame)
+                with self._timings.time('sketch'):
+                    _sketch = self._pencil_sketch(_array)
+                self.frameFrozen.emit(array_to_qvideoframe(_sketch))  # a copy, the sketch buffers get re-used
 
-    def request_unfreeze(self):
-        """
-        idea here is to undo pencil sketch and re-enable frame-by-frame processing.
-        The unfrozen signal should be picked up and connected to restarting the camera to
-        begin re-piping data back through the frame processor, while also removing pencil sketch effect
-        :return:
-        """
-        self._logger.debug(f"Frame processing unfreeze requested")
-        self.enable_pencil_sketch(False)
-        self._freeze_requested = False
-        self.feedUnfrozen.emit()
+        except Exception as e:
+            self._logger.error(f"Unable to build freeze frame: {e}")
 
     def enable_barcode_scanner(self, status: bool):
         """
@@ -129,11 +155,171 @@ class CVFrameWorker(VideoFrameWorker):
         self._do_scan_barcode = status
         self.processingChanged.emit()
 
-    def enable_taxon_scanner(self, status: bool):
+    def enable_roi_tracking(self, status: bool):
+        """
+        toggle whether scans following a hit only look at the area around the last barcode
+        :param status: bool, set region of interest tracking on or off?
+        """
+        self._logger.debug(f"Barcode ROI tracking status set to: {status}")
+        self._do_track_roi = status
+        self._roi_tracker.reset()
+
+    def set_decode_stages(self, stage_names: list, auto_rank: bool = True):
+        """
+        configure which decode strategies are tried on each scan, and in which order
+        :param stage_names: list of stage names from barcode_scanner.DECODE_STAGES, cheapest first
+        :param auto_rank: bool, let the cascade re-order stages by measured cost per hit
+        """
+        self._logger.debug(f"Barcode decode stages set to: {stage_names}, auto_rank={auto_rank}")
+        self._decode_cascade.stages = stage_names
+        self._decode_cascade.auto_rank = auto_rank
+
+    def enable_decoder_pool(self, processes: int):
+        """
+        move barcode decoding off this thread and into a pool of processes
+        :param processes: int, number of decoder processes, 0 to decode on this thread
+        """
+        self._logger.debug(f"Barcode decoder processes set to: {processes}")
+        if self._decoder_pool is not None:
+            _pool, self._decoder_pool = self._decoder_pool, None
+            _pool.close()
+
+        if processes > 0:
+            _pool = DecoderPool(processes, stages=self._decode_cascade.stages)
+            _pool.decoded.connect(self._on_pool_decoded)
+            _pool.start()
+            self._decoder_pool = _pool
+
+    @property
+    def processing_tier(self) -> str:
+        return self._processing_tier
+
+    def set_processing_tier(self, tier: str):
+        """
+        :param tier: str, PROCESSING_TIERS key, or AUTO_TIER to calibrate on the next frame and tune from there
+        """
+        self._logger.debug(f"Processing tier set to: {tier}")
+        if tier == AUTO_TIER:
+            self._is_auto_tier = True
+            self._calibration_pending = True
+            return
+
+        if tier not in PROCESSING_TIERS:
+            raise ValueError(f"Unknown processing tier: {tier}")
+        self._is_auto_tier = False
+        self._calibration_pending = False
+        self._set_active_tier(tier)
+
+    def _set_active_tier(self, tier: str):
+        if tier != self._processing_tier:
+            self._processing_tier = tier
+            self.processingTierChanged.emit(tier)
+
+    def _calibrate_processing_tier(self, array: np.ndarray):
+        """
+        time resize + decode of this frame at each tier.  Usually there's no barcode in view at startup,
+        which is the worst case: every cascade stage runs.  Uses a throwaway cascade so calibration
+        doesn't skew the real one's stage ranking.
+        :param array: camera frame, at full size
+        """
+        self._calibration_pending = False
+        _cascade = DecodeCascade(self._decode_cascade.stages, auto_rank=False)
+
+        def _scan(tier: str):
+            _cascade.decode(to_gray(self.resize_image(array, tier=tier, pooled=False)))
+
+        self._set_active_tier(self._tier_tuner.calibrate(lambda tier: time_ms(lambda: _scan(tier))))
+
+    def _tune_processing_tier(self, frame_seconds: float, source_shape: tuple):
+        if self._scheduler is None:
+            return
+        _fps = self._scheduler.camera_fps
+        _tier = self._tier_tuner.record(frame_seconds, self._scheduler.counters, 1 / _fps if _fps else None, source_shape)
+        if _tier is not None:
+            self._set_active_tier(_tier)
+
+    @property
+    def timings(self) -> PipelineStats:
+        return self._timings
+
+    @property
+    def barcode_stats(self) -> dict:
+        return {'frames_scanned': self._barcode_frames_scanned, 'frames_decoded': self._barcode_frames_decoded,
+                **self._barcode_voter.stats}
+
+    @property
+    def buffer_stats(self) -> dict:
+        return self._buffers.stats
+
+    def release_buffers(self):
+        """
+        drop pooled frame buffers, call when the camera format changes so buffers are re-sized for the new frames
+        """
+        self._buffers.clear()
+
+    def enable_sharpness_gate(self, status: bool):
+        """
+        toggle whether blurry/fast moving frames skip barcode decoding
+        :param status: bool, set sharpness gate on or off?
+        """
+        self._logger.debug(f"Sharpness gate status set to: {status}")
+        self._do_sharpness_gate = status
+        self._sharpness_gate.reset()
+
+    @property
+    def sharpness_gate_stats(self) -> dict:
+        """
+        frames passed/skipped by the sharpness gate, latest scores, and a rough estimate of decode time it saved
+        """
+        _stats = self._sharpness_gate.stats
+        _decode_p50 = self._timings.snapshot().get('decode', {}).get('p50', 0.0)
+        _stats['est_saved_ms'] = round(_stats['skipped'] * _decode_p50, 1)
+        _stats['enabled'] = self._do_sharpness_gate
+        return _stats
+
+    @property
+    def decode_stats(self) -> dict:
+        """
+        hit rate and avg cost of each decode strategy, in the order they're currently tried
+        """
+        return self._decode_cascade.stats
+
+    def enable_taxon_scanner(self, status: bool, model_path: str = TAXON_MODEL_PATH):
+        """
+        start/stop the taxon worker thread; stays off if there's no model or onnxruntime
+        :param status: bool
+        :param model_path: str, .onnx model or taxon_classifier.STUB_MODEL
+        """
         self._logger.debug(f"Taxon scanner status set to: {status}")
+        if status and not is_classifier_available(model_path):
+            self._logger.warning("Taxon classifier unavailable (no model file or onnxruntime), taxon scanner off")
+            status = False
+
+        if self._taxon_thread is not None:
+            _thread, _worker = self._taxon_thread, self._taxon_worker
+            self._taxon_thread, self._taxon_worker = None, None
+            self.taxonSampled.disconnect(_worker.add_sample)  # else samples keep going to every old worker
+            _worker.taxonDetected.disconnect(self.taxonDetected)
+            _thread.finished.connect(_worker.deleteLater)  # deleted on its own thread as that thread ends
+            _thread.quit()
+            _thread.wait()
+            _thread.deleteLater()
+
+        if status:
+            self._taxon_worker = TaxonWorker(model_path)
+            self._taxon_thread = QThread()
+            self._taxon_worker.moveToThread(self._taxon_thread)
+            self.taxonSampled.connect(self._taxon_worker.add_sample)  # queued, classification never blocks frames
+            self._taxon_worker.taxonDetected.connect(self.taxonDetected)
+            self._taxon_thread.start()
+            self._next_taxon_sample_ts = 0.0
+
         self._do_scan_taxon = status
         self.processingChanged.emit()
 
+    def _is_taxon_sample_due(self) -> bool:
+        return self._do_scan_taxon and time.perf_counter() >= self._next_taxon_sample_ts
+
     def enable_gaussian_blur(self, status: bool):
         self._logger.debug(f"Gausian blur status set to: {status}")
         self._do_gaussian_blur = status
@@ -146,16 +332,16 @@ class CVFrameWorker(VideoFrameWorker):
 
     # def set_frame_size
 
-    def resize_image(self, img_array: np.ndarray) -> np.ndarray:
+    def resize_image(self, img_array: np.ndarray, tier: str = None, pooled: bool = True) -> np.ndarray:
         """
         boost performance by downsizing image prior to processing
         :param img_array: cv image array
+        :param tier: str, PROCESSING_TIERS key to size to, defaults to current tier
+        :param pooled: bool, write to the pooled resize buffer (False returns a new array)
         :return: cv image array
         """
         _height, _width = img_array.shape[:2]
-
-        # _max_height, _max_width = 720, 1280
-        _max_height, _max_width = 480, 640
+        _max_height, _max_width = PROCESSING_TIERS[tier or self._processing_tier]
 
         if _height > _max_height or _width > _max_width:
             scaling_factor = _max_height / float(_height)
@@ -163,16 +349,50 @@ class CVFrameWorker(VideoFrameWorker):
                 scaling_factor = _max_width / float(_width)
 
             # resize image
-            img_array = cv2.resize(img_array, None, fx=scaling_factor, fy=scaling_factor, interpolation=cv2.INTER_AREA)
-        _height, _width = img_array.shape[:2]
+            _size = (int(_width * scaling_factor), int(_height * scaling_factor))
+            _dst = self._buffers.get('resize', (_size[1], _size[0]) + img_array.shape[2:], img_array.dtype) \
+                if pooled else None
+            with self._timings.time('resize'):
+                img_array = cv2.resize(img_array, _size, dst=_dst, interpolation=cv2.INTER_AREA)
 
         return img_array
 
+    def processVideoFrame(self, frame: QVideoFrame):
+        """
+        entry point for frames sent over from the FrameScheduler, runs on this worker's thread.
+        Map the frame, process a view of its pixels, then tell the scheduler we're ready for the next one.
+        Blur is the only step that needs color, everything else runs on the luminance plane.
+        :param frame: QVideoFrame from camera
+        """
+        _start = time.perf_counter()
+        try:
+            with MappedFrame(frame) as _mapped:
+                if _mapped.is_mapped:
+                    # the taxon model wants color, but only sampled frames pay for the conversion
+                    _needs_color = self._do_gaussian_blur or self._is_taxon_sample_due()
+                    _array = None if _needs_color else luma_view(frame)
+                    if _array is None:
+                        _array = frame_to_rgb(frame)
+                    self._timings.record('map', time.perf_counter() - _start)
+                    if self._calibration_pending:
+                        self._calibrate_processing_tier(_array)
+                        _start = time.perf_counter()  # don't count calibration as frame time
+                    self.processArray(_array)  # views are only valid while mapped, so finish up in here
+                    if self._is_auto_tier:
+                        self._tune_processing_tier(time.perf_counter() - _start, _array.shape)
+
+        except Exception as e:
+            self._logger.error(f"Error processing video frame: {e}")
+
+        finally:
+            self._timings.record('frame', time.perf_counter() - _start)
+            self.frameProcessed.emit()
+
     def processArray(self, array: np.ndarray) -> np.ndarray:
         """
         for now, process every frame, but only redraw the rectangle every N frame processed, in an attempt
         to help the bounding box persist a bit longer on screen
-        :param array: numpy array representing image pi3els
+        :param array: numpy array representing image pixels, RGB or single channel luminance
         :return: that same array, with a opencv bounding box drawn
         """
         array = self.resize_image(array)
@@ -184,109 +404,188 @@ class CVFrameWorker(VideoFrameWorker):
             array = self._scan_taxon(array)
 
         if self._do_gaussian_blur:
-            array = self._gaussian_blur(array)
-            self.sendFrameToDisplay.emit(array)
+            with self._timings.time('blur'):
+                array = self._gaussian_blur(array)
+            self._send_to_display(array)
 
         if self._do_pencil_sketch:
-            array = self._pencil_sketch(array)
-            self.sendFrameToDisplay.emit(array)
-
-        if self._freeze_requested:
-            self.feedFrozen.emit()
+            with self._timings.time('sketch'):
+                array = self._pencil_sketch(array)
+            self._send_to_display(array)
 
         return array
 
+    def _send_to_display(self, array: np.ndarray):
+        with self._timings.time('display'):
+            self.sendFrameToDisplay.emit(array_to_qvideoframe(array))
+
     def _scan_taxon(self, array: np.ndarray) -> np.ndarray:
         """
-        Placeholder, experimental processor that will scan image and attempt to
-        classify taxonomy
-        :param array: opencv image np_array (should we specify type here?)
-        :return:
+        every SAMPLE_INTERVAL_S, queue a downsized copy of the frame to the taxon worker, which emits
+        taxonDetected once it has classified a batch.  Skipped if the worker is still busy.
+        :param array: RGB image array (single channel works, but the model does better with color)
+        :return: same array, unchanged
         """
+        if not self._is_taxon_sample_due() or self._taxon_worker is None:
+            return array
+
+        self._next_taxon_sample_ts = time.perf_counter() + SAMPLE_INTERVAL_S
+        if self._taxon_worker.reserve_sample():
+            with self._timings.time('taxon'):
+                self.taxonSampled.emit(downsize_sample(array))
         return array
 
-    def _apply_threshold(self, array: np.ndarray) -> np.array:
+    def reset_last_barcode(self):
+        self._barcode_voter.reset()
+        self._roi_tracker.reset()
+
+    @staticmethod
+    def _barcode_outline(points: np.ndarray, shape: tuple) -> dict:
+        """
+        the barcode polygon for the QML overlay to draw over the VideoOutput, instead of drawing on the frame
+        :param points: Nx2 int32 array of barcode polygon points in frame coords
+        :param shape: shape of the frame the points are from
+        :return: dict, points as [x, y] fractions of frame width/height, plus the frame width and height
+        """
+        _height, _width = shape[:2]
+        return {
+            'points': [[float(x) / _width, float(y) / _height] for x, y in points.reshape(-1, 2)],
+            'width': _width,
+            'height': _height
+        }
+
+    def _to_gray(self, array: np.ndarray) -> np.ndarray:
+        """
+        :param array: cv image array, RGB or single channel
+        :return: single channel array, written to the pooled gray buffer if it needed converting
+        """
+        return array if array.ndim == 2 else to_gray(array, dst=self._buffers.get('gray', array.shape[:2]))
+
+    def _decode(self, gray: np.ndarray) -> tuple:
         """
-        https://docs.opencv.org/3.0-beta/doc/py_tutorials/py_imgproc/py_thresholding/py_thresholding.html
-        :param array: numpy ndimensional array (an image)
-        :return:
+        run the decode cascade on a single grayscale image array
+        :param gray: single channel cv image array
+        :return: tuple (barcode str, Nx2 int32 array of polygon points), or (None, None) if nothing decoded
         """
-        ret, thresh1 = cv2.threshold(cv2.cvtColor(array, cv2.COLOR_BGR2GRAY), 127, 255, cv2.THRESH_BINARY)
-        return thresh1
+        _barcode, _points, _stage = self._decode_cascade.decode(gray)
+        if _barcode is not None:
+            self._logger.debug(f"Barcode decoded by {_stage} stage")
+        return _barcode, _points
 
-    def _apply_adaptive_threshold(self, array: np.ndarray) -> np.ndarray:
-        return cv2.adaptiveThreshold(cv2.cvtColor(array, cv2.COLOR_BGR2GRAY), 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 11, 2)
+    def _decode_barcode(self, array: np.ndarray) -> tuple:
+        """
+        if we recently found a barcode, decode a crop around it first, and only fall back to
+        scanning the full frame if the crop comes up empty
+        :param array: full frame cv image array
+        :return: tuple (barcode str, Nx2 int32 array of polygon points in full frame coords), or (None, None)
+        """
+        _gray = self._to_gray(array)
+        if self._do_track_roi and self._roi_tracker.is_tracking:
+            _crop, (_x, _y) = self._roi_tracker.crop(_gray)
+            _barcode, _points = self._decode(_crop)
+            if _barcode is not None:
+                _points += (_x, _y)  # crop coords --> full frame coords
+                self._roi_tracker.hit(_points, array.shape, from_roi=True)
+                return _barcode, _points
 
-    def _apply_adaptive_gaussian_threshold(self, array: np.ndarray) -> np.ndarray:
-        return cv2.adaptiveThreshold(cv2.cvtColor(array, cv2.COLOR_BGR2GRAY), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+            self._roi_tracker.miss(from_roi=True)
 
-    def _apply_otsus_binarization(self, array: np.ndarray) -> np.ndarray:
-        ret, thresh = cv2.threshold(cv2.cvtColor(array, cv2.COLOR_BGR2GRAY), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-        return thresh
+        _barcode, _points = self._decode(_gray)
+        if _barcode is not None and self._do_track_roi:
+            self._roi_tracker.hit(_points, array.shape)
 
-    def reset_last_barcode(self):
-        self._last_barcode_scanned = None
-
-    def _apply_barcode_polys_to_img(self, img_array, barcode_coords):
-        return cv2.polylines(
-            np.array(img_array),
-            barcode_coords,
-            True,
-            (118, 230, 0),  # accent green
-            # (205, 90, 106),  # red
-            50  # nice and thick line that kind of looks like a barcode scanner
-        )
+        return _barcode, _points
+
+    def _submit_to_decoder_pool(self, array: np.ndarray):
+        """
+        hand the grayscale frame (or the tracked ROI of it) to the decoder pool, results come back in _on_pool_decoded.
+        If every decoder is busy the frame is dropped, a newer one will be along shortly.
+        :param array: full frame cv image array
+        """
+        _gray = self._to_gray(array)
+        _from_roi = self._do_track_roi and self._roi_tracker.is_tracking
+        _crop, _offset = self._roi_tracker.crop(_gray) if _from_roi else (_gray, (0, 0))
+        self._decoder_pool.submit(_crop, {'offset': _offset, 'from_roi': _from_roi, 'shape': _gray.shape})
+
+    def _on_pool_decoded(self, result: dict):
+        """
+        decoder pool finished a frame we submitted, update ROI tracking and notify as if we'd decoded it here
+        :param result: dict from DecoderPool.decoded
+        """
+        _context = result['context']
+        _barcode, _points = result['barcode'], result['points']
+        self._timings.record('decode', result['seconds'])
+        if _barcode is not None:
+            _points = np.array(_points, np.int32) + _context['offset']  # crop coords --> full frame coords
+            if self._do_track_roi:
+                self._roi_tracker.hit(_points, _context['shape'], from_roi=_context['from_roi'])
+        elif _context['from_roi']:
+            self._roi_tracker.miss(from_roi=True)
+
+        try:
+            self._on_barcode_decoded(_barcode, _points, _context['shape'])
+        except Exception as e:
+            self._logger.error(f"Unable to handle barcode decoder pool result: {e}")
+
+    def _on_barcode_decoded(self, barcode, points, shape: tuple):
+        """
+        outline every read for the overlay, but only emit the barcode once DetectionVoter accepts it
+        :param barcode: str, decoded barcode, or None if nothing found
+        :param points: Nx2 int32 array of barcode polygon points in full frame coords
+        :param shape: shape of the frame the barcode was decoded from
+        """
+        _accepted = self._barcode_voter.vote(barcode)
+        if barcode is None:
+            return
+
+        self._barcode_frames_decoded += 1
+        self.barcodeOutlined.emit(self._barcode_outline(points, shape))  # a few floats, the frame itself stays here
+
+        if _accepted is not None:
+            self.barcodeDetected.emit(_accepted)  # notify UI that we scanned a barcode
+            self._logger.debug(f"Barcode {_accepted} accepted by vote and emitted")
+        else:
+            self._logger.debug(f"Barcode {barcode} read, not emitted (awaiting quorum or repeat)")
 
     def _scan_barcode(self, array):
         """
         use zbar algorithm to identify barcode in cv array.
-        If found, emit it to UI.  For now using a very basic thresholding is being used to help things out.
-        Use binary threshold result for detection, but still return original image with polys drawn.
+        If found, emit it to UI.  Detection runs on thresholded/grayscale copies (see DecodeCascade), the
+        frame itself is never drawn on: the barcode outline is emitted and drawn by a QML overlay.
+        With the decoder pool on, the frame is only submitted here and results are emitted asynchronously.
         :param array: array in format for cv
-        :return: same array but with bounding poly drawn
+        :return: same array, unchanged
         """
-        _redraw_every_n = 1  # adjust higher if you want to not process each...
-        _throttle_scan_for_n = 10
+        _scan_start = time.perf_counter()
+        _is_scan_due = self._scheduler is None or self._scheduler.scan_due(_scan_start)
         try:
-            if self._barcode_frames_scanned % _redraw_every_n == 0:
-                # apply threshold to make barcode binary
-                #_binary = self._apply_threshold(array)
-                # _binary = self._apply_adaptive_threshold(array)
-                _binary = self._apply_adaptive_gaussian_threshold(array)
-                r = pyzbar.pyzbar.decode(_binary, symbols=[128, 39])  #symbols = ['128'] for now just code 128, are vials this version too?
-                if r:
-                    self._logger.debug(f"Barcode detected by CVFrameProcessor!")
-                    # https://docs.opencv.org/3.4/dc/da5/tutorial_py_drawing_functions.html
-                    self._barcode_polys = np.array([[p.x, p.y] for p in r[0][3]], np.int32)
-                    self._barcode_polys = [self._barcode_polys.reshape((len(self._barcode_polys), 1, 2))]
-
-
-                    _barcode = r[0][0].decode('utf-8')
-                    self.BARCODE_THROTTLE_COUNT += 1
-                    if self.BARCODE_THROTTLE_COUNT > _throttle_scan_for_n or _barcode != self._last_barcode_scanned:
-                        array = self._apply_barcode_polys_to_img(array, self._barcode_polys)
-                        self.barcodeDetected.emit(_barcode, array)  # notify UI that we scanned a barcode
-                        self.BARCODE_THROTTLE_COUNT = 0  # reset throttle when we emit a barcode
-                        self._logger.debug(f"Barcode {_barcode} detected by CVFrameProcessor and emitted unthrottled!")
-                    else:
-                        self._logger.debug(f"Barcode detection not emitted due to throttle.")
-
-                    self._last_barcode_scanned = _barcode
-                else:
-                    self._barcode_polys = None
+            if _is_scan_due and self._do_sharpness_gate:
+                with self._timings.time('gate'):
+                    # too blurry to read: leave the scan due, so the next (hopefully sharper) frame is tried instead
+                    _is_scan_due = self._sharpness_gate.check(self._to_gray(array))
+
+            if _is_scan_due and self._decoder_pool is not None:
+                self._submit_to_decoder_pool(array)
+            elif _is_scan_due:
+                with self._timings.time('decode'):
+                    _barcode, _points = self._decode_barcode(array)
+                self._on_barcode_decoded(_barcode, _points, array.shape)
 
         except Exception as e:
             pass
 
         finally:
-            self._barcode_frames_scanned += 1
+            if self._scheduler is not None and _is_scan_due:
+                self._scheduler.record_scan(_scan_start, time.perf_counter() - _scan_start)
+            if _is_scan_due:
+                self._barcode_frames_scanned += 1
             return array
 
     def _gaussian_blur(self, array: np.ndarray) -> np.ndarray:
         """
         use me while processing array frame to add blur
         """
-        return cv2.GaussianBlur(array, (0, 0), 25)
+        return cv2.GaussianBlur(array, (0, 0), 25, dst=self._buffers.like('blur', array))
 
     def _pencil_sketch(self, array: np.ndarray) -> np.ndarray:
         """
@@ -294,9 +593,9 @@ class CVFrameWorker(VideoFrameWorker):
         :param array: cv image array
         :return: cv image array, with pencial scketch effect
         """
-        _gray_img = cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
-        _gaussian = cv2.GaussianBlur(_gray_img, (21, 21), 0, 0)
-        return cv2.divide(_gray_img, _gaussian, scale=256.0)
+        _gray_img = self._to_gray(array)
+        _gaussian = cv2.GaussianBlur(_gray_img, (21, 21), 0, dst=self._buffers.like('sketch_blur', _gray_img))
+        return cv2.divide(_gray_img, _gaussian, dst=self._buffers.like('sketch', _gray_img), scale=256.0)
 
 
 class CamControls(QObject):
@@ -309,13 +608,25 @@ class CamControls(QObject):
     cameraChanged = Signal()  # tell ui that camera device has changed
     cameraStatusChanged = Signal(bool, arguments=['status'])
     barcodeDetected = Signal(str, arguments=['barcode'])  # notify if we have detected a new barcode
+    taxonDetected = Signal(str, float, arguments=['taxon_name', 'confidence'])  # taxon classifier's latest guess
     videoFrameProcessed = Signal("QVariant", arguments=['new_frame'])  # send frame from processor to final sink
     controlsChanged = Signal()  # for now just using generic signal anytime control (e.g. flash, focus etc) changes
     flipCamera = Signal()
     cameraResolutionChanged = Signal()
     barcodeNotFound = Signal(str, arguments=['barcode'])
     barcodeFound = Signal(str, arguments=['barcode'])
-
+    barcodeOutlineChanged = Signal()
+    pipelineStatsChanged = Signal()
+    processingTierChanged = Signal()
+    imageSaved = Signal(int, str, arguments=['id', 'path'])  # captured image written to disk, single shot or best of burst
+    ringFrameReceived = Signal(QVideoFrame, float)  # camera frame + arrival time, queued to the ring buffer thread
+    zslCaptureRequested = Signal(float, str, int)  # tap time, save path, frames wanted; queued to the ring buffer
+    zslBufferResized = Signal(int)  # new ring buffer budget in MB, 0 frees it
+    freezeRequested = Signal(QVideoFrame)  # frame to build the freeze frame from, queued to the frame worker
+    captureBacklogChanged = Signal()  # encode jobs or the capture pipeline (see images_manager) filled/drained
+
+    PIPELINE_STATS_INTERVAL_MS = 1000  # how often pipelineStats is refreshed
+    MAX_ENCODE_JOBS = 3  # bursts/ZSL captures being scored and encoded before new captures are held off
 
     def __init__(self, db, app=None, parent=None):
         super().__init__(parent)
@@ -330,6 +641,31 @@ class CamControls(QObject):
         self._is_camera_running = False
         self._image_capture = QImageCapture()
 
+        self._image_names = ImageNameAllocator(IMAGES_DIR)  # next _img# per name, without probing the disk
+        self._capture_paths = {}  # QImageCapture id --> path, for captures written straight to file
+        self._image_capture.imageSaved.connect(self._on_image_saved)
+        self._image_capture.imageCaptured.connect(self._on_burst_image_captured)
+        self._image_capture.imageMetadataAvailable.connect(self._on_burst_metadata_available)
+        self._image_capture.readyForCaptureChanged.connect(self._on_ready_for_capture)
+        self._image_capture.errorOccurred.connect(self._on_capture_error)
+        self._burst_path = None  # full path the best image of the current burst will be saved to, None if no burst
+        self._burst_images = []  # (capture id, QImage) captured to memory for the current burst
+        self._burst_metadata = {}  # capture id --> what the camera reported with it, exif for the saved winner
+        self._burst_to_request = 0  # captures left to ask for in current burst
+        self._burst_in_flight = 0  # captures asked for, not yet received
+        self._burst_jobs = []  # (thread, worker) for bursts being scored/saved
+
+        # zero shutter lag: recent camera frames are kept in a ring buffer on their own thread, see frame_ring_buffer
+        self._frame_ring_buffer = FrameRingBuffer(buffer_mb=0)  # allocated once isZslOn/zslBufferMb are loaded
+        self._ring_buffer_thread = QThread()
+        self._frame_ring_buffer.moveToThread(self._ring_buffer_thread)
+        self.ringFrameReceived.connect(self._frame_ring_buffer.push_frame)
+        self.zslCaptureRequested.connect(self._frame_ring_buffer.capture_nearest)
+        self.zslBufferResized.connect(self._frame_ring_buffer.set_buffer_mb)
+        self._frame_ring_buffer.framesReady.connect(self._on_zsl_frames_ready)
+        self._frame_ring_buffer.captureFailed.connect(self._on_zsl_capture_failed)
+        self._ring_buffer_thread.start()
+
         self._capture_session = QMediaCaptureSession()
         self._capture_session.setCamera(self._camera)
         self._capture_session.setImageCapture(self._image_capture)
@@ -339,19 +675,39 @@ class CamControls(QObject):
         self._capture_session.setVideoSink(self._source_sink)
 
         # frame processing worker/thread setup
-        self._frame_processor = VideoFrameProcessor()  # process frames here, runs CVFrameWorker on internal thread
-        self._cv_frame_worker = CVFrameWorker()  # worker to use opencv to take frames from source sink
+        self._frame_scheduler = FrameScheduler()  # only send frames we can keep up with
+        self._cv_frame_worker = CVFrameWorker(self._frame_scheduler)  # worker to use opencv to take frames from source sink
+        self._frame_processor_thread = QThread()  # process frames here, CVFrameWorker runs on this thread
+        self._cv_frame_worker.moveToThread(self._frame_processor_thread)
+        self._frame_scheduler.frameDispatched.connect(self._cv_frame_worker.processVideoFrame)  # queued to worker thread
+        self._cv_frame_worker.frameProcessed.connect(self._frame_scheduler.frame_done)  # worker free, send newest frame
         self._cv_frame_worker.isProcessingNecessary.connect(self._toggle_frame_processor)  # if not necessary, turn off
-        self._frame_processor.setWorker(self._cv_frame_worker)  # connect processor and worker
+        self._frame_processor_thread.start()
 
         # by default, dont hook up frame processor: sourceSink --> processor --> targetSink
-        self._capture_session.videoSink().videoFrameChanged.connect(self._display_frame)  # pipe frame from source to target
-
-        # for some reason when I call self._camera.start / stop directly, this doesnt work
-        self._cv_frame_worker.feedFrozen.connect(self.stopCamera)
-        self._cv_frame_worker.feedUnfrozen.connect(self.startCamera)
-        self._cv_frame_worker.barcodeDetected.connect(lambda bc, frame: self._set_detected_barcode(bc, frame))
-        self._cv_frame_worker.sendFrameToDisplay.connect(lambda frame: self._display_frame(array2qvideoframe(frame)))
+        self._capture_session.videoSink().videoFrameChanged.connect(self._display_source_frame)  # pipe frame from source to target
+
+        # frame pipeline telemetry, refreshed for the UI about once a second
+        self._source_frames = 0  # frames received from camera, processed or not
+        self._pipeline_stats = {}
+        self._last_stats_counts = None  # (perf_counter, source frames, scheduler counters) at last refresh
+        self._pipeline_stats_timer = QTimer(self)
+        self._pipeline_stats_timer.setInterval(self.PIPELINE_STATS_INTERVAL_MS)
+        self._pipeline_stats_timer.timeout.connect(self._update_pipeline_stats)
+        self._pipeline_stats_timer.start()
+
+        # freeze frame: sketch the last camera frame once on the worker, then show that until unfrozen
+        self._last_source_frame = None  # newest frame from the camera
+        self._frozen_source_frame = None  # frame the cached freeze frame was built from
+        self._frozen_frame = None  # cached pencil sketch, reused if we freeze again on the same frame
+        self._is_frozen = False
+        self.freezeRequested.connect(self._cv_frame_worker.freeze_frame)
+        self._cv_frame_worker.frameFrozen.connect(self._on_frame_frozen)
+        self._cv_frame_worker.barcodeDetected.connect(self._set_detected_barcode)
+        self._cv_frame_worker.barcodeOutlined.connect(self._set_barcode_outline)
+        self._cv_frame_worker.taxonDetected.connect(self._set_detected_taxon)
+        self._cv_frame_worker.sendFrameToDisplay.connect(self._display_frame)  # already converted on worker thread
+        self._cv_frame_worker.processingTierChanged.connect(self._set_active_processing_tier)
         self._camera.activeChanged.connect(self._set_camera_status)
 
         # custom control variables, store them in state table and load on start
@@ -359,6 +715,19 @@ class CamControls(QObject):
         self.isBarcodeScannerOn = self._app.state.get_state_value('Barcode Scanner On') == 'True'
         self._is_taxon_scanner_on = None
         self.isTaxonScannerOn = self._app.state.get_state_value('Taxon Scanner On') == 'True'
+        self._barcode_decoder_processes = None
+        self.barcodeDecoderProcesses = int(self._app.state.get_state_value('Barcode Decoder Processes') or 0)
+        self._burst_count = None
+        self.burstCount = int(self._app.state.get_state_value('Burst Count') or 1)
+        self._is_sharpness_gate_on = None
+        self.isSharpnessGateOn = self._app.state.get_state_value('Sharpness Gate On') != 'False'  # on by default
+        self._zsl_buffer_mb = None
+        self.zslBufferMb = int(self._app.state.get_state_value('ZSL Buffer MB') or DEFAULT_BUFFER_MB)
+        self._is_zsl_on = None
+        self.isZslOn = self._app.state.get_state_value('ZSL On') == 'True'  # off by default, see isZslOn
+        self._active_processing_tier = self._cv_frame_worker.processing_tier
+        self._processing_tier = None
+        self.processingTier = self._app.state.get_state_value('Processing Tier') or AUTO_TIER
         self._is_torch_on = None
         self.isTorchOn = self._app.state.get_state_value('Torch On') == 'True'
         self._cur_flash_mode = None
@@ -366,6 +735,7 @@ class CamControls(QObject):
         self._cur_focus_mode = None
         self.curFocusMode = self._app.state.get_state_value('Focus Mode')
         self._detected_barcode = None
+        self._barcode_outline = None
 
     def _toggle_frame_processor(self, turn_on):
         """
@@ -387,9 +757,10 @@ class CamControls(QObject):
         """
         self._logger.debug("Disconnecting frame processor, piping frames direct to UI sink...")
         try:
-            self._capture_session.videoSink().videoFrameChanged.disconnect(self._frame_processor.processVideoFrame)
+            self._capture_session.videoSink().videoFrameChanged.disconnect(self._frame_scheduler.submit)
         except RuntimeError: # if not yet connected, thats ok
             self._logger.debug(f"frameProcessor not yet connected, unable to disconnect.")
+        self._frame_scheduler.reset()
 
     @Slot()
     def connectFrameProcessor(self):
@@ -398,7 +769,21 @@ class CamControls(QObject):
         disconnect direct connection from sourceSink --> targetSink
         """
         self._logger.debug("Disconnecting frame processor, piping frames direct to UI sink...")
-        self._capture_session.videoSink().videoFrameChanged.connect(self._frame_processor.processVideoFrame)  # pass frame from session to processor
+        # pass frame from session to scheduler, which hands the processor the newest frame whenever it's free
+        self._capture_session.videoSink().videoFrameChanged.connect(self._frame_scheduler.submit)
+
+    def shutdown(self):
+        """
+        stop frame processing/ring buffer threads and decoder processes, call on app exit
+        """
+        self._pipeline_stats_timer.stop()
+        self.disconnectFrameProcessor()
+        self._cv_frame_worker.enable_decoder_pool(0)
+        self._cv_frame_worker.enable_taxon_scanner(False)
+        self._frame_processor_thread.quit()
+        self._frame_processor_thread.wait()
+        self._ring_buffer_thread.quit()
+        self._ring_buffer_thread.wait()
 
     def startCamera(self):
         self._camera.start()
@@ -438,6 +823,7 @@ class CamControls(QObject):
 
             self._app.state.set_state_value('Current Camera', new_camera.cameraDevice().description())
             self._capture_session.setCamera(self._camera)
+            self._cv_frame_worker.release_buffers()  # new camera, new frame sizes
 
             if _do_restart:
                 self._camera.start()
@@ -473,6 +859,7 @@ class CamControls(QObject):
             _fmt.resolution().setWidth(new_res['width'])
             _fmt.resolution().setHeight(new_res['height'])
             self._camera.setCameraFormat(_fmt)
+            self._cv_frame_worker.release_buffers()
         except Exception as e:
             self._logger.error(f"Unable to set camera resolution to {new_res}: {e}")
 
@@ -546,23 +933,83 @@ class CamControls(QObject):
             self._logger.info("Setting camera to default device")
             self.camera = QCamera(self._devices.videoInputs()[0])
 
+    def _display_source_frame(self, frame: QVideoFrame):
+        """
+        frames direct from camera, counted so we can report camera fps, and kept for zero shutter lag capture
+        :param frame: QVideoFrame
+        """
+        self._source_frames += 1
+        self._last_source_frame = frame
+        if self._is_zsl_on and self._frame_ring_buffer.reserve_push():
+            self.ringFrameReceived.emit(frame, time.perf_counter())
+        self._display_frame(frame)
+
+    def _update_pipeline_stats(self):
+        """
+        refresh pipelineStats from frame/scheduler counters and the worker's stage timings
+        """
+        _now = time.perf_counter()
+        _counts = self._frame_scheduler.counters
+        if self._last_stats_counts is not None:
+            _then, _then_source, _then_counts = self._last_stats_counts
+            _elapsed = max(_now - _then, 1e-6)
+            self._pipeline_stats = {
+                'camera_fps': round((self._source_frames - _then_source) / _elapsed, 1),
+                'processor_fps': round((_counts['dispatched'] - _then_counts['dispatched']) / _elapsed, 1),
+                'dropped_per_s': round((_counts['dropped'] - _then_counts['dropped']) / _elapsed, 1),
+                'skipped_per_s': round((_counts['skipped'] - _then_counts['skipped']) / _elapsed, 1),
+                'scan_interval_ms': round(self._frame_scheduler.scan_interval * 1000, 1),
+                'processing_tier': self._active_processing_tier,
+                'sharpness_gate': self._cv_frame_worker.sharpness_gate_stats,
+                'totals': _counts,
+                'stages': self._cv_frame_worker.timings.snapshot()
+            }
+            self.pipelineStatsChanged.emit()
+        self._last_stats_counts = (_now, self._source_frames, _counts)
+
+    @Property("QVariant", notify=pipelineStatsChanged)
+    def pipelineStats(self) -> dict:
+        """
+        camera/processor fps, dropped and skipped frames per second, and p50/p95/p99 ms of each pipeline stage
+        """
+        return self._pipeline_stats
+
+    @Slot()
+    def logPipelineStats(self):
+        """
+        write the current pipeline stats to the log, so field staff can send us real numbers
+        """
+        self._logger.info(f"Frame pipeline stats:\n{format_stats(self._pipeline_stats)}")
+
     def _display_frame(self, frame: QVideoFrame):
         """
         pass frame from processor to target sink associated with VideoOutput for final display
         :param frame: QVideoFrame
         """
-        self._target_sink.setVideoFrame(frame)
+        if not self._is_frozen:  # late frames from camera/worker mustn't replace the freeze frame
+            self._target_sink.setVideoFrame(frame)
+
+    def _set_detected_taxon(self, taxon_name: str, confidence: float):
+        self._logger.debug(f"taxon detected: {taxon_name} ({confidence:.2f})")
+        self.taxonDetected.emit(taxon_name, confidence)
+
+    def _set_barcode_outline(self, outline: dict):
+        self._barcode_outline = outline
+        self.barcodeOutlineChanged.emit()
+
+    @Property("QVariant", notify=barcodeOutlineChanged)
+    def barcodeOutline(self):
+        """
+        latest barcode read: {'points': [[x, y], ...] as fractions of frame size, 'width': px, 'height': px}
+        """
+        return self._barcode_outline
 
-    def _set_detected_barcode(self, new_barcode: str, barcode_polys=[]):
+    def _set_detected_barcode(self, new_barcode: str):
         """
         hook this up to barcodeDetected signal, transform, then emit if different
         :param new_barcode: str, unformatted barcode str read from image
         :return: str, formatted with dashes if necessary
         """
-        if len(barcode_polys):
-
-            self._display_frame(array2qvideoframe(barcode_polys))
-
         bc = self.transform_barcode_tag(new_barcode) if new_barcode else new_barcode
         self._logger.debug(f"barcode detected: {bc}")
         if self._detected_barcode != bc:
@@ -601,16 +1048,34 @@ class CamControls(QObject):
     @Slot()
     def freezeFrame(self):
         """
-        send request to stop frame feed, but do something to last frame first
+        stop the frame feed right away and show a pencil sketch of the last frame, built once on the frame worker
         """
-        self._cv_frame_worker.request_freeze_frame()
+        self._is_frozen = True
+        self._frame_scheduler.pause()
+        self.stopCamera()
+        if self._last_source_frame is None:
+            return
+
+        if self._frozen_frame is not None and self._frozen_source_frame is self._last_source_frame:
+            self._target_sink.setVideoFrame(self._frozen_frame)  # no new frames since the last freeze, reuse it
+            return
+
+        self._frozen_source_frame, self._frozen_frame = self._last_source_frame, None
+        self.freezeRequested.emit(self._last_source_frame)
+
+    def _on_frame_frozen(self, frame: QVideoFrame):
+        self._frozen_frame = frame
+        if self._is_frozen:
+            self._target_sink.setVideoFrame(frame)
 
     @Slot()
     def unfreezeFrame(self):
         """
-        send request to restart frame feed, and disable effect we put in place for last frame before freeze
+        restart the frame feed; processing settings were never changed, so there's nothing to reconnect
         """
-        self._cv_frame_worker.request_unfreeze()
+        self._is_frozen = False
+        self._frame_scheduler.resume()
+        self.startCamera()
 
     @Property("QVariant", notify=cameraChanged)
     def isFlashSupported(self):
@@ -636,14 +1101,136 @@ class CamControls(QObject):
             self._app.state.set_state_value('Barcode Scanner On', str(new_status))
             self.controlsChanged.emit()
 
+    @Property(int, notify=controlsChanged)
+    def barcodeDecoderProcesses(self) -> int:
+        """
+        number of processes used to decode barcodes, 0 decodes on the frame processor thread
+        """
+        return self._barcode_decoder_processes
+
+    @barcodeDecoderProcesses.setter
+    def barcodeDecoderProcesses(self, n_processes: int):
+        if self._barcode_decoder_processes != n_processes:
+            self._barcode_decoder_processes = n_processes
+            self._cv_frame_worker.enable_decoder_pool(n_processes)
+            self._app.state.set_state_value('Barcode Decoder Processes', str(n_processes))
+            self.controlsChanged.emit()
+
+    @Property(int, notify=controlsChanged)
+    def burstCount(self) -> int:
+        """
+        number of stills captured per tap, only the sharpest is kept. 1 = single capture
+        """
+        return self._burst_count
+
+    @burstCount.setter
+    def burstCount(self, n_images: int):
+        n_images = max(1, int(n_images))
+        if self._burst_count != n_images:
+            self._burst_count = n_images
+            self._app.state.set_state_value('Burst Count', str(n_images))
+            self.controlsChanged.emit()
+
+    @Property(bool, notify=controlsChanged)
+    def isSharpnessGateOn(self) -> bool:
+        """
+        skip barcode decoding on frames too blurry/fast moving to read
+        """
+        return self._is_sharpness_gate_on
+
+    @isSharpnessGateOn.setter
+    def isSharpnessGateOn(self, new_status: bool):
+        if self._is_sharpness_gate_on != new_status:
+            self._is_sharpness_gate_on = new_status
+            self._cv_frame_worker.enable_sharpness_gate(new_status)
+            self._app.state.set_state_value('Sharpness Gate On', str(new_status))
+            self.controlsChanged.emit()
+
+    @Property(bool, notify=controlsChanged)
+    def isZslOn(self) -> bool:
+        """
+        zero shutter lag: save the buffered camera frame nearest the tap instead of asking the camera for a new still.
+        Off by default: ZSL images are viewfinder resolution, re-encoded and without camera exif, and the ring buffer
+        copies every frame while it's on, so a QImageCapture still is the normal path
+        """
+        return self._is_zsl_on
+
+    @isZslOn.setter
+    def isZslOn(self, new_status: bool):
+        if self._is_zsl_on != new_status:
+            self._is_zsl_on = new_status
+            self.zslBufferResized.emit(self._zsl_buffer_mb if new_status else 0)  # free the buffer when off
+            self._app.state.set_state_value('ZSL On', str(new_status))
+            self.controlsChanged.emit()
+
+    @Property(int, notify=controlsChanged)
+    def zslBufferMb(self) -> int:
+        """
+        memory reserved for the zero shutter lag ring buffer, more MB = more/larger frames to pick from
+        """
+        return self._zsl_buffer_mb
+
+    @zslBufferMb.setter
+    def zslBufferMb(self, buffer_mb: int):
+        buffer_mb = max(1, int(buffer_mb))
+        if self._zsl_buffer_mb != buffer_mb:
+            self._zsl_buffer_mb = buffer_mb
+            if self._is_zsl_on:
+                self.zslBufferResized.emit(buffer_mb)
+            self._app.state.set_state_value('ZSL Buffer MB', str(buffer_mb))
+            self.controlsChanged.emit()
+
+    @Property(list, constant=True)
+    def processingTiers(self) -> list:
+        return [AUTO_TIER] + list(PROCESSING_TIERS)
+
+    @Property(str, notify=controlsChanged)
+    def processingTier(self) -> str:
+        """
+        resolution frames are downsized to for scanning/effects, or Auto to pick one that keeps up with the camera
+        """
+        return self._processing_tier
+
+    @processingTier.setter
+    def processingTier(self, tier: str):
+        if self._processing_tier != tier:
+            try:
+                self._cv_frame_worker.set_processing_tier(tier)
+            except ValueError as e:
+                self._logger.error(f"Unable to set processing tier: {e}")
+                return
+            self._processing_tier = tier
+            self._app.state.set_state_value('Processing Tier', tier)
+            self.controlsChanged.emit()
+
+    @Property(str, notify=processingTierChanged)
+    def activeProcessingTier(self) -> str:
+        """
+        tier currently in use, differs from processingTier when on Auto
+        """
+        return self._active_processing_tier
+
+    def _set_active_processing_tier(self, tier: str):
+        self._active_processing_tier = tier
+        self.processingTierChanged.emit()
+
+    @Property(bool, constant=True)
+    def isTaxonClassifierAvailable(self) -> bool:
+        """
+        false if there's no taxon model in data/models or onnxruntime isn't installed
+        """
+        return is_classifier_available()
+
     @Property(bool, notify=controlsChanged)
     def isTaxonScannerOn(self) -> bool:
         return self._is_taxon_scanner_on
 
     @isTaxonScannerOn.setter
     def isTaxonScannerOn(self, new_status: bool):
+        new_status = new_status and is_classifier_available()
         if self._is_taxon_scanner_on != new_status:
             self._is_taxon_scanner_on = new_status
+            self._cv_frame_worker.enable_taxon_scanner(new_status)
             self._app.state.set_state_value('Taxon Scanner On', str(new_status))
             self.controlsChanged.emit()
 
@@ -695,38 +1282,211 @@ class CamControls(QObject):
         bio_label = '_' + self._app.data_selector.cur_bio_label if self._app.data_selector.cur_bio_label else ''
         return f"{vessel_haul}{catch_display}{project}{bio_label}.{ext}"
 
-    def _increment_file_path(self, full_path, i=1):
-        """
-        append _i to the file path, where i is the next available if we have a duplicate file
-        :param full_path: full path to file
-        :param i: int, starting integer we attempt to append to file
-        :return: str, new full path to image with next available i
-        """
-
-        path, ext = os.path.splitext(full_path)
-        pattern = re.compile(f'_img\\d+{ext}$')
-        if not pattern.search(full_path):
-            # if filename doesnt have img# at the end, put it there
-            full_path = f"{path}_img{i}{ext}"
-        else:
-            # if path is already incremented, replace increment with current val
-            full_path = re.sub(pattern, f'_img{i}{ext}', full_path)
-
-        if not os.path.exists(full_path):
-            return full_path
-        else:
-            i += 1
-            return self._increment_file_path(full_path, i)
-
     @Slot()
     def captureImage(self):
         """
         async image capture, on success the imageSaved signal is emitted
         https://doc.qt.io/qtforpython-6/PySide6/QtMultimedia/QImageCapture.html#PySide6.QtMultimedia.PySide6.QtMultimedia.QImageCapture.imageSaved
         """
+        _tap_time = time.perf_counter()
+        if self.isCaptureBacklogged:
+            self._logger.warning("Captures still being saved, ignoring capture request")
+            return
+        if self._burst_path is not None:
+            self._logger.warning(f"Burst capture to {self._burst_path} still in progress, ignoring capture request")
+            return
+
         img_name = self._get_image_name()
-        full_path = Path(self._increment_file_path(os.path.join(IMAGES_DIR, img_name))).as_posix()
+        try:
+            full_path = Path(self._image_names.allocate(img_name)).as_posix()  # reserved with an empty placeholder
+        except OSError as e:
+            self._logger.error(f"Unable to allocate image file name for {img_name}: {e}")
+            return
+        if self._is_zsl_on:
+            # ring buffer hands back the frame(s) nearest the tap, or fails and we fall back to the camera
+            self.zslCaptureRequested.emit(_tap_time, full_path, self._burst_count)
+            return
+
+        self._capture_with_camera(full_path)
+
+    def _on_zsl_frames_ready(self, images: list, full_path: str):
+        """
+        FrameRingBuffer.framesReady, save the sharpest of the frames nearest the tap
+        """
+        self._save_best_image(images, full_path)
+
+    def _on_zsl_capture_failed(self, full_path: str, reason: str):
+        self._logger.warning(f"Zero shutter lag capture failed ({reason}), capturing from camera instead")
+        self._capture_with_camera(full_path)
+
+    def _capture_with_camera(self, full_path: str):
+        """
+        ask QImageCapture for new still(s): one straight to file, or a burst scored in memory
+        :param full_path: str, where the image is saved
+        """
+        if self._burst_path is not None:
+            self._logger.warning(f"Burst capture to {self._burst_path} still in progress, ignoring capture request")
+            self._image_names.release(full_path)
+            return
+
+        if self._burst_count > 1:
+            self._start_burst(full_path)
+            return
+
         img_result = self._image_capture.captureToFile(full_path)
         self._logger.info(f"Capturing image to {full_path}, capture result={img_result}")
+        if img_result == -1:
+            self._image_names.release(full_path)
+        else:
+            self._capture_paths[img_result] = full_path
+
+    def _on_image_saved(self, capture_id: int, path: str):
+        self._capture_paths.pop(capture_id, None)
+        self.imageSaved.emit(capture_id, path)
+
+    def _start_burst(self, full_path: str):
+        """
+        capture burstCount stills to memory, then pick the sharpest one on a worker thread and save it to full_path
+        :param full_path: str, where the best image is saved
+        """
+        self._logger.info(f"Capturing burst of {self._burst_count} images for {full_path}")
+        self._burst_path = full_path
+        self._burst_images = []
+        self._burst_metadata = {}
+        self._burst_to_request = self._burst_count
+        self._burst_in_flight = 0
+        self._request_burst_image()
+
+    def _request_burst_image(self):
+        """
+        ask for the next still of the burst if the camera can take one now, else _on_ready_for_capture will
+        """
+        if self._burst_path is None or self._burst_to_request <= 0 or not self._image_capture.isReadyForCapture():
+            return
+
+        if self._image_capture.capture() == -1:
+            self._logger.warning(f"Burst capture request failed: {self._image_capture.errorString()}")
+            self._burst_to_request = 0
+            self._finish_burst_if_done()
+            return
+
+        self._burst_to_request -= 1
+        self._burst_in_flight += 1
+
+    def _on_ready_for_capture(self, is_ready: bool):
+        if is_ready:
+            self._request_burst_image()
+
+    def _on_burst_image_captured(self, capture_id: int, image):
+        """
+        QImageCapture.imageCaptured, fires for every capture; only burst images are kept
+        :param capture_id: int, id of capture request
+        :param image: QImage
+        """
+        if self._burst_path is None or self._burst_in_flight <= 0:
+            return
+
+        self._burst_in_flight -= 1
+        self._burst_images.append((capture_id, image))
+        _defaults = {'date': datetime.now().strftime(EXIF_DATE_FORMAT),
+                     'camera': self._camera.cameraDevice().description()}
+        self._burst_metadata[capture_id] = {**_defaults, **self._burst_metadata.get(capture_id, {})}
+        self._request_burst_image()
+        QTimer.singleShot(0, self._finish_burst_if_done)  # after this capture's imageMetadataAvailable
+
+    def _on_burst_metadata_available(self, capture_id: int, metadata):
+        """
+        QImageCapture.imageMetadataAvailable, kept for burst stills so the winner is saved with it
+        :param capture_id: int, id of capture request
+        :param metadata: QMediaMetaData
+        """
+        if self._burst_path is None:
+            return
+        self._burst_metadata.setdefault(capture_id, {}).update(capture_metadata(metadata))
+
+    def _on_capture_error(self, capture_id: int, error, error_str: str):
+        self._logger.error(f"Image capture {capture_id} failed: {error_str}")
+        if capture_id in self._capture_paths:
+            self._image_names.release(self._capture_paths.pop(capture_id))
+        if self._burst_path is not None and self._burst_in_flight > 0:
+            self._burst_in_flight -= 1
+            self._finish_burst_if_done()
+
+    def _finish_burst_if_done(self):
+        """
+        once every requested still is in (or failed), hand the burst off to be scored and saved
+        """
+        if self._burst_path is None or self._burst_to_request > 0 or self._burst_in_flight > 0:
+            return
+
+        _path, _captures, _metadata = self._burst_path, self._burst_images, self._burst_metadata
+        self._burst_path, self._burst_images, self._burst_metadata = None, [], {}
+        if not _captures:
+            self._logger.error(f"Burst capture for {_path} got no images")
+            self._image_names.release(_path)
+            return
 
+        self._save_best_image([i for _, i in _captures], _path, [_metadata.get(c) for c, _ in _captures])
 
+    def _save_best_image(self, images: list, full_path: str, metadata: list = None):
+        """
+        score images on a worker thread and save only the sharpest, emitting imageSaved once written
+        :param images: list of QImage or RGB arrays
+        :param full_path: str, where the best image is saved
+        :param metadata: list of dict, per image, written into the winner's exif; see burst_capture.metadata_exif
+        """
+        _thread = QThread()
+        _worker = BurstWorker(images, full_path, metadata=metadata)
+        _worker.moveToThread(_thread)
+        _thread.started.connect(_worker.run)
+        _worker.burstSaved.connect(self._on_burst_saved)  # bound methods, so these run queued on this thread
+        _worker.burstFailed.connect(self._on_burst_failed)
+        _worker.finished.connect(_thread.quit)
+        _thread.finished.connect(self._on_burst_job_finished)
+        self._burst_jobs.append((_thread, _worker))  # hold a reference until the thread is done
+        _thread.start()
+        if len(self._burst_jobs) == self.MAX_ENCODE_JOBS:
+            self.captureBacklogChanged.emit()
+
+    def _on_burst_saved(self, path: str, best_index: int):
+        self.imageSaved.emit(-1, path)
+
+    def _on_burst_failed(self, path: str, error: str):
+        self._image_names.release(path)
+
+    def _on_burst_job_finished(self):
+        _thread = self.sender()
+        _thread.wait()
+        self._burst_jobs = [j for j in self._burst_jobs if j[0] is not _thread]
+        if len(self._burst_jobs) == self.MAX_ENCODE_JOBS - 1:
+            self.captureBacklogChanged.emit()
+
+    @Property(bool, notify=captureBacklogChanged)
+    def isCaptureBacklogged(self) -> bool:
+        """
+        too many captures still being encoded, tagged or stored; captureImage ignores taps until some are done
+        """
+        _image_manager = getattr(self._app, 'image_manager', None)  # created after us
+        return len(self._burst_jobs) >= self.MAX_ENCODE_JOBS or \
+            (_image_manager is not None and _image_manager.isCaptureBacklogged)
+
+
+if __name__ == '__main__':
+    # taxon scanner off/on cycle check: each restart leaves exactly one worker connected, and the old ones are freed
+    import shiboken6
+    from PySide6.QtCore import QCoreApplication, QEvent, SIGNAL
+    from py.taxon_classifier import STUB_MODEL
+
+    _qt_app = QCoreApplication.instance() or QCoreApplication([])
+    _worker = CVFrameWorker()
+    _old_workers = []
+    for _ in range(3):
+        _worker.enable_taxon_scanner(True, STUB_MODEL)
+        _old_workers.append((_worker._taxon_worker, _worker._taxon_thread))
+        assert _worker.receivers(SIGNAL("taxonSampled(QVariant)")) == 1
+        _worker.enable_taxon_scanner(False)
+        assert _worker._taxon_worker is None and _worker._taxon_thread is None
+        assert _worker.receivers(SIGNAL("taxonSampled(QVariant)")) == 0
+    QCoreApplication.sendPostedEvents(None, QEvent.Type.DeferredDelete)
+    assert not any(shiboken6.isValid(o) for _pair in _old_workers for o in _pair), "old taxon workers not deleted"
+    print("taxon scanner off/on checks passed")
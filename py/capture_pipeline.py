@@ -0,0 +1,215 @@
+"""
+capture_pipeline.py: everything that happens to a capture after it's written to disk, off the GUI thread.
+
+    imageSaved --> ExifTagWorker (tag selection data into the jpg) --> ImageStoreWorker (insert to IMAGES, read the
+    row back from IMAGES_VW) --> ThumbnailWorker (see thumbnails.py) --> imageStored, row handed to ImagesModel
+    without re-running its query
+
+Each worker has its own QThread, and stages hand off through queued signals.  The store worker opens its own
+sqlite connection on its thread (Qt connections can't be shared across threads).  The pipeline counts captures
+in flight; once MAX_PENDING_CAPTURES are queued it reports isBacklogged, and CamControls stops taking new
+captures until the backlog drains, rather than letting the queues grow through a busy haul.
+"""
+# standard imports
+from datetime import datetime
+import os
+
+# local imports
+from py.logger import Logger
+from py.utils import Utils
+from py.jpeg_exif import tag_jpg_with_json
+from py.thumbnails import ThumbnailWorker
+
+# 3rd party imports
+from PySide6.QtCore import QObject, Qt, QMetaObject, QThread, Signal, Slot
+from PySide6.QtSql import QSqlDatabase, QSqlQuery
+
+MAX_PENDING_CAPTURES = 6  # captures saved but not yet in the model before we stop taking new ones
+STORE_CONNECTION_NAME = 'fram_cam_capture_store'
+
+
+class ExifTagWorker(QObject):
+    """
+    first stage: tag each capture with the data selection it was taken for, so the file is self describing
+    """
+    tagged = Signal(str, "QVariant", arguments=['path', 'image_data'])  # passed on whether tagging worked or not
+
+    def __init__(self):
+        super().__init__()
+        self._logger = Logger.get_root()
+
+    @Slot(str, "QVariant")
+    def tag(self, path: str, image_data: dict):
+        try:
+            tag_jpg_with_json(path, image_data)
+        except Exception as e:
+            self._logger.error(f"Unable to exif tag {path}, storing untagged: {e}")
+        self.tagged.emit(path, image_data)
+
+    @Slot()
+    def flush(self):
+        """
+        no-op, invoked blocking at shutdown so everything queued before it has been tagged (and passed on)
+        """
+
+
+class ImageStoreWorker(QObject):
+    """
+    second stage: insert the IMAGES row on a connection of our own, then read back the IMAGES_VW row for the model
+    """
+    stored = Signal(str, "QVariant", arguments=['path', 'row'])  # IMAGES_VW row as a dict, lower case keys like the model
+    storeFailed = Signal(str, str, arguments=['path', 'error'])
+
+    def __init__(self, db_path: str):
+        super().__init__()
+        self._logger = Logger.get_root()
+        self._db_path = db_path
+        self._db = None
+        self._columns = set()
+
+    @Slot()
+    def open(self):
+        """
+        connect to thread.started, the connection has to be made on the thread that uses it
+        """
+        self._db = QSqlDatabase.addDatabase('QSQLITE', STORE_CONNECTION_NAME)
+        self._db.setDatabaseName(self._db_path)
+        self._db.setConnectOptions('QSQLITE_BUSY_TIMEOUT=5000')  # the GUI connection writes to the same file
+        if not self._db.open():
+            self._logger.error(f"Capture store unable to open {self._db_path}: {self._db.lastError().text()}")
+            return
+        _record = self._db.record('IMAGES')
+        self._columns = {_record.fieldName(i).upper() for i in range(_record.count())}
+
+    @Slot()
+    def close(self):
+        """
+        invoked blocking at shutdown, after anything already queued has been stored
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        QSqlDatabase.removeDatabase(STORE_CONNECTION_NAME)
+
+    @Slot(str, "QVariant")
+    def store(self, path: str, image_data: dict):
+        """
+        :param path: str, full path to the saved image
+        :param image_data: dict, IMAGES column name --> value, from DataSelector.cur_selection_data
+        """
+        try:
+            if self._db is None or not self._db.isOpen():
+                raise RuntimeError("capture store database connection isn't open")
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"newly captured image not found at {path}")
+
+            _values = {k.upper(): v for k, v in image_data.items() if v is not None and k.upper() in self._columns}
+            _values.update({
+                'FILE_PATH': os.path.dirname(path),
+                'FILE_NAME': os.path.basename(path),
+                'CAPTURED_DT': datetime.now().isoformat(timespec="seconds")
+            })
+            _query = QSqlQuery(self._db)
+            _query.prepare(f"insert into IMAGES ({', '.join(_values)}) values ({', '.join(':' + k for k in _values)})")
+            for k, v in _values.items():
+                _query.bindValue(f':{k}', v)
+            if not _query.exec():
+                raise RuntimeError(_query.lastError().text())
+            _image_id = _query.lastInsertId()
+
+            _query = QSqlQuery(self._db)
+            _query.prepare("select * from IMAGES_VW where image_id = :image_id")
+            _query.bindValue(':image_id', _image_id)
+            if not _query.exec() or not _query.next():
+                raise RuntimeError(f"IMAGE_ID {_image_id} not found in IMAGES_VW: {_query.lastError().text()}")
+
+            self._logger.info(f"New IMAGES record created with IMAGE_ID = {_image_id} for {path}")
+            self.stored.emit(path, Utils.qrec_to_dict(_query.record()))
+
+        except Exception as e:
+            self._logger.error(f"Unable to store captured image {path}: {e}")
+            self.storeFailed.emit(path, str(e))
+
+
+class CapturePipeline(QObject):
+    """
+    runs on the GUI thread, owns the worker threads:
+
+        pipeline.submit(path, image_data)  when a capture is saved
+        pipeline.imageStored  --> row dict ready for ImagesModel
+        pipeline.is_backlogged  check before starting another capture
+    """
+    tagRequested = Signal(str, "QVariant")  # queued to the exif worker
+    imageStored = Signal("QVariant", arguments=['row'])
+    backlogChanged = Signal()
+
+    def __init__(self, db_path: str, max_pending: int = MAX_PENDING_CAPTURES, parent=None):
+        super().__init__(parent)
+        self._logger = Logger.get_root()
+        self._max_pending = max_pending
+        self._pending = set()  # paths submitted but not yet stored (or failed)
+
+        self._tag_worker = ExifTagWorker()
+        self._tag_thread = QThread()
+        self._tag_worker.moveToThread(self._tag_thread)
+        self._store_worker = ImageStoreWorker(db_path)
+        self._store_thread = QThread()
+        self._store_worker.moveToThread(self._store_thread)
+        self._thumbnail_worker = ThumbnailWorker()
+        self._thumbnail_thread = QThread()
+        self._thumbnail_worker.moveToThread(self._thumbnail_thread)
+
+        self.tagRequested.connect(self._tag_worker.tag)
+        self._tag_worker.tagged.connect(self._store_worker.store)  # worker to worker, never touches this thread
+        self._store_thread.started.connect(self._store_worker.open)
+        self._store_worker.stored.connect(self._thumbnail_worker.write)
+        self._thumbnail_worker.written.connect(self._on_stored)  # bound methods, so these run queued on this thread
+        self._store_worker.storeFailed.connect(self._on_store_failed)
+        self._tag_thread.start()
+        self._store_thread.start()
+        self._thumbnail_thread.start()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def is_backlogged(self) -> bool:
+        return len(self._pending) >= self._max_pending
+
+    def submit(self, path: str, image_data: dict):
+        """
+        queue a saved capture; never refused, since it's already on disk - new captures are held off instead
+        :param path: str, full path to the saved image
+        :param image_data: dict, IMAGES column name --> value for the current data selection
+        """
+        _was_backlogged = self.is_backlogged
+        self._pending.add(path)
+        self.tagRequested.emit(path, dict(image_data))
+        if self.is_backlogged != _was_backlogged:
+            self._logger.warning(f"Capture pipeline backlogged, {self.pending} captures in flight")
+            self.backlogChanged.emit()
+
+    def _on_stored(self, path: str, row: dict):
+        self._finish(path)
+        self.imageStored.emit(row)
+
+    def _on_store_failed(self, path: str, error: str):
+        self._finish(path)
+
+    def _finish(self, path: str):
+        _was_backlogged = self.is_backlogged
+        self._pending.discard(path)
+        if self.is_backlogged != _was_backlogged:
+            self.backlogChanged.emit()
+
+    def shutdown(self):
+        """
+        store whatever is still queued, then stop the worker threads; call on app exit
+        """
+        QMetaObject.invokeMethod(self._tag_worker, 'flush', Qt.BlockingQueuedConnection)
+        QMetaObject.invokeMethod(self._store_worker, 'close', Qt.BlockingQueuedConnection)
+        QMetaObject.invokeMethod(self._thumbnail_worker, 'flush', Qt.BlockingQueuedConnection)
+        for _thread in (self._tag_thread, self._store_thread, self._thumbnail_thread):
+            _thread.quit()
+            _thread.wait()
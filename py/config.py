@@ -19,8 +19,14 @@ DATA_DIR = os.path.join(HOME_DIR, 'data')  # sqlite + data produced by the app l
 IMAGES_DIR = os.path.join(DATA_DIR, 'images')  # captured images, subdir of "data"
 os.makedirs(IMAGES_DIR, exist_ok=True)
 
+THUMBNAILS_DIR = os.path.join(DATA_DIR, 'thumbnails')  # <IMAGE_ID>.jpg thumbnails, see thumbnails.py
+os.makedirs(THUMBNAILS_DIR, exist_ok=True)
+
 LOCAL_DB_PATH = os.path.join(DATA_DIR, 'fram_cam.db')  # path to sqlite file
 
+MODELS_DIR = os.path.join(DATA_DIR, 'models')  # optional ML models, see taxon_classifier.py
+TAXON_MODEL_PATH = os.path.join(MODELS_DIR, 'taxon.onnx')  # class names in taxon.labels.txt next to it
+
 LOGS_DIR = os.path.join(HOME_DIR, 'logs')  # logging writes to files here, should be one file per day, per machine
 os.makedirs(LOGS_DIR, exist_ok=True)
 
@@ -0,0 +1,196 @@
+"""
+decoder_pool.py: optional backend that runs barcode decodes in a small pool of processes.
+
+Preprocessing and zbar decoding hold the GIL for most of their runtime, so on the frame processor thread they
+compete with the Qt/QML main thread.  Grayscale frames are copied once into a shared memory slot, the decode
+runs in another process, and results come back asynchronously via the decoded signal.
+"""
+# standard imports
+import atexit
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import threading
+import time
+
+# local imports
+from py.logger import Logger
+from py.barcode_scanner import DecodeCascade, DECODE_STAGES
+
+# 3rd party imports
+from PySide6.QtCore import QObject, Signal
+import numpy as np
+
+DEFAULT_SLOT_BYTES = 1280 * 720  # big enough for a single channel 720p frame
+
+# per process state for pool workers, set up by _init_decoder_process
+_cascade = None
+_attached_slots = {}
+
+
+def _init_decoder_process(stages):
+    """
+    runs once in each pool process
+    :param stages: decode cascade stage names, in order
+    """
+    global _cascade
+    _cascade = DecodeCascade(stages)
+
+
+def _attach_slot(slot_name: str) -> shared_memory.SharedMemory:
+    """
+    attach to a parent owned shared memory slot once, and re-use it for later frames
+    """
+    if slot_name not in _attached_slots:
+        _shm = shared_memory.SharedMemory(name=slot_name)
+        if os.name == 'posix':
+            # before 3.13, attaching registers the segment with the resource tracker as if we owned it,
+            # which unlinks it out from under the parent when this process exits
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(_shm._name, 'shared_memory')
+        _attached_slots[slot_name] = _shm
+    return _attached_slots[slot_name]
+
+
+def _decode_slot(slot_name: str, shape: tuple) -> tuple:
+    """
+    pool worker function, decode the frame sitting in a shared memory slot
+    :param slot_name: name of SharedMemory block
+    :param shape: (height, width) of the grayscale frame at the start of the block
+    :return: tuple (barcode str or None, list of [x, y] points or None, stage name or None, decode seconds)
+    """
+    _start = time.perf_counter()
+    _gray = np.ndarray(shape, dtype=np.uint8, buffer=_attach_slot(slot_name).buf)
+    _barcode, _points, _stage = _cascade.decode(_gray)
+    del _gray  # don't hold an export on the shared buffer between jobs
+    return _barcode, _points.tolist() if _points is not None else None, _stage, time.perf_counter() - _start
+
+
+class DecoderPool(QObject):
+    """
+    Owns the process pool and one shared memory slot per process.  submit() copies a grayscale frame into
+    a free slot and hands the slot to a pool process; if every slot is still busy the frame is dropped, the
+    same way the FrameScheduler drops stale frames.  The decoded signal is emitted from the pool's result
+    thread with a dict of barcode, points, stage, seconds and whatever context was passed to submit().
+    """
+    decoded = Signal("QVariant", arguments=['result'])
+
+    def __init__(self, processes: int = 2, stages=DECODE_STAGES, slot_bytes: int = DEFAULT_SLOT_BYTES, parent=None):
+        """
+        :param processes: int, number of decoder processes
+        :param stages: decode cascade stage names each process should use
+        :param slot_bytes: int, size of each shared memory slot
+        """
+        super().__init__(parent)
+        self._logger = Logger.get_root()
+        self._processes = processes
+        self._stages = list(stages)
+        self._slot_bytes = slot_bytes
+        self._executor = None
+        self._slots = []
+        self._free_slots = deque()
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._frames_submitted = 0
+        self._frames_dropped = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def counters(self) -> dict:
+        return {'submitted': self._frames_submitted, 'dropped': self._frames_dropped}
+
+    def start(self):
+        if self._executor is not None:
+            return
+
+        self._logger.info(f"Starting barcode decoder pool with {self._processes} processes")
+        self._create_slots(self._slot_bytes)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._processes,
+            mp_context=multiprocessing.get_context('spawn'),  # what windows does anyway, fork + Qt threads don't mix
+            initializer=_init_decoder_process,
+            initargs=(self._stages,)
+        )
+        atexit.register(self.close)
+
+    def close(self):
+        """
+        stop the pool and free shared memory, safe to call more than once
+        """
+        if self._executor is None:
+            return
+
+        self._logger.info("Stopping barcode decoder pool")
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        self._destroy_slots()
+        atexit.unregister(self.close)
+
+    def _create_slots(self, slot_bytes: int):
+        self._slot_bytes = slot_bytes
+        self._slots = [shared_memory.SharedMemory(create=True, size=slot_bytes) for _ in range(self._processes)]
+        self._free_slots = deque(self._slots)
+
+    def _destroy_slots(self):
+        for _shm in self._slots:
+            _shm.close()
+            _shm.unlink()
+        self._slots = []
+        self._free_slots = deque()
+
+    def submit(self, gray: np.ndarray, context=None) -> bool:
+        """
+        :param gray: single channel uint8 image array, doesn't need to be contiguous
+        :param context: anything, returned untouched in the decoded result
+        :return: bool, False if the frame was dropped because all decoders are busy
+        """
+        if self._executor is None:
+            return False
+
+        with self._lock:
+            if gray.nbytes > self._slot_bytes and len(self._free_slots) == len(self._slots):
+                self._logger.info(f"Resizing decoder slots for {gray.shape} frames")
+                self._destroy_slots()
+                self._create_slots(gray.nbytes)
+
+            if not self._free_slots or gray.nbytes > self._slot_bytes:
+                self._frames_dropped += 1
+                return False
+
+            _slot = self._free_slots.popleft()
+
+        np.copyto(np.ndarray(gray.shape, dtype=np.uint8, buffer=_slot.buf), gray)
+        _job_id = next(self._job_ids)
+        self._frames_submitted += 1
+        _future = self._executor.submit(_decode_slot, _slot.name, gray.shape)
+        _future.add_done_callback(lambda f: self._on_job_done(f, _slot, _job_id, context))
+        return True
+
+    def _on_job_done(self, future, slot, job_id, context):
+        with self._lock:
+            if slot in self._slots:  # could have been resized/closed while in flight
+                self._free_slots.append(slot)
+
+        if future.cancelled():
+            return
+
+        try:
+            _barcode, _points, _stage, _seconds = future.result()
+        except Exception as e:
+            self._logger.error(f"Barcode decoder process failed on job {job_id}: {e}")
+            return
+
+        self.decoded.emit({
+            'job_id': job_id,
+            'barcode': _barcode,
+            'points': _points,
+            'stage': _stage,
+            'seconds': _seconds,
+            'context': context
+        })
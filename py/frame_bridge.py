@@ -0,0 +1,200 @@
+"""
+frame_bridge.py: get pixels out of (and back into) QVideoFrames as numpy arrays, without going through QImage.
+
+While a frame is mapped, its planes are exposed as numpy views straight onto the mapped memory, so
+barcode scanning can run on the luminance (Y) plane of NV12/YUV420 frames with no copy and no color conversion.
+Views are only valid until the frame is unmapped; anything that needs to outlive the mapping must copy.
+
+Color arrays produced/consumed here are RGB, which is what the araviq6 conversion this replaces handed to CVFrameWorker.
+"""
+# local imports
+from py.logger import Logger
+
+# 3rd party imports
+import cv2
+import numpy as np
+from PySide6.QtCore import QSize
+from PySide6.QtGui import QImage
+from PySide6.QtMultimedia import QVideoFrame, QVideoFrameFormat
+
+LOGGER = Logger.get_root()
+
+_PF = QVideoFrameFormat.PixelFormat
+PLANAR_LUMA_FORMATS = (  # Y is plane 0, one byte per pixel
+    _PF.Format_NV12, _PF.Format_NV21, _PF.Format_YUV420P, _PF.Format_YV12,
+    _PF.Format_IMC1, _PF.Format_IMC2, _PF.Format_IMC3, _PF.Format_IMC4, _PF.Format_Y8
+)
+PACKED_LUMA_FORMATS = {  # Y interleaved with chroma, extracted with a compact single channel copy
+    _PF.Format_YUYV: cv2.COLOR_YUV2GRAY_YUYV,
+    _PF.Format_UYVY: cv2.COLOR_YUV2GRAY_UYVY
+}
+PACKED_RGB_FORMATS = {  # 4 bytes per pixel, slice of the byte order that gives R, G, B
+    _PF.Format_RGBA8888: slice(0, 3),
+    _PF.Format_RGBX8888: slice(0, 3),
+    _PF.Format_BGRA8888: slice(2, None, -1),
+    _PF.Format_BGRX8888: slice(2, None, -1),
+    _PF.Format_ARGB8888: slice(1, 4),
+    _PF.Format_XRGB8888: slice(1, 4),
+    _PF.Format_ABGR8888: slice(3, 0, -1),
+    _PF.Format_XBGR8888: slice(3, 0, -1)
+}
+
+
+class MappedFrame:
+    """
+    context manager to map a QVideoFrame for the duration of a with block:
+
+        with MappedFrame(frame) as mapped:
+            if mapped.is_mapped:
+                y = luma_view(frame)
+    """
+    def __init__(self, frame: QVideoFrame, mode=QVideoFrame.MapMode.ReadOnly):
+        self._frame = frame
+        self._mode = mode
+        self.is_mapped = False
+
+    def __enter__(self):
+        self.is_mapped = self._frame.isValid() and self._frame.map(self._mode)
+        if not self.is_mapped:
+            LOGGER.warning(f"Unable to map video frame ({self._frame.pixelFormat()})")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.is_mapped:
+            self._frame.unmap()
+        return False
+
+
+def plane_view(frame: QVideoFrame, plane: int, rows: int, row_bytes: int) -> np.ndarray:
+    """
+    :param frame: mapped QVideoFrame
+    :param plane: int, plane index
+    :param rows: int, number of rows in the plane
+    :param row_bytes: int, bytes of actual pixel data per row (excluding stride padding)
+    :return: rows x row_bytes uint8 view onto the mapped plane
+    """
+    _stride = frame.bytesPerLine(plane)
+    _buf = np.frombuffer(frame.bits(plane), dtype=np.uint8, count=_stride * rows)
+    return _buf.reshape(rows, _stride)[:, :row_bytes]
+
+
+def luma_view(frame: QVideoFrame):
+    """
+    :param frame: mapped QVideoFrame
+    :return: height x width uint8 luminance array; a zero copy view for planar formats, a compact copy for
+        packed YUV formats, or None if the format doesn't carry a Y channel
+    """
+    _format = frame.pixelFormat()
+    _width, _height = frame.width(), frame.height()
+    if _format in PLANAR_LUMA_FORMATS:
+        return plane_view(frame, 0, _height, _width)
+
+    if _format in PACKED_LUMA_FORMATS:
+        _packed = plane_view(frame, 0, _height, _width * 2).reshape(_height, _width, 2)
+        return cv2.cvtColor(_packed, PACKED_LUMA_FORMATS[_format])
+
+    return None
+
+
+PLANE_ROWS = {  # rows in each plane, as a fraction of frame height, for formats planes_to_rgb handles
+    _PF.Format_NV12: (1, 0.5), _PF.Format_NV21: (1, 0.5),
+    _PF.Format_YUV420P: (1, 0.5, 0.5), _PF.Format_YV12: (1, 0.5, 0.5),
+    _PF.Format_YUYV: (1,), _PF.Format_UYVY: (1,), _PF.Format_Y8: (1,),
+    **{f: (1,) for f in PACKED_RGB_FORMATS}
+}
+
+
+def frame_planes(frame: QVideoFrame) -> list:
+    """
+    :param frame: mapped QVideoFrame, in one of the PLANE_ROWS formats
+    :return: list of rows x bytes per line uint8 views, one per plane, stride padding included
+    """
+    _rows = PLANE_ROWS[frame.pixelFormat()]
+    return [plane_view(frame, p, int(frame.height() * r), frame.bytesPerLine(p)) for p, r in enumerate(_rows)]
+
+
+def planes_to_rgb(pixel_format, width: int, height: int, planes: list) -> np.ndarray:
+    """
+    convert raw planes (mapped, or copied out of a frame earlier, see FrameRingBuffer) to RGB
+    :param pixel_format: QVideoFrameFormat.PixelFormat, one of the PLANE_ROWS formats
+    :param width: int, frame width in px
+    :param height: int, frame height in px
+    :param planes: list of rows x bytes per line uint8 arrays, as from frame_planes
+    :return: height x width x 3 uint8 RGB array; a view for packed RGB formats, else a new array
+    """
+    if pixel_format in (_PF.Format_NV12, _PF.Format_NV21):
+        _y = planes[0][:, :width]
+        _uv = planes[1][:, :width].reshape(height // 2, width // 2, 2)
+        _code = cv2.COLOR_YUV2RGB_NV12 if pixel_format == _PF.Format_NV12 else cv2.COLOR_YUV2RGB_NV21
+        return cv2.cvtColorTwoPlane(_y, _uv, _code)
+
+    if pixel_format in (_PF.Format_YUV420P, _PF.Format_YV12):
+        # opencv wants the three planes packed one after another, chroma planes are half width
+        _packed = np.concatenate([planes[0][:, :width].ravel(), planes[1][:, :width // 2].ravel(),
+                                  planes[2][:, :width // 2].ravel()]).reshape(height * 3 // 2, width)
+        _code = cv2.COLOR_YUV2RGB_I420 if pixel_format == _PF.Format_YUV420P else cv2.COLOR_YUV2RGB_YV12
+        return cv2.cvtColor(_packed, _code)
+
+    if pixel_format in PACKED_LUMA_FORMATS:
+        _packed = planes[0][:, :width * 2].reshape(height, width, 2)
+        _code = cv2.COLOR_YUV2RGB_YUYV if pixel_format == _PF.Format_YUYV else cv2.COLOR_YUV2RGB_UYVY
+        return cv2.cvtColor(_packed, _code)
+
+    if pixel_format == _PF.Format_Y8:
+        return cv2.cvtColor(planes[0][:, :width], cv2.COLOR_GRAY2RGB)
+
+    if pixel_format in PACKED_RGB_FORMATS:
+        _pixels = planes[0][:, :width * 4].reshape(height, width, 4)
+        return _pixels[:, :, PACKED_RGB_FORMATS[pixel_format]]
+
+    raise ValueError(f"Unsupported pixel format for planes_to_rgb: {pixel_format}")
+
+
+def frame_to_rgb(frame: QVideoFrame) -> np.ndarray:
+    """
+    color array for effects that need it.  A view where the frame is already packed RGB in memory,
+    otherwise a single conversion straight from the mapped planes.
+    :param frame: mapped QVideoFrame
+    :return: height x width x 3 uint8 RGB array
+    """
+    _format = frame.pixelFormat()
+    if _format in PLANE_ROWS:
+        return planes_to_rgb(_format, frame.width(), frame.height(), frame_planes(frame))
+
+    # anything else (P010, YUV422P, jpeg...) goes the slow way via QImage
+    return qimage_to_rgb(frame.toImage())
+
+
+def qimage_to_rgb(image: QImage) -> np.ndarray:
+    """
+    :param image: QImage, any format
+    :return: height x width x 3 uint8 RGB array, a copy that doesn't depend on the image
+    """
+    _img = image.convertToFormat(QImage.Format.Format_RGB888)
+    _buf = np.frombuffer(_img.constBits(), dtype=np.uint8, count=_img.bytesPerLine() * _img.height())
+    return _buf.reshape(_img.height(), _img.bytesPerLine())[:, :_img.width() * 3].reshape(_img.height(), _img.width(), 3).copy()
+
+
+def array_to_qvideoframe(array: np.ndarray) -> QVideoFrame:
+    """
+    build a new QVideoFrame for display, writing pixels straight into its mapped memory
+    :param array: height x width uint8 gray array (written as Y8) or height x width x 3 RGB array (written as RGBA)
+    :return: QVideoFrame
+    """
+    _height, _width = array.shape[:2]
+    _is_gray = array.ndim == 2
+    _format = QVideoFrameFormat(QSize(_width, _height), _PF.Format_Y8 if _is_gray else _PF.Format_RGBA8888)
+    _frame = QVideoFrame(_format)
+    with MappedFrame(_frame, QVideoFrame.MapMode.WriteOnly) as _mapped:
+        if not _mapped.is_mapped:
+            return _frame
+
+        if _is_gray:
+            np.copyto(plane_view(_frame, 0, _height, _width), array)
+        else:
+            _dest = plane_view(_frame, 0, _height, _width * 4).reshape(_height, _width, 4)
+            _rgba = cv2.cvtColor(array, cv2.COLOR_RGB2RGBA, dst=_dest)
+            if not np.may_share_memory(_rgba, _dest):  # cv2 couldn't write in place
+                np.copyto(_dest, _rgba)
+
+    return _frame
@@ -0,0 +1,160 @@
+"""
+frame_ring_buffer.py: zero shutter lag capture from the last second or so of camera frames.
+
+By the time QImageCapture has a still, the tag the user tapped for may have slid out of frame.  While zero
+shutter lag is on (it's off by default), CamControls feeds every camera frame into a FrameRingBuffer; on a tap,
+the frame(s) nearest the tap time are converted and handed to a BurstWorker to save, so the saved image is what
+was on screen when the button was pressed.
+
+Memory is one block, allocated once for the configured byte budget and carved into as many frame sized
+slots as fit, so the buffer cannot grow no matter how long the camera runs.  Frames are stored as raw planes
+and only converted to RGB at capture time.  Note these are viewfinder frames, so "full resolution" means the
+camera's video resolution, not the (possibly larger) still resolution QImageCapture would use.
+"""
+# standard imports
+import threading
+
+# local imports
+from py.logger import Logger
+from py.frame_bridge import MappedFrame, PLANE_ROWS, frame_planes, planes_to_rgb
+
+# 3rd party imports
+import numpy as np
+from PySide6.QtCore import QObject, Signal, Slot
+from PySide6.QtMultimedia import QVideoFrame
+
+DEFAULT_BUFFER_MB = 64
+MAX_PENDING_FRAMES = 2  # frames queued to the buffer thread but not yet copied in; skip new ones past this
+
+
+class FrameRingBuffer(QObject):
+    """
+    ring of recent camera frames, lives on its own QThread; CamControls talks to it through queued signals:
+
+        push_frame(frame, timestamp)  copy a frame into the oldest slot
+        capture_nearest(timestamp, path, count)  emit framesReady with the count frames nearest timestamp
+    """
+    framesReady = Signal("QVariant", str, arguments=['images', 'path'])  # list of RGB arrays, nearest first
+    captureFailed = Signal(str, str, arguments=['path', 'reason'])
+
+    def __init__(self, buffer_mb: int = DEFAULT_BUFFER_MB):
+        """
+        :param buffer_mb: int, byte budget in MB for stored frames
+        """
+        super().__init__()
+        self._logger = Logger.get_root()
+        self._lock = threading.Lock()  # pending count is bumped from the camera (main) thread
+        self._pending = 0
+        self._block = None
+        self._byte_budget = 0
+        self._layout = None  # (pixel format, width, height, ((rows, bytes per line), ...)) slots are sized for
+        self._slot_bytes = 0
+        self._timestamps = np.empty(0, dtype=np.float64)
+        self._next_slot = 0
+        self.set_buffer_mb(buffer_mb)
+
+    def reserve_push(self) -> bool:
+        """
+        called on the camera thread before queueing a frame to push_frame, so a busy buffer thread doesn't pile
+        up references to camera buffers (the camera backend only has a few)
+        :return: bool, True if the frame should be queued
+        """
+        with self._lock:
+            if self._pending >= MAX_PENDING_FRAMES:
+                return False
+            self._pending += 1
+            return True
+
+    @Slot(int)
+    def set_buffer_mb(self, buffer_mb: int):
+        """
+        (re)allocate the block; 0 frees it
+        :param buffer_mb: int, new budget in MB
+        """
+        _budget = max(int(buffer_mb), 0) * 1024 * 1024
+        if _budget == self._byte_budget:
+            return
+        self._block = None  # let the old block go before allocating the new one
+        self._block = np.empty(_budget, dtype=np.uint8) if _budget else None
+        self._byte_budget = _budget
+        self._layout = None
+        self._timestamps = np.empty(0, dtype=np.float64)
+        self._logger.info(f"Frame ring buffer budget set to {buffer_mb}MB")
+
+    @Slot(QVideoFrame, float)
+    def push_frame(self, frame: QVideoFrame, timestamp: float):
+        """
+        copy frame planes into the oldest slot
+        :param frame: QVideoFrame from the camera sink
+        :param timestamp: float, time.perf_counter() when the frame arrived
+        """
+        with self._lock:
+            self._pending = max(self._pending - 1, 0)
+        if self._block is None:
+            return
+
+        with MappedFrame(frame, QVideoFrame.MapMode.ReadOnly) as _mapped:
+            if not _mapped.is_mapped or frame.pixelFormat() not in PLANE_ROWS:
+                return
+            _planes = frame_planes(frame)
+            _layout = (frame.pixelFormat(), frame.width(), frame.height(), tuple(p.shape for p in _planes))
+            if _layout != self._layout:
+                self._set_layout(_layout)
+            if not len(self._timestamps):
+                return  # a single frame doesn't fit in the budget
+
+            _offset = self._next_slot * self._slot_bytes
+            for _plane in _planes:
+                _dst = self._block[_offset:_offset + _plane.size].reshape(_plane.shape)
+                np.copyto(_dst, _plane)
+                _offset += _plane.size
+
+        self._timestamps[self._next_slot] = timestamp
+        self._next_slot = (self._next_slot + 1) % len(self._timestamps)
+
+    @Slot(float, str, int)
+    def capture_nearest(self, timestamp: float, path: str, count: int = 1):
+        """
+        :param timestamp: float, time.perf_counter() of the capture tap
+        :param path: str, where the caller will save the image, passed back with the result
+        :param count: int, how many frames nearest the tap to hand back (burst mode keeps the sharpest)
+        """
+        _held = np.flatnonzero(self._timestamps > -np.inf)
+        if not len(_held):
+            self.captureFailed.emit(path, "no frames buffered")
+            return
+        try:
+            _nearest = _held[np.argsort(np.abs(self._timestamps[_held] - timestamp))][:max(count, 1)]
+            _images = [self._slot_to_rgb(s) for s in _nearest]
+            self._logger.info(f"ZSL capture: {len(_images)} frame(s), nearest "
+                              f"{abs(self._timestamps[_nearest[0]] - timestamp) * 1000:.0f}ms from tap")
+            self.framesReady.emit(_images, path)
+        except Exception as e:
+            self._logger.error(f"Unable to pull frames from ring buffer: {e}")
+            self.captureFailed.emit(path, str(e))
+
+    def _set_layout(self, layout: tuple):
+        """
+        re-slot the existing block for a new frame format/size, nothing is reallocated
+        """
+        self._layout = layout
+        self._slot_bytes = sum(r * b for r, b in layout[3])
+        _slots = self._byte_budget // self._slot_bytes
+        self._timestamps = np.full(_slots, -np.inf, dtype=np.float64)
+        self._next_slot = 0
+        if _slots:
+            self._logger.info(f"Frame ring buffer holds {_slots} frames of {layout[1]}x{layout[2]} "
+                              f"({self._slot_bytes / 1024 / 1024:.1f}MB each)")
+        else:
+            self._logger.warning(f"{layout[1]}x{layout[2]} frame doesn't fit in the "
+                                 f"{self._byte_budget / 1024 / 1024:.0f}MB ring buffer, ZSL disabled")
+
+    def _slot_to_rgb(self, slot: int) -> np.ndarray:
+        _pixel_format, _width, _height, _shapes = self._layout
+        _planes = []
+        _offset = slot * self._slot_bytes
+        for _rows, _bytes_per_line in _shapes:
+            _size = _rows * _bytes_per_line
+            _planes.append(self._block[_offset:_offset + _size].reshape(_rows, _bytes_per_line))
+            _offset += _size
+        return np.ascontiguousarray(planes_to_rgb(_pixel_format, _width, _height, _planes))  # copy out of the slot
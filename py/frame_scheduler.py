@@ -0,0 +1,205 @@
+"""
+frame_scheduler.py: decide which camera frames actually get handed to the CVFrameWorker.
+
+The camera keeps pushing frames into the source sink at its native rate, and the preview is fed
+directly from that sink.  Anything we do in the frame processor (barcode scans in particular) should
+never fall behind the camera, so this class keeps at most one frame in flight, drops anything stale while
+the worker is busy, and rate limits barcode scans against a latency budget based on measured decode time.
+"""
+# standard imports
+import math
+import threading
+import time
+
+# local imports
+from py.logger import Logger
+
+# 3rd party imports
+from PySide6.QtCore import QObject, Signal
+from PySide6.QtMultimedia import QVideoFrame
+
+DEFAULT_FRAME_INTERVAL_S = 1 / 30  # assume 30 fps until we have measured the camera
+LATENCY_BUDGET_MS = 12  # avg ms of decode work we allow per camera frame interval
+MAX_SCAN_INTERVAL_FRAMES = 15  # always scan at least every N camera frames, however slow decode is
+STALE_DISPATCH_S = 1.0  # if the worker hasn't reported back after this long, stop waiting for it
+EMA_ALPHA = 0.2  # smoothing used for frame interval and decode time estimates
+
+
+class FrameScheduler(QObject):
+    """
+    Latest-frame mailbox between the capture session and the frame processor:
+
+        source sink --> submit() --> frameDispatched (processor) --> frame_done() --> next pending frame
+
+    While the worker is busy, incoming frames replace each other in a single pending slot (older ones are dropped),
+    so when the worker frees up it always gets the newest frame.  Barcode scanning is further limited so that the
+    average decode cost per camera frame stays under the latency budget; frames that only need scanning are not
+    dispatched at all when a scan isn't due.
+    """
+    frameDispatched = Signal(QVideoFrame, arguments=['frame'])  # connect to the frame processor
+
+    def __init__(self, latency_budget_ms: float = LATENCY_BUDGET_MS, parent=None):
+        """
+        :param latency_budget_ms: avg decode ms allowed per camera frame interval
+        """
+        super().__init__(parent)
+        self._logger = Logger.get_root()
+        self._latency_budget_ms = latency_budget_ms
+        self._lock = threading.Lock()  # decode timings are written from the worker thread
+
+        self._is_busy = False  # true while a frame is in flight in the processor
+        self._busy_since = None
+        self._pending_frame = None  # newest frame received while busy
+        self._process_every_frame = False  # effects like blur/sketch need every frame, not just scans
+        self._is_paused = False  # true while the feed is frozen, nothing is dispatched
+
+        self._last_frame_ts = None
+        self._frame_interval = None  # EMA of seconds between camera frames
+        self._scan_time = None  # EMA of seconds per barcode decode
+        self._next_scan_ts = 0.0
+
+        self._frames_received = 0
+        self._frames_dispatched = 0
+        self._frames_dropped = 0
+        self._frames_skipped = 0
+
+    @property
+    def process_every_frame(self) -> bool:
+        return self._process_every_frame
+
+    @process_every_frame.setter
+    def process_every_frame(self, status: bool):
+        self._process_every_frame = status
+
+    @property
+    def latency_budget_ms(self) -> float:
+        return self._latency_budget_ms
+
+    @latency_budget_ms.setter
+    def latency_budget_ms(self, budget_ms: float):
+        self._latency_budget_ms = max(1.0, float(budget_ms))
+
+    @property
+    def camera_fps(self) -> float:
+        return 1 / self._frame_interval if self._frame_interval else 0.0
+
+    @property
+    def scan_interval(self) -> float:
+        """
+        seconds between barcode scans, scaled up from the camera frame interval when decode is
+        more expensive than our latency budget allows
+        """
+        _frame_interval = self._frame_interval or DEFAULT_FRAME_INTERVAL_S
+        if not self._scan_time:
+            return _frame_interval
+
+        _frames_per_scan = math.ceil(self._scan_time * 1000 / self._latency_budget_ms)
+        return _frame_interval * min(max(1, _frames_per_scan), MAX_SCAN_INTERVAL_FRAMES)
+
+    @property
+    def counters(self) -> dict:
+        return {
+            'received': self._frames_received,
+            'dispatched': self._frames_dispatched,
+            'dropped': self._frames_dropped,
+            'skipped': self._frames_skipped
+        }
+
+    def scan_due(self, now: float = None) -> bool:
+        """
+        safe to call from the worker thread
+        :param now: perf_counter timestamp, defaults to now
+        :return: bool, has enough time passed since the last scan?
+        """
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            return now >= self._next_scan_ts
+
+    def record_scan(self, started: float, duration: float):
+        """
+        called by the worker after each decode, schedules the next one
+        :param started: perf_counter timestamp when the scan started
+        :param duration: seconds the scan took
+        """
+        with self._lock:
+            self._scan_time = duration if self._scan_time is None else \
+                EMA_ALPHA * duration + (1 - EMA_ALPHA) * self._scan_time
+            self._next_scan_ts = started + self.scan_interval
+
+    @property
+    def is_paused(self) -> bool:
+        return self._is_paused
+
+    def pause(self):
+        """
+        stop dispatching right away, e.g. on freeze frame; the frame in flight (if any) still finishes
+        """
+        self._is_paused = True
+        self._pending_frame = None
+
+    def resume(self):
+        self._is_paused = False
+        self._last_frame_ts = None  # don't count the pause as a frame interval
+
+    def reset(self):
+        """
+        forget anything in flight, use when the processor is disconnected or the camera changes
+        """
+        self._is_busy = False
+        self._busy_since = None
+        self._pending_frame = None
+        self._last_frame_ts = None
+
+    def _update_frame_interval(self, now: float):
+        if self._last_frame_ts is not None:
+            _interval = now - self._last_frame_ts
+            if 0 < _interval < STALE_DISPATCH_S:  # ignore gaps from camera restarts
+                self._frame_interval = _interval if self._frame_interval is None else \
+                    EMA_ALPHA * _interval + (1 - EMA_ALPHA) * self._frame_interval
+        self._last_frame_ts = now
+
+    def submit(self, frame):
+        """
+        connect to the source sink's videoFrameChanged
+        :param frame: QVideoFrame from camera
+        """
+        if self._is_paused:
+            return
+
+        _now = time.perf_counter()
+        self._update_frame_interval(_now)
+        self._frames_received += 1
+
+        if not self._process_every_frame and not self.scan_due(_now):
+            self._frames_skipped += 1  # nothing for the worker to do with this one
+            return
+
+        if self._is_busy and _now - self._busy_since < STALE_DISPATCH_S:
+            if self._pending_frame is not None:
+                self._frames_dropped += 1
+            self._pending_frame = frame
+            return
+
+        if self._is_busy:
+            self._logger.warning(f"Frame processor hasn't finished a frame in {STALE_DISPATCH_S}s, dispatching anyway")
+
+        self._send(frame, _now)
+
+    def _send(self, frame, now: float):
+        self._is_busy = True
+        self._busy_since = now
+        self._frames_dispatched += 1
+        self.frameDispatched.emit(frame)
+
+    def frame_done(self, *args):
+        """
+        connect to whatever signal the processor emits once a frame is finished, send the newest
+        frame we received in the meantime (if any)
+        """
+        if self._pending_frame is None:
+            self._is_busy = False
+            self._busy_since = None
+            return
+
+        _frame, self._pending_frame = self._pending_frame, None
+        self._send(_frame, time.perf_counter())
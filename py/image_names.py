@@ -0,0 +1,108 @@
+"""
+image_names.py: hand out the next free _img# file name for a capture without probing the disk for each one.
+
+Images for a whole season live in one flat IMAGES_DIR, a few hundred per specimen name, so checking _img1,
+_img2, ... until one doesn't exist gets slower with every capture.  ImageNameAllocator scans the directory once,
+remembers the highest number used for each name, and claims the next one with a single exclusive create.
+"""
+# standard imports
+import os
+import re
+import threading
+
+# local imports
+from py.logger import Logger
+
+SEQUENCE_PATTERN = re.compile(r'^(?P<stem>.*)_img(?P<seq>\d+)(?P<ext>\.[^.]+)$')
+MAX_CLAIM_ATTEMPTS = 1000  # only reached if something else is writing the same names as us
+
+
+class ImageNameAllocator:
+    """
+        path = allocator.allocate('W12345_Sablefish_Project.jpg')  # --> .../W12345_Sablefish_Project_img7.jpg
+        ...
+        allocator.release(path)  # capture failed, remove the empty placeholder
+
+    allocate() creates an empty placeholder file, so the name can't be handed out twice (even to another
+    process); the capture then overwrites it.  Numbers are never reused, even if images are deleted.
+    """
+    def __init__(self, directory: str):
+        """
+        :param directory: str, directory images are saved to
+        """
+        self._logger = Logger.get_root()
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._last_seq = None  # (normalized stem, ext) --> highest _img number in use, built on first allocate
+
+    def _key(self, stem: str, ext: str) -> tuple:
+        return os.path.normcase(stem), ext.lower()  # names are case insensitive on windows
+
+    def _build_index(self):
+        self._last_seq = {}
+        with os.scandir(self._directory) as _entries:
+            for _entry in _entries:
+                _match = SEQUENCE_PATTERN.match(_entry.name)
+                if _match:
+                    _key = self._key(_match['stem'], _match['ext'])
+                    self._last_seq[_key] = max(self._last_seq.get(_key, 0), int(_match['seq']))
+        self._logger.info(f"Indexed image numbers for {len(self._last_seq)} names in {self._directory}")
+
+    def allocate(self, file_name: str) -> str:
+        """
+        :param file_name: str, image name without a number, e.g. from CamControls._get_image_name
+        :return: str, full path <directory>/<stem>_img<next #><ext>, created empty and ours to write
+        """
+        _stem, _ext = os.path.splitext(file_name)
+        _match = SEQUENCE_PATTERN.match(file_name)
+        if _match:  # already numbered, allocate the next number for the same stem
+            _stem, _ext = _match['stem'], _match['ext']
+
+        with self._lock:
+            if self._last_seq is None:
+                self._build_index()
+            _key = self._key(_stem, _ext)
+            _seq = self._last_seq.get(_key, 0)
+            for _ in range(MAX_CLAIM_ATTEMPTS):
+                _seq += 1
+                _path = os.path.join(self._directory, f"{_stem}_img{_seq}{_ext}")
+                try:
+                    os.close(os.open(_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                except FileExistsError:
+                    continue  # written by something other than us since the index was built
+                self._last_seq[_key] = _seq
+                return _path
+
+        raise FileExistsError(f"No free image name for {file_name} after {MAX_CLAIM_ATTEMPTS} attempts")
+
+    def release(self, path: str):
+        """
+        remove a placeholder from allocate() if nothing was ever written to it
+        :param path: str, path returned by allocate
+        """
+        try:
+            if os.path.getsize(path) == 0:
+                os.remove(path)
+        except OSError as e:
+            self._logger.warning(f"Unable to remove image placeholder {path}: {e}")
+
+
+if __name__ == '__main__':
+    # allocation check: numbers continue from what's on disk, names are never handed out twice
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as _dir:
+        for _name in ('W123_Sablefish_img1.jpg', 'W123_Sablefish_img4.jpg', 'W123_Rockfish_img2.jpg'):
+            open(os.path.join(_dir, _name), 'w').close()
+
+        _allocator = ImageNameAllocator(_dir)
+        _first = _allocator.allocate('W123_Sablefish.jpg')
+        assert _first.endswith('W123_Sablefish_img5.jpg'), _first
+        open(os.path.join(_dir, 'W123_Sablefish_img6.jpg'), 'w').close()  # someone else grabbed the next one
+        assert _allocator.allocate('W123_Sablefish.jpg').endswith('_img7.jpg')
+        assert _allocator.allocate('W123_Rockfish.jpg').endswith('W123_Rockfish_img3.jpg')
+        assert _allocator.allocate('W123_Lingcod.jpg').endswith('W123_Lingcod_img1.jpg')
+        _allocator.release(_first)
+        assert not os.path.exists(_first)
+        assert _allocator.allocate('W123_Sablefish.jpg').endswith('_img8.jpg')  # released numbers aren't reused
+        print("ImageNameAllocator checks passed")
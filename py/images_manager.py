@@ -1,12 +1,17 @@
 
 
 # standard imports
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 import shutil
-import json
 
 # local imports
 from py.logger import Logger
+from py.config import LOCAL_DB_PATH
+from py.capture_pipeline import CapturePipeline
+from py.pipeline_stats import PipelineStats
+from py.resumable_transfer import copy_tagged
+from py.wheelhouse_sync import SyncManifest, COPY, METADATA, SKIP
 from py.qt_models import FramCamFilterProxyModel
 from py.images_model import ImagesModel
 
@@ -20,46 +25,61 @@ from PySide6.QtCore import (
     QRegularExpression
 )
 
-from PIL import Image
-import piexif
 
+COPY_WORKERS = 4  # files copied at once; wheelhouse writes are mostly waiting on the network
 
 
 class CopyFilesWorker(QObject):
     """
-    worker class to copy image files on threaded process
+    worker class to copy image files on threaded process; copies run on a pool of max_workers threads so
+    network writes overlap, signals are all emitted from the worker's own thread as each copy finishes.
+    With incremental on, files the destination's sync manifest says are already there unchanged are skipped
+    (reported as copied, without touching them), see wheelhouse_sync.py
     """
     copyStarted = Signal(int, arguments=['no_of_files'])  # tell progress bar how many files we are copying
     fileCopied = Signal(str, str, bool, arguments=['path', 'new_path', 'success'])  # for each file, emit once done
     copyEnded = Signal(int, int, arguments=['files_copied', 'files_failed'])  # emit when complete, to kill thread
     badDestinationPath = Signal(str, arguments=['path'])
 
-    def __init__(self):
+    def __init__(self, max_workers: int = COPY_WORKERS, incremental: bool = True, timings: PipelineStats = None):
+        """
+        :param timings: PipelineStats to record each copy's write and verify (read back) times to, if given
+        """
         super().__init__()
         self._logger = Logger.get_root()
+        self._max_workers = max(int(max_workers), 1)
+        self._incremental = incremental
+        self._timings = timings
         self._files_to_copy = []
         self._destination_folder = None
         self._images_subdir = None
         self._is_running = False
 
-    def tag_jpg_w_json_exif(self, src_img_path: str, dest_img_path: str, image_data: dict):
+    def tag_jpg_w_json_exif(self, src_img_path: str, dest_img_path: str, image_data: dict) -> str:
         """
         convert python dict to json, then insert into an image's UserComments exif tag
+        (only the exif segment is rewritten, the image data is streamed through; written to a checkpointed .part,
+        resumed if the link drops, and only renamed into place once its hash matches, see resumable_transfer.py)
         :param src_img_path: str, full path to image
         :param dest_img_path: str, full path to copy location
         :param image_data: dict
+        :return: str, digest of the image data copied
         """
         try:
-            _img = Image.open(src_img_path)
-            _exif_dict = piexif.load(_img.info.get("exif")) if 'exif' in _img.info else {}  # not all images have existing exif, so handle missing key
-            _exif_dict['Exif'] = {piexif.ExifIFD.UserComment: json.dumps(image_data).encode('utf-8')}
-            exif_bytes = piexif.dump(_exif_dict)
-            _img.save(dest_img_path, "jpeg", exif=exif_bytes)
-
+            return copy_tagged(src_img_path, dest_img_path, image_data, timings=self._timings)
         except Exception as e:
             self._logger.error(f"Problem tagging image with exif data: {e}")
             raise e  # catch this in outer scope
 
+    def _copy_file(self, image_item: dict) -> tuple:
+        """
+        runs on a pool thread
+        :param image_item: dict, images model row
+        :return: (str path copied to, str image data digest)
+        """
+        _new_path = os.path.join(self._images_subdir, os.path.basename(image_item['file_name']))
+        return _new_path, self.tag_jpg_w_json_exif(image_item['full_path'], _new_path, image_item)
+
     @property
     def destination_folder(self) -> str:
         """
@@ -99,23 +119,43 @@ class CopyFilesWorker(QObject):
             return
 
         os.makedirs(self._images_subdir, exist_ok=True)
-        self._logger.info(f"Copying {len(self._files_to_copy)} to {self._images_subdir}")
         self.copyStarted.emit(len(self._files_to_copy))
         self._is_running = True
 
-        for f in self._files_to_copy:
-            try:
-                _orig_path = f['full_path']
-                _new_path = os.path.join(self._images_subdir, os.path.basename(f['file_name']))
-                self.tag_jpg_w_json_exif(_orig_path, _new_path, f)
-                self._logger.info(f"File copied: {_orig_path} --> {_new_path}")
+        _manifest = SyncManifest.load(self._destination_folder)
+        if self._incremental:
+            _plan = _manifest.plan(self._files_to_copy, self._images_subdir)
+        else:
+            _plan = [(f, COPY) for f in self._files_to_copy]
+        _actions = {a: sum(1 for _, _a in _plan if _a == a) for a in (COPY, METADATA, SKIP)}
+        self._logger.info(f"Syncing {len(_plan)} files to {self._images_subdir} with {self._max_workers} workers: "
+                          f"{_actions[COPY]} to copy, {_actions[METADATA]} to re-tag, {_actions[SKIP]} up to date")
+
+        for f, _action in _plan:
+            if _action == SKIP:  # already there, but still report it so the model marks it backed up
                 _successes += 1
-                self.fileCopied.emit(_orig_path, _new_path, True)
-            except Exception as e:
-                self._logger.error(f"Error while copying {f}: {e}")
-                _fails += 1
-                self.fileCopied.emit(_orig_path, '', False)
+                _new_path = os.path.join(self._images_subdir, os.path.basename(f['file_name']))
+                self.fileCopied.emit(f['full_path'], _new_path, True)
+
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='wheelhouse_copy') as _pool:
+            _futures = {_pool.submit(self._copy_file, f): f for f, _action in _plan if _action != SKIP}
+            for _future in as_completed(_futures):
+                _orig_path = _futures[_future]['full_path']
+                try:
+                    _new_path, _image_hash = _future.result()
+                    _manifest.record(_futures[_future], _new_path, _image_hash)
+                    self._logger.info(f"File copied: {_orig_path} --> {_new_path}")
+                    _successes += 1
+                    self.fileCopied.emit(_orig_path, _new_path, True)
+                except Exception as e:
+                    self._logger.error(f"Error while copying {_futures[_future]}: {e}")
+                    _fails += 1
+                    self.fileCopied.emit(_orig_path, '', False)
 
+        try:
+            _manifest.save()
+        except OSError as e:
+            self._logger.error(f"Unable to save sync manifest, next sync will resend these files: {e}")
         self._is_running = False
         self.copyEnded.emit(_successes, _fails)
         self._logger.info(f"File copy completed: successes = {_successes}, failures = {_fails}")
@@ -132,6 +172,7 @@ class ImageManager(QObject):
     fileCopied = Signal(str, str, bool, arguments=['path', 'new_path', 'success'])
     copyEnded = Signal(int, int, arguments=['files_copied', 'files_failed'])
     badDestinationPath = Signal(str, arguments=['path'])
+    captureBacklogChanged = Signal()
 
     def __init__(self, db, app=None, parent=None):
         super().__init__(parent)
@@ -153,8 +194,12 @@ class ImageManager(QObject):
         self._load_images_model()
         self._filter_images_model()
 
-        # receive capture signal, which appends new image to model
-        self._app.cam_controls.imageCapture.imageSaved.connect(lambda ix, path: self._on_image_captured(path))  # dont need index from signal
+        # receive capture signal, tag/insert the new image off the GUI thread, then append it to the model
+        self._capture_pipeline = CapturePipeline(LOCAL_DB_PATH)
+        self._capture_pipeline.imageStored.connect(self._images_model.add_stored_image)
+        self._capture_pipeline.backlogChanged.connect(self.captureBacklogChanged.emit)
+        self._capture_pipeline.backlogChanged.connect(self._app.cam_controls.captureBacklogChanged.emit)
+        self._app.cam_controls.imageSaved.connect(lambda ix, path: self._on_image_captured(path))  # dont need index from signal
 
         # # threading stuff to copy image files
         self._file_copy_thread = None
@@ -191,6 +236,7 @@ class ImageManager(QObject):
         self._copy_files_worker.copyStarted.connect(self.copyStarted.emit)
         self._copy_files_worker.fileCopied.connect(self.fileCopied.emit)
         self._copy_files_worker.fileCopied.connect(self._images_model.setImageSyncPath)
+        self._copy_files_worker.copyEnded.connect(self._images_model.applySyncResults)  # after the last fileCopied
         self._copy_files_worker.copyEnded.connect(self.copyEnded.emit)
         self._copy_files_worker.copyEnded.connect(self._copy_files_thread.quit)
         self._copy_files_worker.badDestinationPath.connect(self.badDestinationPath)
@@ -254,11 +300,20 @@ class ImageManager(QObject):
 
     def _on_image_captured(self, image_path: str):
         """
-        when signal is received from cam_controls that an image was taken, add to model
+        when signal is received from cam_controls that an image was taken, queue it to be tagged and inserted;
+        the model gets the row once it's stored (imageStored)
         :param image_path: full path to image location, sent over via capture signal
         """
-        self._images_model.append_new_image(
-            image_path,
-            self._app.data_selector.cur_selection_data
-        )
+        self._capture_pipeline.submit(image_path, self._app.data_selector.cur_selection_data)
+
+    @Property(bool, notify=captureBacklogChanged)
+    def isCaptureBacklogged(self) -> bool:
+        return self._capture_pipeline.is_backlogged
+
+    @Slot()
+    def shutdown(self):
+        """
+        finish storing captures still in the pipeline and stop its threads, on app exit
+        """
+        self._capture_pipeline.shutdown()
 
@@ -6,12 +6,11 @@ from pathlib import Path
 import re
 import shutil
 import json
-from datetime import datetime
 
 # local imports
 from py.logger import Logger
-from py.utils import Utils
 from py.qt_models import FramCamSqlListModel
+from py.thumbnails import remove_thumbnail
 
 # 3rd party imports
 from PySide6.QtCore import (
@@ -20,7 +19,9 @@ from PySide6.QtCore import (
     Signal,
 )
 
-from PySide6.QtSql import QSqlTableModel
+from PySide6.QtSql import QSqlQuery
+
+SYNC_RESULTS_BATCH = 300  # image ids per UPDATE, 3 bind values each keeps under sqlite's 999 variable limit
 
 
 class ImagesModel(FramCamSqlListModel):
@@ -28,6 +29,7 @@ class ImagesModel(FramCamSqlListModel):
     currentImageChanged = Signal()
     currentImageValChanged = Signal(str, "QVariant", arguments=['role_name', 'value'])
     curImageNotesChanged = Signal()  # use me to update backup status (notes change --> need to repush)
+    imageRemoved = Signal(int, arguments=['image_id'])  # image and thumbnail files deleted, see ThumbnailProvider
 
 
     def __init__(self, db):
@@ -44,15 +46,11 @@ class ImagesModel(FramCamSqlListModel):
             order by    image_id desc
         '''
 
-        self._table_model = QSqlTableModel(db=self._db)
-        self._table_model.setTable('IMAGES')
-        self._table_model.setEditStrategy(QSqlTableModel.OnManualSubmit)
-        self._table_model.select()
-
         self._cur_image = None
         self._cur_image_file_name = None
         self._is_cur_image_backed_up = None
         self._cur_image_notes = None
+        self._sync_results = {}  # full path --> backup path, copies not yet applied, see applySyncResults
 
         # anytime notes change on image, flag image for re-backup
         self.curImageNotesChanged.connect(self._unbackup_image)
@@ -125,12 +123,7 @@ class ImagesModel(FramCamSqlListModel):
 
         self._logger.debug(f"SETTING {role_name}={value} for image {self.curImgId}")
         self.setData(self._selected_index, value, role_name)
-        for _i in range(self._table_model.rowCount()):  # todo: is this iteration the best way to do this?
-            if self._table_model.record(_i).value('image_id') == self.curImgId:
-                _r = self._table_model.record(_i)
-                _r.setValue(self._table_model.fieldIndex(role_name.upper()), value)
-                self._table_model.setRecord(_i, _r)
-                self._table_model.submitAll()
+        self._update_image(self.curImgId, {role_name.upper(): value})
 
         self.currentImageValChanged.emit(role_name.lower(), value)  # TODO: emit kv pair?
 
@@ -165,98 +158,83 @@ class ImagesModel(FramCamSqlListModel):
     def _unbackup_image(self):
         self.isImgBackedUp = 0
 
+    def _update_image(self, image_id: int, values: dict):
+        """
+        update a single IMAGES row in place
+        :param image_id: int, IMAGES pkey
+        :param values: dict, IMAGES column name --> new value
+        """
+        _query = QSqlQuery(self._db)
+        _query.prepare(f"update IMAGES set {', '.join(f'{k} = :{k}' for k in values)} where IMAGE_ID = :image_id")
+        for k, v in values.items():
+            _query.bindValue(f':{k}', v)
+        _query.bindValue(':image_id', image_id)
+        if not _query.exec():
+            self._logger.error(f"Unable to update IMAGE_ID {image_id} with {values}: {_query.lastError().text()}")
+
     def setImageSyncPath(self, local_path, sync_path, is_successful):
         """
-        allows us to set value for images that arent the "current" selection
+        allows us to set value for images that arent the "current" selection;
+        results are collected and applied together by applySyncResults, every SYNC_RESULTS_BATCH and at copy end
         """
         if is_successful:
-            _model_row = self.getRowIndexByValue('full_path', local_path)
-            _img_id = self.getData(_model_row, 'image_id')
-            for _i in range(self._table_model.rowCount()):
-                if self._table_model.record(_i).value('image_id') == _img_id:
-                    _r = self._table_model.record(_i)
-                    _r.setValue(self._table_model.fieldIndex('BACKUP_PATH'), sync_path)
-                    _r.setValue(self._table_model.fieldIndex('IS_BACKED_UP'), 1)
-                    self._table_model.setRecord(_i, _r)
-                    self._table_model.submitAll()
-
-            self.setData(_model_row, sync_path, 'backup_path')
-            self.setData(_model_row, 1, 'is_backed_up')
-
-    def insert_to_db(self, image_path: str, image_data: dict):
+            self._sync_results[local_path] = sync_path
+            if len(self._sync_results) >= SYNC_RESULTS_BATCH:
+                self.applySyncResults()
+
+    @Slot()
+    def applySyncResults(self):
         """
-        method to create a new rec in IMAGES table and return newly generated IMAGE_ID pkey value
-        :param image_path: full str path to image
-        :param haul_id: int, pkey for HAULS table
-        :param catch_id: int, pkey for CATCH table
-        :param specimen_id: int, pkey for SPECIMEN table
-        :return: int, pkey for new IMAGES table rec
+        mark every collected copy as backed up: one transaction for the db, then model rows patched in place
         """
-        if not os.path.exists(image_path):
-            self._logger.error(f"Unable to add file to IMAGES table: newly image not found at {image_path}")
+        if not self._sync_results:
             return
+        _results, self._sync_results = self._sync_results, {}
+        _rows = {i: _results[row['full_path']] for i, row in enumerate(self._data) if row.get('full_path') in _results}
+        if len(_rows) < len(_results):
+            self._logger.warning(f"{len(_results) - len(_rows)} copied images not found in model, not marked backed up")
+        _paths = [(self._data[i]['image_id'], _path) for i, _path in _rows.items()]
 
-        self._logger.info(f"Creating new image here: {image_path}")
-
-        # create the shell record, then set values
-        _img = self._table_model.record()
-        _img.setValue(self._table_model.fieldIndex('FILE_PATH'), os.path.dirname(image_path))
-        _img.setValue(self._table_model.fieldIndex('FILE_NAME'), os.path.basename(image_path))
-        self._logger.debug(f"Creating image with the following data: {image_data}")
-        for k, v in image_data.items():
-            _col_ix = self._table_model.fieldIndex(str(k).upper())
-            if _col_ix and v is not None:  # allow default values to happen
-                try:
-                    _img.setValue(k, v)
-                except Exception as e:
-                    self._logger.error(f"Unable to set {k} = {v} in IMAGES table model")
-                    continue
-            else:
-                self._logger.warning(f"Column {str(k).upper()} not found in IMAGES table model.")
-
-        _img.setValue(self._table_model.fieldIndex('CAPTURED_DT'), datetime.now().isoformat(timespec="seconds"))
-
-        # do the insert, manually commit, then get newly created ID back out
-        self._table_model.insertRecord(-1, _img)
-        self._table_model.submitAll()
-        _img_id = self._table_model.query().lastInsertId()
-        self._logger.info(f"New IMAGES record created with IMAGE_ID = {_img_id}")
-        return _img_id
-
-    def load_image_from_view(self, image_id, index=0):
-        """
-        following insert to IMAGES table, use image_id to get denormalized version from view
-        and put it into view model / list view
-        :param image_id:
-        :return:
-        TODO: check if image_id row already exists, if so rip out and replace
-        """
-        self._logger.debug(f"Loading image_id {image_id} to list model")
-        self._query.bindValue(':image_id', image_id)
-        self._query.exec()
-        self._query_model.setQuery(self._query)
-        for i in range(self._query_model.rowCount()):
-            self.appendRow(Utils.qrec_to_dict(self._query_model.record(i)), index=index)
-
-        self._logger.debug(f"image_id {image_id} loaded to list model at index {self._selected_index}")
-        self.selectIndexInUI.emit(index)  # selects new row in proxy / listview
+        self._db.transaction()
+        try:
+            for _start in range(0, len(_paths), SYNC_RESULTS_BATCH):
+                _batch = _paths[_start:_start + SYNC_RESULTS_BATCH]
+                _query = QSqlQuery(self._db)
+                _query.prepare(f"""
+                    update  IMAGES
+                    set     BACKUP_PATH = case IMAGE_ID {' '.join('when ? then ?' for _ in _batch)} end
+                            ,IS_BACKED_UP = 1
+                    where   IMAGE_ID in ({', '.join('?' for _ in _batch)})
+                """)
+                for _image_id, _path in _batch:
+                    _query.addBindValue(_image_id)
+                    _query.addBindValue(_path)
+                for _image_id, _ in _batch:
+                    _query.addBindValue(_image_id)
+                if not _query.exec():
+                    raise RuntimeError(_query.lastError().text())
+            if not self._db.commit():
+                raise RuntimeError(self._db.lastError().text())
+        except Exception as e:
+            self._db.rollback()
+            self._logger.error(f"Unable to mark {len(_paths)} copied images as backed up: {e}")
+            return
+
+        self.setRowsData({i: {'backup_path': _path, 'is_backed_up': 1} for i, _path in _rows.items()})
+        self._logger.info(f"Marked {len(_paths)} images as backed up")
+        if self._selected_index in _rows:
+            self.currentImageChanged.emit()  # backup path/status of the current image changed
 
-    def append_new_image(self, image_path: str, image_data: dict):
+    def add_stored_image(self, row: dict, index: int = 0):
         """
-        In the event that the camera has saved an image to disk, this function performs what needs
-        to happen immediately after with respect to the  list model
-        1.) insert to database
-        2.) retrieve denormalized rec from view
-        3.) append to array aka listmodel
-        :param image_id: int, db pkey for IMAGES table
+        put a freshly captured image, already inserted and read back from IMAGES_VW (see capture_pipeline.py),
+        into the list model and select it; the model query isn't re-run
+        :param row: dict, IMAGES_VW row with lower case keys
+        :param index: int, row to insert at, newest images first
         """
-        if not os.path.exists(image_path):
-            self._logger.error(f"Unable to add file to list model: newly image not found at {image_path}")
-            return
-
-        self._logger.debug(f"Inserting record to IMAGES for: {image_path}")
-        _img_id = self.insert_to_db(image_path, image_data)
-        self.load_image_from_view(_img_id)
+        self.appendRow(row, index=index)
+        self._logger.debug(f"image_id {row.get('image_id')} loaded to list model at index {index}")
+        self.selectIndexInUI.emit(index)  # selects new row in proxy / listview
 
     @Slot(int)
     def removeImage(self, row_ix):
@@ -265,12 +243,13 @@ class ImagesModel(FramCamSqlListModel):
         _file_path = self.getData(row_ix, 'full_path')
         if os.path.exists(_file_path):
             os.remove(_file_path)
-        _table_ix = -1
-        for _i in range(self._table_model.rowCount()):
-            if self._table_model.record(_i).value('image_id') == _image_id:
-                self._table_model.removeRow(_i)
-                self._table_model.submitAll()
-                break
+        _query = QSqlQuery(self._db)
+        _query.prepare("delete from IMAGES where IMAGE_ID = :image_id")
+        _query.bindValue(':image_id', _image_id)
+        if not _query.exec():
+            self._logger.error(f"Unable to delete IMAGE_ID {_image_id}: {_query.lastError().text()}")
+        remove_thumbnail(_image_id)
+        self.imageRemoved.emit(_image_id)
 
         self.removeItem(row_ix)
         if self.rowCount() != 0:
@@ -0,0 +1,192 @@
+"""
+jpeg_exif.py: put exif into a jpg without decoding it.
+
+A jpg is a run of marker segments (SOI, APPn, DQT, SOF, DHT, ...) followed by the entropy coded scan data from SOS
+to the end of the file.  Exif lives in a single APP1 segment, so tagging an image only means writing the header
+segments back with a new APP1 and streaming everything from SOS on through untouched; the compressed image data
+is byte for byte the source's, unlike a PIL open/save which re-encodes (and degrades) the pixels every time.
+
+    tag_jpg_with_json(path, {'haul_number': ...})  # in place
+    tag_jpg_with_json(path, data, dest_path)  # tagged copy, e.g. to the wheelhouse
+"""
+# standard imports
+import hashlib
+import json
+import os
+import struct
+
+# 3rd party imports
+import piexif
+
+SOI = b'\xff\xd8'
+SOS = 0xDA
+APP0 = 0xE0
+APP1 = 0xE1
+EXIF_HEADER = b'Exif\x00\x00'
+MAX_SEGMENT_PAYLOAD = 0xFFFF - 2  # segment length field is 2 bytes and counts itself
+STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))  # TEM, RSTn: no length field
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def read_header(f) -> tuple:
+    """
+    :param f: binary file object at the start of a jpg
+    :return: (list of (marker, payload bytes) for every segment before SOS, file offset of the SOS marker)
+    """
+    if f.read(2) != SOI:
+        raise ValueError("not a jpg, missing SOI marker")
+    _segments = []
+    while True:
+        _prefix = f.read(1)
+        if _prefix != b'\xff':
+            raise ValueError(f"corrupt jpg, expected a marker at offset {f.tell() - 1}")
+        _marker = f.read(1)[0]
+        if _marker == 0xFF:  # fill byte before a marker
+            f.seek(-1, os.SEEK_CUR)
+            continue
+        if _marker == SOS:
+            return _segments, f.tell() - 2
+        if _marker in STANDALONE_MARKERS:
+            _segments.append((_marker, b''))
+            continue
+        _length = struct.unpack('>H', f.read(2))[0]
+        _payload = f.read(_length - 2)
+        if len(_payload) != _length - 2:
+            raise ValueError("corrupt jpg, truncated before image data")
+        _segments.append((_marker, _payload))
+
+
+def _is_exif(marker: int, payload: bytes) -> bool:
+    return marker == APP1 and payload.startswith(EXIF_HEADER)
+
+
+def load_exif(path: str) -> bytes:
+    """
+    :return: bytes, the exif APP1 payload (starting b'Exif\\0\\0', as piexif.load takes it), None if there's none
+    """
+    with open(path, 'rb') as f:
+        _segments, _ = read_header(f)
+    return next((p for m, p in _segments if _is_exif(m, p)), None)
+
+
+def tagged_header(src, exif_bytes: bytes) -> tuple:
+    """
+    build the header of a tagged copy: every segment before SOS, with the exif APP1 replaced by exif_bytes
+    :param src: binary file object at the start of the source jpg
+    :param exif_bytes: bytes, e.g. from piexif.dump
+    :return: (bytes new header, int offset of SOS in src - copy from there on as is,
+        hashlib object with the header's part of image_digest, update it with the rest of the file)
+    """
+    if not exif_bytes.startswith(EXIF_HEADER):
+        exif_bytes = EXIF_HEADER + exif_bytes
+    if len(exif_bytes) > MAX_SEGMENT_PAYLOAD:
+        raise ValueError(f"exif is {len(exif_bytes)} bytes, more than fits in one APP1 segment")
+
+    _segments, _sos_offset = read_header(src)
+    _segments = [(m, p) for m, p in _segments if not _is_exif(m, p)]
+    _insert_at = 1 if _segments and _segments[0][0] == APP0 else 0  # exif goes right after JFIF, if any
+    _segments.insert(_insert_at, (APP1, exif_bytes))
+
+    _header = bytearray(SOI)
+    _digest = hashlib.sha256()
+    for _marker, _payload in _segments:
+        _header += bytes((0xFF, _marker))
+        if _marker not in STANDALONE_MARKERS:
+            _header += struct.pack('>H', len(_payload) + 2)
+        _header += _payload
+        if not _is_exif(_marker, _payload):
+            _digest.update(bytes((_marker,)) + _payload)
+    return bytes(_header), _sos_offset, _digest
+
+
+def write_exif(src_path: str, dest_path: str, exif_bytes: bytes) -> str:
+    """
+    write src_path to dest_path with its exif APP1 replaced by exif_bytes, everything else copied as is
+    :param exif_bytes: bytes, e.g. from piexif.dump
+    :return: str, hex digest of the image data written (see image_digest)
+    """
+    _tmp_path = f"{dest_path}.tmp"  # dest is only replaced once fully written, also makes src == dest safe
+    try:
+        with open(src_path, 'rb') as _src, open(_tmp_path, 'wb') as _dest:
+            _header, _sos_offset, _digest = tagged_header(_src, exif_bytes)
+            _dest.write(_header)
+            _src.seek(_sos_offset)
+            while _chunk := _src.read(COPY_CHUNK_BYTES):
+                _digest.update(_chunk)
+                _dest.write(_chunk)
+        os.replace(_tmp_path, dest_path)
+    except Exception:
+        if os.path.exists(_tmp_path):
+            os.remove(_tmp_path)
+        raise
+    return _digest.hexdigest()
+
+
+def image_digest(path: str) -> str:
+    """
+    :return: str, hex digest of everything that decides the pixels (all segments but exif, and the scan data);
+        equal digests mean byte identical compressed image data, so identical pixels when decoded
+    """
+    _digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        _segments, _sos_offset = read_header(f)
+        for _marker, _payload in _segments:
+            if not _is_exif(_marker, _payload):
+                _digest.update(bytes((_marker,)) + _payload)
+        f.seek(_sos_offset)
+        while _chunk := f.read(COPY_CHUNK_BYTES):
+            _digest.update(_chunk)
+    return _digest.hexdigest()
+
+
+def json_exif(path: str, image_data: dict) -> bytes:
+    """
+    :param path: str, jpg whose existing exif is kept
+    :param image_data: dict, json serializable, goes in the exif UserComment tag
+    :return: bytes, exif to write with write_exif/tagged_header
+    """
+    _exif = load_exif(path)
+    _exif_dict = piexif.load(_exif) if _exif else {'0th': {}, 'Exif': {}, 'GPS': {}, 'Interop': {}, '1st': {}}
+    _exif_dict['Exif'][piexif.ExifIFD.UserComment] = json.dumps(image_data, default=str).encode('utf-8')
+    _exif_dict.pop('thumbnail', None)  # piexif can't always re-dump camera thumbnails, and we don't use them
+    _exif_dict['1st'] = {}
+    return piexif.dump(_exif_dict)
+
+
+def tag_jpg_with_json(path: str, image_data: dict, dest_path: str = None, verify: bool = False):
+    """
+    put image_data as json in the exif UserComment tag, keeping any other exif; pixels aren't re-encoded
+    :param path: str, jpg to tag
+    :param image_data: dict, json serializable
+    :param dest_path: str, write the tagged copy here instead of in place
+    :param verify: bool, read dest back and check its image data matches what was written
+    :return: str, digest of the image data, see image_digest
+    """
+    _dest_path = dest_path or path
+    _written = write_exif(path, _dest_path, json_exif(path, image_data))
+    if verify and image_digest(_dest_path) != _written:
+        raise IOError(f"image data of {_dest_path} doesn't match {path} after tagging")
+    return _written
+
+
+if __name__ == '__main__':
+    # round trip check on a hand built jpg: exif swapped in, every other byte kept
+    import tempfile
+
+    _body = (b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+             + b'\xff\xdb' + struct.pack('>H', 5) + b'\x00\x01\x02'
+             + b'\xff\xda' + struct.pack('>H', 4) + b'\x01\x00' + bytes(range(256)) * 64 + b'\xff\xd9')
+    with tempfile.TemporaryDirectory() as _dir:
+        _src = os.path.join(_dir, 'src.jpg')
+        with open(_src, 'wb') as f:
+            f.write(SOI + _body)
+        _dest = os.path.join(_dir, 'dest.jpg')
+        _digest = write_exif(_src, _dest, EXIF_HEADER + b'MM\x00\x2a\x00\x00\x00\x08\x00\x00')
+        assert load_exif(_dest).startswith(EXIF_HEADER + b'MM')
+        assert image_digest(_dest) == image_digest(_src) == _digest
+        with open(_dest, 'rb') as f:
+            _data = f.read()
+        assert _data.endswith(_body[18:]), "everything after JFIF should be untouched"
+        write_exif(_dest, _dest, EXIF_HEADER + b'II\x2a\x00\x08\x00\x00\x00\x00\x00')  # in place, replaces exif
+        assert load_exif(_dest).startswith(EXIF_HEADER + b'II') and image_digest(_dest) == _digest
+        print("jpeg_exif checks passed")
@@ -0,0 +1,109 @@
+"""
+pipeline_stats.py: rolling timing percentiles for each step of the frame pipeline.
+
+CVFrameWorker records how long resize, threshold, decode, draw, etc. take on every frame; CamControls takes a
+snapshot about once a second and exposes it to QML (camControls.pipelineStats) and the log, so a slow preview
+can be reported with real numbers.
+"""
+# standard imports
+from contextlib import contextmanager
+import threading
+import time
+
+# 3rd party imports
+import numpy as np
+
+DEFAULT_WINDOW = 300  # samples kept per stage, ~10s of frames at 30 fps
+PERCENTILES = (50, 95, 99)
+
+
+class RollingHistogram:
+    """
+    fixed size ring of the most recent samples; recording is O(1) and doesn't allocate,
+    percentiles are only computed when a snapshot is asked for
+    """
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self._samples = np.zeros(window, dtype=np.float64)
+        self._next = 0
+        self._count = 0  # total samples ever recorded
+
+    def record(self, value: float):
+        self._samples[self._next] = value
+        self._next = (self._next + 1) % len(self._samples)
+        self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def percentiles(self, percentiles=PERCENTILES) -> dict:
+        """
+        :param percentiles: iterable of percentiles to compute
+        :return: dict of 'p50' etc --> value over the current window, empty if nothing recorded
+        """
+        _n = min(self._count, len(self._samples))
+        if not _n:
+            return {}
+        _values = np.percentile(self._samples[:_n], percentiles)
+        return {f'p{p}': round(float(v), 3) for p, v in zip(percentiles, _values)}
+
+
+class PipelineStats:
+    """
+    Named RollingHistograms of stage times in ms.  record() is called from the frame worker (and decoder pool
+    result) threads, snapshot() from the main thread, so both take a lock.
+
+        with stats.time('resize'):
+            array = resize(array)
+    """
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self._window = window
+        self._stages = {}  # stage name --> RollingHistogram, in the order first recorded
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        """
+        :param stage: str, name of pipeline step
+        :param seconds: float, time the step took
+        """
+        with self._lock:
+            _hist = self._stages.get(stage)
+            if _hist is None:
+                _hist = self._stages[stage] = RollingHistogram(self._window)
+            _hist.record(seconds * 1000)
+
+    @contextmanager
+    def time(self, stage: str):
+        _start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - _start)
+
+    def snapshot(self) -> dict:
+        """
+        :return: dict of stage name --> {'count': n, 'p50': ms, 'p95': ms, 'p99': ms}
+        """
+        with self._lock:
+            return {name: {'count': h.count, **h.percentiles()} for name, h in self._stages.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+
+def format_stats(stats: dict) -> str:
+    """
+    :param stats: dict, as exposed by CamControls.pipelineStats
+    :return: multi line str for the log
+    """
+    _lines = [
+        f"camera {stats.get('camera_fps', 0):.1f} fps, processor {stats.get('processor_fps', 0):.1f} fps, "
+        f"dropped {stats.get('dropped_per_s', 0):.1f}/s, skipped {stats.get('skipped_per_s', 0):.1f}/s"
+    ]
+    for _name, _stage in stats.get('stages', {}).items():
+        _lines.append(
+            f"    {_name:<24} n={_stage.get('count', 0):<8} p50={_stage.get('p50', 0):>8.2f}ms "
+            f"p95={_stage.get('p95', 0):>8.2f}ms p99={_stage.get('p99', 0):>8.2f}ms"
+        )
+    return '\n'.join(_lines)
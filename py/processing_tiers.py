@@ -0,0 +1,167 @@
+"""
+processing_tiers.py: pick the resolution frames are downsized to before barcode scanning/effects.
+
+Bigger frames read small tags from farther away, smaller frames keep slow tablets smooth.  A tier can be
+selected by hand, or left on Auto: Auto benchmarks each tier on the actual hardware at startup, starts at the
+largest tier that fits in the frame budget, then steps down when the pipeline falls behind and back up when
+there's headroom.
+"""
+# standard imports
+import time
+
+# local imports
+from py.logger import Logger
+
+# 3rd party imports
+import numpy as np
+
+AUTO_TIER = 'Auto'
+PROCESSING_TIERS = {  # name --> (max height, max width), smallest first
+    '480p': (480, 640),
+    '720p': (720, 1280),
+    '1080p': (1080, 1920)
+}
+DEFAULT_TIER = '480p'
+
+FRAME_BUDGET_MS = 1000 / 30  # processing a frame should fit within one camera frame interval
+TUNE_WINDOW_FRAMES = 60  # frames between tuning decisions
+BEHIND_DROP_FRACTION = 0.25  # more than this fraction of frames dropped by the scheduler means we're behind
+HEADROOM_FRACTION = 0.6  # step up if the next tier's estimated cost fits in this fraction of the budget
+COOLDOWN_WINDOWS = 2  # windows to wait after any change before deciding again
+STEP_UP_BACKOFF_WINDOWS = 10  # after falling behind, wait this many windows before trying the bigger tier again
+
+
+def tier_pixels(tier: str) -> int:
+    _height, _width = PROCESSING_TIERS[tier]
+    return _height * _width
+
+
+class ProcessingTierTuner:
+    """
+    Decides which tier CVFrameWorker.resize_image uses in Auto mode.
+
+        tuner.calibrate(measure_ms)  at startup, measure_ms(tier) returns ms to scan a frame at that tier
+        tuner.record(frame_seconds, counters, ...)  after every processed frame, returns the new tier if it changed
+    """
+    def __init__(self, budget_ms: float = FRAME_BUDGET_MS, window: int = TUNE_WINDOW_FRAMES):
+        """
+        :param budget_ms: float, ms we can spend on a frame (updated from measured camera fps in record())
+        :param window: int, frames per tuning decision
+        """
+        self._logger = Logger.get_root()
+        self._tiers = list(PROCESSING_TIERS)
+        self._tier = DEFAULT_TIER
+        self._budget_ms = budget_ms
+        self._window = window
+        self._frame_ms = np.zeros(window, dtype=np.float64)
+        self._n_frames = 0
+        self._window_start_counts = None
+        self._cooldown = 0
+        self._step_up_blocked = {}  # tier --> windows left before we try it again
+        self._calibration = {}  # tier --> ms measured at startup
+
+    @property
+    def tier(self) -> str:
+        return self._tier
+
+    @property
+    def calibration(self) -> dict:
+        return dict(self._calibration)
+
+    def reset(self, tier: str = None):
+        """
+        start over from tier (or the current one), forgetting the current window
+        """
+        if tier is not None:
+            self._tier = tier
+        self._n_frames = 0
+        self._window_start_counts = None
+        self._cooldown = COOLDOWN_WINDOWS
+        self._step_up_blocked = {}
+
+    def calibrate(self, measure_ms) -> str:
+        """
+        measure each tier, smallest first, and start at the largest one that fits in the budget
+        :param measure_ms: callable(tier name) --> ms to process a frame at that tier
+        :return: str, chosen tier
+        """
+        self._calibration = {}
+        _chosen = self._tiers[0]
+        for _tier in self._tiers:
+            _ms = measure_ms(_tier)
+            self._calibration[_tier] = round(_ms, 2)
+            if _ms > self._budget_ms:
+                break  # bigger tiers will only be slower
+            _chosen = _tier
+
+        self._logger.info(f"Processing tier calibration (budget {self._budget_ms:.1f}ms): {self._calibration}, "
+                          f"starting at {_chosen}")
+        self.reset(_chosen)
+        return _chosen
+
+    def record(self, frame_seconds: float, counters: dict, frame_interval: float = None, source_shape: tuple = None):
+        """
+        :param frame_seconds: float, time the worker spent on the last frame
+        :param counters: dict, FrameScheduler.counters
+        :param frame_interval: float, seconds between camera frames if known, sets the budget
+        :param source_shape: shape of camera frames, we don't step up past a tier that would no longer downsize them
+        :return: str, new tier if it should change, else None
+        """
+        if frame_interval:
+            self._budget_ms = frame_interval * 1000
+        if self._window_start_counts is None:
+            self._window_start_counts = dict(counters)
+
+        self._frame_ms[self._n_frames] = frame_seconds * 1000
+        self._n_frames += 1
+        if self._n_frames < self._window:
+            return None
+
+        _dispatched = counters['dispatched'] - self._window_start_counts['dispatched']
+        _dropped = counters['dropped'] - self._window_start_counts['dropped']
+        _drop_fraction = _dropped / max(_dispatched + _dropped, 1)
+        _p50, _p90 = np.percentile(self._frame_ms, (50, 90))
+        self._n_frames = 0
+        self._window_start_counts = dict(counters)
+        self._step_up_blocked = {t: n - 1 for t, n in self._step_up_blocked.items() if n > 1}
+
+        if self._cooldown > 0:
+            self._cooldown -= 1
+            return None
+
+        _index = self._tiers.index(self._tier)
+        if (_drop_fraction > BEHIND_DROP_FRACTION or _p50 > self._budget_ms) and _index > 0:
+            self._step_up_blocked[self._tier] = STEP_UP_BACKOFF_WINDOWS
+            return self._change_tier(self._tiers[_index - 1], f"falling behind (p50 {_p50:.1f}ms, "
+                                                             f"{_drop_fraction:.0%} dropped)")
+
+        _is_full_size = source_shape is not None and \
+            PROCESSING_TIERS[self._tier][0] >= source_shape[0] and PROCESSING_TIERS[self._tier][1] >= source_shape[1]
+        if _index < len(self._tiers) - 1 and not _is_full_size:
+            _next = self._tiers[_index + 1]
+            _estimate = _p90 * tier_pixels(_next) / tier_pixels(self._tier)
+            if _drop_fraction == 0 and _next not in self._step_up_blocked and \
+                    _estimate < HEADROOM_FRACTION * self._budget_ms:
+                return self._change_tier(_next, f"headroom (p90 {_p90:.1f}ms, next tier est. {_estimate:.1f}ms)")
+
+        return None
+
+    def _change_tier(self, tier: str, reason: str) -> str:
+        self._logger.info(f"Auto processing tier {self._tier} --> {tier}: {reason}, budget {self._budget_ms:.1f}ms")
+        self._tier = tier
+        self._cooldown = COOLDOWN_WINDOWS
+        return tier
+
+
+def time_ms(func, repeats: int = 3) -> float:
+    """
+    :param func: callable to time
+    :param repeats: int, times to run it
+    :return: float, median ms
+    """
+    _times = []
+    for _ in range(repeats):
+        _start = time.perf_counter()
+        func()
+        _times.append((time.perf_counter() - _start) * 1000)
+    return float(np.median(_times))
@@ -219,6 +219,24 @@ class FramCamSqlListModel(QAbstractListModel):
             self._logger.warning(f"Row with {role_name}={value} not found, returning -1")
             return -1
 
+    def setRowsData(self, row_values: dict):
+        """
+        set role data on many rows at once, emitting one dataChanged per run of adjacent rows instead of per value
+        :param row_values: dict, row --> {role name: value}
+        """
+        _roles = {r for _values in row_values.values() for r in _values}
+        _role_nums = [self.getRoleByName(r) for r in _roles]
+        for _row, _values in row_values.items():
+            self._data[_row].update(_values)
+
+        _rows = sorted(row_values)
+        _start = None
+        for i, _row in enumerate(_rows):
+            _start = _row if _start is None else _start
+            if i + 1 == len(_rows) or _rows[i + 1] != _row + 1:  # end of a run
+                self.dataChanged.emit(self.index(_start, 0), self.index(_row, 0), _role_nums)
+                _start = None
+
     def removeItem(self, row_index):
         if row_index == -1:
             return
@@ -0,0 +1,284 @@
+"""
+resumable_transfer.py: write tagged image copies to the wheelhouse share so a dropped link costs a retry, not a
+truncated "backup".
+
+A copy is written in CHUNK_BYTES pieces to <dest>.part, with a checkpoint (<dest>.part.json) saved every
+CHECKPOINT_BYTES, and at the end of the stream, once the data before it is flushed.  If the transfer fails, the
+next attempt (a retry here, or the next sync) checks the .part up to the checkpoint against the source by hash and
+carries on from there.  Only once the whole .part hashes the same as the source stream is it renamed over <dest>,
+so a file at the final path is always complete.  That check reads every byte written back over the share; pass
+transfer a PipelineStats to time it against the write (benchmark.py copy reports both).
+
+The stream is the tagged header (built in memory, see jpeg_exif.tagged_header) followed by the source's image data,
+read through an mmap so chunks go from the page cache to the share without being copied into python first.
+"""
+# standard imports
+from contextlib import closing
+import hashlib
+import json
+import mmap
+import os
+import time
+
+# local imports
+from py.logger import Logger
+from py.jpeg_exif import tagged_header, json_exif
+from py.pipeline_stats import PipelineStats
+
+CHUNK_BYTES = 1024 * 1024
+CHECKPOINT_BYTES = CHUNK_BYTES  # flushed + checkpointed this often, so a drop mid image (most are 2-3MB) costs a chunk
+PART_SUFFIX = '.part'
+CHECKPOINT_SUFFIX = '.part.json'
+MAX_ATTEMPTS = 3  # per file per sync, the next sync picks up from the checkpoint anyway
+RETRY_DELAY_S = 2.0
+
+
+class TaggedStream:
+    """
+    the bytes of a tagged copy, without writing them anywhere; close() (or use as a context manager) when done
+    """
+    def __init__(self, src_path: str, exif_bytes: bytes):
+        self._file = open(src_path, 'rb')
+        try:
+            self._header, self._sos_offset, self._image_digest = tagged_header(self._file, exif_bytes)
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self.size = len(self._header) + len(self._mmap) - self._sos_offset
+        _stat = os.fstat(self._file.fileno())
+        _id = hashlib.sha256(self._header)
+        _id.update(f"{_stat.st_size}:{_stat.st_mtime_ns}".encode())
+        self.stream_id = _id.hexdigest()  # a checkpoint is only resumed for the same source and tags
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._mmap.close()  # chunks() releases its views as it goes, so nothing is still exported
+        self._file.close()
+
+    def chunks(self, start: int = 0, end: int = None):
+        """
+        :param start: int, stream offset to start from
+        :param end: int, stream offset to stop at, None for the end
+        :return: generator of memoryviews of at most CHUNK_BYTES, each released once the next is asked for
+        """
+        _end = self.size if end is None else end
+        _pos = 0
+        with memoryview(self._header) as _header, memoryview(self._mmap) as _image:
+            for _part in (_header, _image[self._sos_offset:]):
+                with _part:
+                    _part_start, _pos = _pos, _pos + len(_part)
+                    _offset = max(start, _part_start)
+                    while _offset < min(_end, _pos):
+                        _stop = min(_offset + CHUNK_BYTES, _end, _pos)
+                        with _part[_offset - _part_start:_stop - _part_start] as _chunk:
+                            yield _chunk
+                        _offset = _stop
+
+    def digest(self, end: int = None) -> str:
+        """
+        :return: str, sha256 of the stream up to end (all of it if None)
+        """
+        _digest = hashlib.sha256()
+        with closing(self.chunks(end=end)) as _chunks:
+            for _chunk in _chunks:
+                _digest.update(_chunk)
+        return _digest.hexdigest()
+
+    def image_digest(self) -> str:
+        """
+        :return: str, jpeg_exif.image_digest of the copy, without reading it back
+        """
+        _digest = self._image_digest.copy()
+        with memoryview(self._mmap) as _image, _image[self._sos_offset:] as _data:
+            _digest.update(_data)
+        return _digest.hexdigest()
+
+
+def file_digest(path: str, end: int = None, opener=open) -> str:
+    """
+    :return: str, sha256 of the file up to end (all of it if None)
+    """
+    _digest = hashlib.sha256()
+    _left = end
+    with opener(path, 'rb') as f:
+        while _left is None or _left > 0:
+            _chunk = f.read(CHUNK_BYTES if _left is None else min(CHUNK_BYTES, _left))
+            if not _chunk:
+                break
+            _digest.update(_chunk)
+            if _left is not None:
+                _left -= len(_chunk)
+    return _digest.hexdigest()
+
+
+def _resume_offset(stream: TaggedStream, part_path: str, checkpoint_path: str, opener=open) -> int:
+    """
+    :return: int, offset the .part is good up to (hash checked against the stream), 0 to start over
+    """
+    try:
+        with opener(checkpoint_path, 'r') as f:
+            _checkpoint = json.load(f)
+        _offset = int(_checkpoint['offset'])
+        if _checkpoint['stream_id'] != stream.stream_id or os.path.getsize(part_path) < _offset:
+            return 0
+        if file_digest(part_path, _offset, opener) != stream.digest(_offset):
+            Logger.get_root().warning(f"{part_path} doesn't match its checkpoint, starting over")
+            return 0
+        return _offset
+    except (OSError, ValueError, KeyError):  # no checkpoint yet, or it's unreadable
+        return 0
+
+
+def _save_checkpoint(checkpoint_path: str, stream_id: str, offset: int, opener=open):
+    _tmp_path = f"{checkpoint_path}.tmp"
+    with opener(_tmp_path, 'w') as f:
+        json.dump({'stream_id': stream_id, 'offset': offset}, f)
+    os.replace(_tmp_path, checkpoint_path)
+
+
+def transfer(stream: TaggedStream, dest_path: str, opener=open, timings: PipelineStats = None) -> int:
+    """
+    write stream to dest_path through a checkpointed .part, resuming a previous attempt if there is one
+    :param stream: TaggedStream
+    :param dest_path: str, final path, only ever holds a complete, verified copy
+    :param opener: callable like open, for the share's files (tests pass one that fails on purpose)
+    :param timings: PipelineStats to record 'write' and 'verify' (read back + hash) times to, if given
+    :return: int, offset the transfer resumed from
+    """
+    _part_path = dest_path + PART_SUFFIX
+    _checkpoint_path = dest_path + CHECKPOINT_SUFFIX
+    _start = _resume_offset(stream, _part_path, _checkpoint_path, opener)
+
+    _started = time.perf_counter()
+    with opener(_part_path, 'r+b' if _start else 'wb') as f:
+        f.truncate(_start)  # anything after the checkpoint may be partial
+        f.seek(_start)
+        _offset, _unsaved = _start, 0
+        with closing(stream.chunks(_start)) as _chunks:
+            for _chunk in _chunks:
+                f.write(_chunk)
+                _offset += len(_chunk)
+                _unsaved += len(_chunk)
+                if _unsaved >= CHECKPOINT_BYTES or _offset == stream.size:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    _save_checkpoint(_checkpoint_path, stream.stream_id, _offset, opener)
+                    _unsaved = 0
+        f.flush()
+        os.fsync(f.fileno())
+
+    _written = time.perf_counter()
+    _verified = file_digest(_part_path, opener=opener) == stream.digest()
+    if timings is not None:
+        timings.record('write', _written - _started)
+        timings.record('verify', time.perf_counter() - _written)
+    if not _verified:
+        os.remove(_part_path)  # don't resume from something we can't trust
+        if os.path.exists(_checkpoint_path):
+            os.remove(_checkpoint_path)
+        raise IOError(f"{_part_path} doesn't match its source after transfer")
+
+    os.replace(_part_path, dest_path)
+    if os.path.exists(_checkpoint_path):
+        os.remove(_checkpoint_path)
+    return _start
+
+
+def copy_tagged(src_path: str, dest_path: str, image_data: dict, attempts: int = MAX_ATTEMPTS,
+                retry_delay_s: float = RETRY_DELAY_S, opener=open, timings: PipelineStats = None) -> str:
+    """
+    copy a jpg with image_data tagged into its exif (see jpeg_exif.tag_jpg_with_json), resumably
+    :param timings: PipelineStats to record write/verify times to, see transfer
+    :return: str, digest of the copy's image data, see jpeg_exif.image_digest
+    """
+    _logger = Logger.get_root()
+    with TaggedStream(src_path, json_exif(src_path, image_data)) as _stream:
+        for _attempt in range(1, attempts + 1):
+            try:
+                _resumed_from = transfer(_stream, dest_path, opener, timings)
+                if _resumed_from:
+                    _logger.info(f"Resumed {dest_path} from {_resumed_from} of {_stream.size} bytes")
+                return _stream.image_digest()
+            except OSError as e:
+                if _attempt == attempts:
+                    raise
+                _logger.warning(f"Transfer to {dest_path} failed (attempt {_attempt} of {attempts}), retrying: {e}")
+                time.sleep(retry_delay_s)
+
+
+if __name__ == '__main__':
+    # fault injection check: a share that drops the link every few MB still ends up with an exact copy
+    import struct
+    import tempfile
+    from py.jpeg_exif import EXIF_HEADER, SOI, image_digest
+
+    class FlakyFile:
+        def __init__(self, f, opener):
+            self._f = f
+            self._opener = opener
+
+        def write(self, data):
+            self._opener.written += len(data)
+            if self._opener.written > self._opener.fail_every:
+                self._opener.written = 0
+                self._f.write(bytes(data)[:len(data) // 2])  # half a chunk lands, then the link drops
+                raise ConnectionResetError("injected link drop")
+            return self._f.write(data)
+
+        def __getattr__(self, name):
+            return getattr(self._f, name)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            self._f.close()
+
+    class FlakyOpener:
+        def __init__(self, fail_every: int):
+            self.fail_every = fail_every
+            self.written = 0
+
+        def __call__(self, path, mode='r'):
+            _f = open(path, mode)
+            return FlakyFile(_f, self) if path.endswith(PART_SUFFIX) and mode != 'rb' else _f
+
+    def _check(image_bytes: int, fail_every: int):
+        """
+        :param image_bytes: int, size of the synthetic jpg's scan data
+        :param fail_every: int, bytes written to a .part between injected link drops
+        :return: int, offset the successful attempt resumed from
+        """
+        with tempfile.TemporaryDirectory() as _dir:
+            _src = os.path.join(_dir, 'src.jpg')
+            with open(_src, 'wb') as f:
+                f.write(SOI + b'\xff\xdb' + struct.pack('>H', 5) + b'\x00\x01\x02' + b'\xff\xda' + struct.pack('>H', 4)
+                        + b'\x01\x00' + os.urandom(image_bytes) + b'\xff\xd9')
+            _exif = EXIF_HEADER + b'MM\x00\x2a\x00\x00\x00\x08\x00\x00'
+            _dest = os.path.join(_dir, 'dest.jpg')
+            _opener = FlakyOpener(fail_every)
+
+            _resumes = []
+            with TaggedStream(_src, _exif) as _stream:
+                for _ in range(10):
+                    try:
+                        _resumes.append(transfer(_stream, _dest, _opener))
+                        break
+                    except ConnectionResetError:
+                        assert not os.path.exists(_dest), "nothing at the final path until it's complete"
+                _expected = _stream.digest()
+                _expected_image = _stream.image_digest()
+            assert file_digest(_dest) == _expected and image_digest(_dest) == image_digest(_src) == _expected_image
+            assert not os.path.exists(_dest + PART_SUFFIX) and not os.path.exists(_dest + CHECKPOINT_SUFFIX)
+            assert _resumes and _resumes[-1] > 0, "the last attempt should have resumed from a checkpoint"
+            return _resumes[-1]
+
+    _big = _check(11 * CHUNK_BYTES + 123, fail_every=5 * CHUNK_BYTES)
+    _typical = _check(2 * CHUNK_BYTES + CHUNK_BYTES // 2, fail_every=CHUNK_BYTES + CHUNK_BYTES // 2)  # drops mid file
+    print(f"resumable_transfer checks passed, succeeded after resuming at {_big} bytes (11MB), {_typical} bytes (2.5MB)")
@@ -0,0 +1,223 @@
+"""
+taxon_classifier.py: guess the taxon on deck from camera frames with a small CPU-only ONNX model.
+
+Classification is slow next to a barcode scan and the answer changes slowly, so CVFrameWorker only samples a
+frame every SAMPLE_INTERVAL_S, downsizes it and queues it to a TaxonWorker on its own QThread.  The worker
+batches BATCH_SIZE samples into one inference call and averages their class probabilities, which both
+amortizes the call overhead and smooths out single bad frames.  If the worker is still busy, samples are
+skipped rather than queued, so preview and barcode scanning are never held up.
+
+onnxruntime is optional: without it (or without a model file) the scanner just isn't available.  Passing
+STUB_MODEL as the model path gives a tiny deterministic stand-in, for benchmarks and testing without weights.
+"""
+# standard imports
+import os
+import threading
+
+# local imports
+from py.logger import Logger
+from py.config import TAXON_MODEL_PATH
+
+# 3rd party imports
+import cv2
+import numpy as np
+from PySide6.QtCore import QObject, Signal, Slot
+try:
+    import onnxruntime as ort
+except ImportError:  # taxon scanning is optional, see is_classifier_available
+    ort = None
+
+STUB_MODEL = 'stub'
+INPUT_SIZE = 224  # px, square model input
+SAMPLE_INTERVAL_S = 0.5  # seconds between frames sampled for classification
+BATCH_SIZE = 4  # samples per inference call, averaged into one prediction
+MIN_CONFIDENCE = 0.6  # averaged probability needed to emit taxonDetected
+INTRA_OP_THREADS = 2  # leave the other cores to the frame pipeline
+MAX_PENDING_SAMPLES = BATCH_SIZE  # samples queued to the worker but not yet taken in
+
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32) * 255  # imagenet normalization, what most backbones expect
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32) * 255
+_SESSIONS = {}  # model path --> session, models are only loaded once per process
+_SESSIONS_LOCK = threading.Lock()
+
+
+class _NodeArg:
+    def __init__(self, name: str, shape: list):
+        self.name = name
+        self.shape = shape
+
+
+class StubSession:
+    """
+    stand-in for onnxruntime.InferenceSession (just run/get_inputs/get_outputs): a fixed random linear layer
+    over 8x8 pooled pixels, so output is deterministic and depends on the image
+    """
+    def __init__(self, n_classes: int = 8, input_size: int = INPUT_SIZE, seed: int = 0):
+        self._input_size = input_size
+        self._weights = np.random.default_rng(seed).standard_normal((3 * 8 * 8, n_classes)).astype(np.float32)
+
+    def get_inputs(self) -> list:
+        return [_NodeArg('input', ['N', 3, self._input_size, self._input_size])]
+
+    def get_outputs(self) -> list:
+        return [_NodeArg('logits', ['N', self._weights.shape[1]])]
+
+    def run(self, output_names, input_feed: dict) -> list:
+        _batch = input_feed['input']
+        _n, _c, _h, _w = _batch.shape
+        _pooled = _batch.reshape(_n, _c, 8, _h // 8, 8, _w // 8).mean(axis=(3, 5)).reshape(_n, -1)
+        return [_pooled @ self._weights]
+
+
+def is_classifier_available(model_path: str = TAXON_MODEL_PATH) -> bool:
+    return model_path == STUB_MODEL or (ort is not None and os.path.isfile(model_path))
+
+
+def load_session(model_path: str = TAXON_MODEL_PATH):
+    """
+    :param model_path: str, path to .onnx model, or STUB_MODEL
+    :return: cached session for the model, created on first use
+    """
+    with _SESSIONS_LOCK:
+        if model_path not in _SESSIONS:
+            if model_path == STUB_MODEL:
+                _SESSIONS[model_path] = StubSession()
+            elif ort is None:
+                raise RuntimeError("onnxruntime is not installed, taxon classification unavailable")
+            else:
+                _options = ort.SessionOptions()
+                _options.intra_op_num_threads = INTRA_OP_THREADS
+                _options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                _SESSIONS[model_path] = ort.InferenceSession(model_path, _options,
+                                                             providers=['CPUExecutionProvider'])
+        return _SESSIONS[model_path]
+
+
+def load_labels(model_path: str, n_classes: int) -> list:
+    """
+    class names are read from <model>.labels.txt, one per line in output order
+    """
+    _labels_path = os.path.splitext(model_path)[0] + '.labels.txt'
+    if os.path.isfile(_labels_path):
+        with open(_labels_path) as f:
+            _labels = [line.strip() for line in f if line.strip()]
+        if len(_labels) == n_classes:
+            return _labels
+        Logger.get_root().warning(f"{_labels_path} has {len(_labels)} labels, model has {n_classes} classes")
+    return [f"class_{i}" for i in range(n_classes)]
+
+
+def downsize_sample(array: np.ndarray, size: int = INPUT_SIZE) -> np.ndarray:
+    """
+    the only work done on the frame thread: shrink a frame to model input size (a new array, safe to queue)
+    :param array: RGB or single channel image array
+    :return: size x size x 3 uint8 RGB array
+    """
+    _small = cv2.resize(array, (size, size), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(_small, cv2.COLOR_GRAY2RGB) if _small.ndim == 2 else _small
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    _exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return _exp / _exp.sum(axis=1, keepdims=True)
+
+
+class TaxonClassifier:
+    """
+    wraps a (cached) session: classify a batch of samples from downsize_sample into averaged class probabilities
+    """
+    def __init__(self, model_path: str = TAXON_MODEL_PATH):
+        self._session = load_session(model_path)
+        _input = self._session.get_inputs()[0]
+        self._input_name = _input.name
+        self._input_size = _input.shape[-1] if isinstance(_input.shape[-1], int) else INPUT_SIZE
+        self._labels = None
+        self._model_path = model_path
+        self._batch = None  # preallocated NCHW float input, grown if a bigger batch comes in
+
+    @property
+    def input_size(self) -> int:
+        return self._input_size
+
+    def preprocess(self, samples: list) -> np.ndarray:
+        """
+        :param samples: list of input_size x input_size x 3 uint8 RGB arrays
+        :return: N x 3 x H x W float32 normalized batch (a view of a reused buffer)
+        """
+        _n = len(samples)
+        if self._batch is None or len(self._batch) < _n:
+            self._batch = np.empty((_n, 3, self._input_size, self._input_size), dtype=np.float32)
+        for i, _sample in enumerate(samples):
+            _normalized = (_sample.astype(np.float32) - _MEAN) / _STD
+            self._batch[i] = _normalized.transpose(2, 0, 1)
+        return self._batch[:_n]
+
+    def predict(self, samples: list) -> tuple:
+        """
+        :param samples: list of arrays from downsize_sample
+        :return: (label, confidence) of the class with the highest probability averaged over the batch
+        """
+        _logits = self._session.run(None, {self._input_name: self.preprocess(samples)})[0]
+        _probs = softmax(_logits).mean(axis=0)
+        if self._labels is None:
+            self._labels = load_labels(self._model_path, len(_probs))
+        _best = int(np.argmax(_probs))
+        return self._labels[_best], float(_probs[_best])
+
+
+class TaxonWorker(QObject):
+    """
+    runs TaxonClassifier on its own QThread; CVFrameWorker calls reserve_sample() on the frame thread and,
+    if it returns True, queues a downsized sample to add_sample
+    """
+    taxonDetected = Signal(str, float, arguments=['taxon_name', 'confidence'])
+
+    def __init__(self, model_path: str = TAXON_MODEL_PATH, batch_size: int = BATCH_SIZE,
+                 min_confidence: float = MIN_CONFIDENCE):
+        super().__init__()
+        self._logger = Logger.get_root()
+        self._model_path = model_path
+        self._batch_size = batch_size
+        self._min_confidence = min_confidence
+        self._classifier = None  # session is loaded on the worker thread, on the first sample
+        self._samples = []
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def reserve_sample(self) -> bool:
+        """
+        :return: bool, True if the worker can take another sample without falling behind
+        """
+        with self._lock:
+            if self._pending >= MAX_PENDING_SAMPLES:
+                return False
+            self._pending += 1
+            return True
+
+    @Slot("QVariant")
+    def add_sample(self, sample: np.ndarray):
+        """
+        :param sample: array from downsize_sample; every batch_size samples are classified together
+        """
+        with self._lock:
+            self._pending = max(self._pending - 1, 0)
+        self._samples.append(sample)
+        if len(self._samples) < self._batch_size:
+            return
+
+        _samples, self._samples = self._samples, []
+        try:
+            if self._classifier is None:
+                self._classifier = TaxonClassifier(self._model_path)
+            _taxon, _confidence = self._classifier.predict(_samples)
+        except Exception as e:
+            self._logger.error(f"Taxon classification failed: {e}")
+            return
+
+        self._logger.debug(f"Taxon classified as {_taxon} ({_confidence:.2f})")
+        if _confidence >= self._min_confidence:
+            self.taxonDetected.emit(_taxon, _confidence)
+
+    @Slot()
+    def reset(self):
+        self._samples = []
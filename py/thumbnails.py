@@ -0,0 +1,157 @@
+"""
+thumbnails.py: small jpg thumbnails for the image strips, so QML never decodes a full camera image to draw an icon.
+
+Thumbnails are written by the capture pipeline as each image is stored (see capture_pipeline.py), to
+THUMBNAILS_DIR/<IMAGE_ID>.jpg.  Images from before thumbnails existed get theirs the first time they're shown.
+PIL's draft mode lets the jpg decoder scale by 1/2-1/8 while decoding, so a thumbnail costs a fraction of a
+full decode.
+
+QML asks ThumbnailProvider for them as "image://thumbnails/<image_id>/<url encoded full path>"; decoded
+thumbnails are kept in an LRU of CACHE_SIZE images so memory stays bounded however many images are scrolled past,
+and dropped from it as soon as their image is deleted (ThumbnailProvider.invalidate).
+"""
+# standard imports
+from collections import OrderedDict
+import os
+import tempfile
+import threading
+from urllib.parse import unquote
+
+# local imports
+from py.logger import Logger
+from py.config import THUMBNAILS_DIR
+
+# 3rd party imports
+from PIL import Image
+from PySide6.QtCore import QObject, Qt, QSize, Signal, Slot
+from PySide6.QtGui import QImage
+from PySide6.QtQuick import QQuickImageProvider
+
+PROVIDER_NAME = 'thumbnails'
+THUMBNAIL_SIZE = 320  # px, longest edge
+THUMBNAIL_QUALITY = 85
+CACHE_SIZE = 200  # decoded thumbnails held in memory, ~ 320x240x4 bytes each
+
+
+def thumbnail_path(image_id) -> str:
+    return os.path.join(THUMBNAILS_DIR, f"{int(image_id)}.jpg")
+
+
+def write_thumbnail(image_path: str, image_id, size: int = THUMBNAIL_SIZE) -> str:
+    """
+    :param image_path: str, full size jpg
+    :param image_id: int, IMAGES pkey the thumbnail is named for
+    :param size: int, longest edge in px
+    :return: str, path to the thumbnail
+    """
+    _path = thumbnail_path(image_id)
+    with Image.open(image_path) as _img:
+        _img.draft('RGB', (size, size))  # decode at the smallest jpg scale still >= size
+        _img.thumbnail((size, size), Image.Resampling.BILINEAR)
+        # unique temp name, the pipeline and QML's async loaders can be writing the same thumbnail at once
+        _fd, _tmp_path = tempfile.mkstemp(suffix='.tmp', dir=THUMBNAILS_DIR)
+        try:
+            with os.fdopen(_fd, 'wb') as f:
+                _img.convert('RGB').save(f, 'JPEG', quality=THUMBNAIL_QUALITY)
+            os.replace(_tmp_path, _path)  # the provider never sees a half written file
+        except Exception:
+            os.remove(_tmp_path)
+            raise
+    return _path
+
+
+def remove_thumbnail(image_id):
+    try:
+        os.remove(thumbnail_path(image_id))
+    except FileNotFoundError:
+        pass
+
+
+class ThumbnailWorker(QObject):
+    """
+    capture pipeline stage: thumbnail each image once it's stored, before it's handed to the model
+    """
+    written = Signal(str, "QVariant", arguments=['path', 'row'])  # passed on whether the thumbnail worked or not
+
+    def __init__(self):
+        super().__init__()
+        self._logger = Logger.get_root()
+
+    @Slot(str, "QVariant")
+    def write(self, path: str, row: dict):
+        """
+        :param path: str, full path to the stored image
+        :param row: dict, IMAGES_VW row for it
+        """
+        try:
+            write_thumbnail(path, row['image_id'])
+        except Exception as e:
+            self._logger.error(f"Unable to write thumbnail for {path}, will retry when shown: {e}")
+        self.written.emit(path, row)
+
+    @Slot()
+    def flush(self):
+        """
+        no-op, invoked blocking at shutdown so everything queued before it has been written (and passed on)
+        """
+
+
+class ThumbnailProvider(QQuickImageProvider):
+    """
+    register with engine.addImageProvider(PROVIDER_NAME, ...); with Image.asynchronous QML calls requestImage
+    from its loader threads, so the cache is locked
+    """
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        super().__init__(QQuickImageProvider.ImageType.Image)
+        self._logger = Logger.get_root()
+        self._cache_size = cache_size
+        self._cache = OrderedDict()  # image_id --> QImage, least recently shown first
+        self._lock = threading.Lock()
+
+    def requestImage(self, id: str, size: QSize, requested_size: QSize) -> QImage:
+        """
+        :param id: str, "<image_id>/<url encoded full path>", the full path is only read if there's no thumbnail yet
+        :param size: QSize, set to the size of the image returned
+        :param requested_size: QSize, Image.sourceSize; thumbnails are scaled down to fit it (0 = either dimension)
+        """
+        _image_id, _, _full_path = id.partition('/')
+        _image = self._get_thumbnail(_image_id, unquote(_full_path))
+        if not _image.isNull():
+            _width = requested_size.width() if requested_size.width() > 0 else _image.width()
+            _height = requested_size.height() if requested_size.height() > 0 else _image.height()
+            if _width < _image.width() or _height < _image.height():
+                _image = _image.scaled(_width, _height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        size.setWidth(_image.width())
+        size.setHeight(_image.height())
+        return _image
+
+    def invalidate(self, image_id):
+        """
+        drop an image's thumbnail from the cache, e.g. connected to ImagesModel.imageRemoved
+        :param image_id: int, IMAGES pkey
+        """
+        with self._lock:
+            self._cache.pop(str(image_id), None)
+
+    def _get_thumbnail(self, image_id: str, full_path: str) -> QImage:
+        with self._lock:
+            if image_id in self._cache:
+                self._cache.move_to_end(image_id)
+                return self._cache[image_id]
+
+        try:
+            _path = thumbnail_path(image_id)
+            if not os.path.exists(_path):
+                _path = write_thumbnail(full_path, image_id)  # older image, or pipeline couldn't write it
+        except Exception as e:
+            self._logger.error(f"Unable to make thumbnail for image {image_id} ({full_path}): {e}")
+            return QImage()
+
+        _image = QImage(_path)
+        if _image.isNull():
+            return _image
+        with self._lock:
+            self._cache[image_id] = _image
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return _image
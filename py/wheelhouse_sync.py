@@ -0,0 +1,138 @@
+"""
+wheelhouse_sync.py: only send the wheelhouse what it doesn't already have.
+
+A manifest at the destination (MANIFEST_NAME, next to the images subdir) records, per file copied:
+
+    image_hash   digest of the image data (jpeg_exif.image_digest), the same for the local file and its copy
+    src_size/src_mtime_ns   local file as it was when copied, so unchanged files are never re-hashed
+    dest_size    size of the tagged copy, to notice copies deleted or replaced on the wheelhouse side
+    meta_hash    hash of the exif json the copy was tagged with, the "metadata version"
+
+SyncManifest.plan compares a list of images model rows against it, and one directory listing of the destination,
+in a single pass: new or changed images are copied, images whose data selection/notes changed are re-tagged,
+everything else is skipped, so re-syncing a whole haul only sends what changed.  Exif lives inside the jpg, so a
+re-tag still writes the whole copy from the local file, and resumable_transfer reads it all back over the share to
+verify it before it replaces the old one: skipping is the only way a file costs nothing.
+"""
+# standard imports
+import hashlib
+import json
+import os
+
+# local imports
+from py.logger import Logger
+from py.jpeg_exif import image_digest
+
+MANIFEST_NAME = 'fram_cam_manifest.json'
+MANIFEST_VERSION = 1
+SYNC_STATE_KEYS = {'backup_path', 'is_backed_up'}  # set by the sync itself, not part of the metadata version
+
+COPY = 'copy'  # image not at the destination, or its image data changed
+METADATA = 'metadata'  # image unchanged, exif json needs updating
+SKIP = 'skip'
+
+
+def metadata_hash(image_data: dict) -> str:
+    """
+    :param image_data: dict, images model row, as tagged into the copy's exif
+    :return: str, changes whenever the tagged json would
+    """
+    _meta = {k: v for k, v in image_data.items() if k not in SYNC_STATE_KEYS}
+    return hashlib.sha1(json.dumps(_meta, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class SyncManifest:
+    """
+        manifest = SyncManifest.load(destination_folder)
+        for image_item, action in manifest.plan(image_items, images_subdir): ...
+        manifest.record(image_item, new_path, image_hash)  # after each copy
+        manifest.save()
+    """
+    def __init__(self, destination_folder: str, entries: dict = None):
+        self._logger = Logger.get_root()
+        self._path = os.path.join(destination_folder, MANIFEST_NAME)
+        self._entries = entries or {}  # file name --> see module docstring
+
+    @classmethod
+    def load(cls, destination_folder: str) -> 'SyncManifest':
+        """
+        a missing, unreadable or older version manifest means starting over, i.e. everything is copied once
+        """
+        _path = os.path.join(destination_folder, MANIFEST_NAME)
+        try:
+            with open(_path) as f:
+                _manifest = json.load(f)
+            if _manifest.get('version') == MANIFEST_VERSION:
+                return cls(destination_folder, _manifest['images'])
+            Logger.get_root().warning(f"Ignoring version {_manifest.get('version')} sync manifest at {_path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            Logger.get_root().warning(f"Unable to read sync manifest {_path}, resyncing everything: {e}")
+        return cls(destination_folder)
+
+    def plan(self, image_items: list, images_dir: str) -> list:
+        """
+        :param image_items: list of dict, images model rows (full_path, file_name, ...)
+        :param images_dir: str, destination directory the copies go to
+        :return: list of (image_item, COPY | METADATA | SKIP), in image_items order
+        """
+        try:
+            with os.scandir(images_dir) as _entries:
+                _dest_sizes = {e.name: e.stat().st_size for e in _entries if e.is_file()}
+        except OSError as e:  # can't tell what's there, so copy everything
+            self._logger.warning(f"Unable to list {images_dir}, copying all images: {e}")
+            _dest_sizes = {}
+
+        _plan = []
+        for _item in image_items:
+            _name = os.path.basename(_item['file_name'])
+            _entry = self._entries.get(_name)
+            _action = COPY
+            if _entry is not None and _dest_sizes.get(_name) == _entry['dest_size']:
+                try:
+                    _action = self._check_unchanged(_item, _entry)
+                except (OSError, ValueError) as e:  # missing/unreadable/corrupt, let the copy report it
+                    self._logger.warning(f"Unable to check {_item['full_path']} against the sync manifest, "
+                                         f"copying it: {e}")
+            _plan.append((_item, _action))
+        return _plan
+
+    @staticmethod
+    def _check_unchanged(image_item: dict, entry: dict) -> str:
+        """
+        :param image_item: dict, images model row with a manifest entry whose copy is still at the destination
+        :param entry: dict, its manifest entry, updated if the file was only touched
+        :return: str, COPY | METADATA | SKIP
+        """
+        _stat = os.stat(image_item['full_path'])
+        _unchanged = (_stat.st_size, _stat.st_mtime_ns) == (entry['src_size'], entry['src_mtime_ns'])
+        if not _unchanged:  # touched locally, only a changed image data digest means a real change
+            _unchanged = image_digest(image_item['full_path']) == entry['image_hash']
+            if _unchanged:  # don't hash it again next time
+                entry.update(src_size=_stat.st_size, src_mtime_ns=_stat.st_mtime_ns)
+        if not _unchanged:
+            return COPY
+        return SKIP if metadata_hash(image_item) == entry['meta_hash'] else METADATA
+
+    def record(self, image_item: dict, dest_path: str, image_hash: str):
+        """
+        :param image_item: dict, images model row that was copied/tagged
+        :param dest_path: str, where it was written
+        :param image_hash: str, image data digest, from jpeg_exif.tag_jpg_with_json
+        """
+        _stat = os.stat(image_item['full_path'])
+        self._entries[os.path.basename(dest_path)] = {
+            'image_hash': image_hash,
+            'src_size': _stat.st_size,
+            'src_mtime_ns': _stat.st_mtime_ns,
+            'dest_size': os.path.getsize(dest_path),
+            'meta_hash': metadata_hash(image_item)
+        }
+
+    def save(self):
+        _tmp_path = f"{self._path}.tmp"
+        with open(_tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'images': self._entries}, f)
+        os.replace(_tmp_path, self._path)  # a half written manifest would make the next sync resend everything
+        self._logger.info(f"Sync manifest saved with {len(self._entries)} images: {self._path}")
@@ -118,7 +118,7 @@ Item {
                 disabledBackgroundColor: appStyle.elevatedSurface_L9
                 borderWidth: 5
                 radius: 20
-                enabled: camControls.isCameraRunning && lvThumbnails.currentIndex === -1
+                enabled: camControls.isCameraRunning && lvThumbnails.currentIndex === -1 && !camControls.isCaptureBacklogged
 
                 anchors {
                     right: parent.right
@@ -194,6 +194,48 @@ Item {
                     anchors.bottomMargin: 5
                     fillMode: VideoOutput.PreserveAspectCrop
                 }
+                Canvas {
+                    // barcode highlight, drawn over the video instead of into the frames (see CVFrameWorker._barcode_outline)
+                    id: barcodeOverlay
+                    anchors.fill: videoOutput
+                    clip: true
+                    property var outline: null
+                    onPaint: {
+                        var ctx = getContext("2d")
+                        ctx.reset()
+                        if (!outline || outline.points.length < 2) return
+                        // contentRect is where the frame is drawn in item coords, bigger than the item when cropped
+                        var rect = videoOutput.contentRect
+                        ctx.lineWidth = 12
+                        ctx.lineJoin = "round"
+                        ctx.strokeStyle = appStyle.accentColor
+                        ctx.beginPath()
+                        for (var i = 0; i < outline.points.length; i++) {
+                            var x = rect.x + outline.points[i][0] * rect.width
+                            var y = rect.y + outline.points[i][1] * rect.height
+                            if (i === 0) ctx.moveTo(x, y)
+                            else ctx.lineTo(x, y)
+                        }
+                        ctx.closePath()
+                        ctx.stroke()
+                    }
+                    Timer {
+                        id: tmrBarcodeOverlay
+                        interval: 750  // clear the highlight once the tag hasn't been read for a bit
+                        onTriggered: {
+                            barcodeOverlay.outline = null
+                            barcodeOverlay.requestPaint()
+                        }
+                    }
+                    Connections {
+                        target: camControls
+                        function onBarcodeOutlineChanged() {
+                            barcodeOverlay.outline = camControls.barcodeOutline
+                            barcodeOverlay.requestPaint()
+                            tmrBarcodeOverlay.restart()
+                        }
+                    }
+                }
 
                 Rectangle {
                     id: rectControls
@@ -347,13 +389,12 @@ Item {
                             implicitWidth: rowControls.buttonWidth
                             implicitHeight: rowControls.buttonHeight
                             radius: 20
-                            visible: false
+                            visible: camControls.isTaxonClassifierAvailable
                             iconSource: 'qrc:/svgs/kraken.svg'
                             checkable: true
+                            checked: camControls.isTaxonScannerOn
                             onClicked: {
-                                if (checked) {
-                                    camControls.testEmit()
-                                }
+                                camControls.isTaxonScannerOn = checked
                             }
                         }
 
@@ -441,7 +482,9 @@ Item {
                     delegate: Column {
                         Image {
                             id: imgThumbnail
-                            source: "file:///" + model.full_path
+                            source: "image://thumbnails/" + model.image_id + "/" + encodeURIComponent(model.full_path)
+                            sourceSize.width: width
+                            asynchronous: true
                             width: lvThumbnails.width - 30
                             anchors {
                                 right: parent.right
@@ -118,7 +118,8 @@ Item {
                                     Layout.preferredWidth: 100
                                     sourceSize.height: 47
                                     sourceSize.width: 47
-                                    source: "file:///" + model.full_path
+                                    source: "image://thumbnails/" + model.image_id + "/" + encodeURIComponent(model.full_path)
+                                    asynchronous: true
                                     cache: true
                                 }
                                 ColumnLayout {
@@ -235,6 +235,81 @@ Item {
                                 }
                             }
                         }
+                        FramCamComboBox {
+                            id: cbProcessingTier
+                            Layout.alignment: Qt.AlignLeft
+                            Layout.preferredWidth: 200
+                            Layout.preferredHeight: 75
+                            titleLabelText: "Processing Size"
+                            model: camControls.processingTiers
+                            backgroundColor: appStyle.elevatedSurface_L5
+                            placeholderText: 'Select size...'
+                            Component.onCompleted: cbProcessingTier.currentIndex = cbProcessingTier.model.indexOf(camControls.processingTier)
+                            onCurrentIndexChanged: {
+                                if (currentIndex > -1) camControls.processingTier = model[currentIndex]
+                            }
+                        }
+                        FramCamComboBox {
+                            id: cbBurstCount
+                            Layout.alignment: Qt.AlignLeft
+                            Layout.preferredWidth: 200
+                            Layout.preferredHeight: 75
+                            titleLabelText: "Burst (keep sharpest)"
+                            model: [1, 3, 5]
+                            backgroundColor: appStyle.elevatedSurface_L5
+                            placeholderText: 'Select burst...'
+                            Component.onCompleted: cbBurstCount.currentIndex = cbBurstCount.model.indexOf(camControls.burstCount)
+                            onCurrentIndexChanged: {
+                                if (currentIndex > -1) camControls.burstCount = model[currentIndex]
+                            }
+                        }
+                        FramCamButton {
+                            text: "Skip\nBlurry"
+                            Layout.preferredHeight: 75
+                            Layout.preferredWidth: 75
+                            checkable: true
+                            checked: camControls.isSharpnessGateOn
+                            onClicked: camControls.isSharpnessGateOn = checked
+                        }
+                        FramCamButton {
+                            text: "Zero\nLag"
+                            Layout.preferredHeight: 75
+                            Layout.preferredWidth: 75
+                            checkable: true
+                            checked: camControls.isZslOn
+                            onClicked: camControls.isZslOn = checked
+                        }
+                        FramCamComboBox {
+                            id: cbZslBuffer
+                            enabled: camControls.isZslOn
+                            Layout.alignment: Qt.AlignLeft
+                            Layout.preferredWidth: 150
+                            Layout.preferredHeight: 75
+                            titleLabelText: "Zero Lag MB"
+                            model: [32, 64, 128]
+                            backgroundColor: appStyle.elevatedSurface_L5
+                            placeholderText: 'Select MB...'
+                            Component.onCompleted: cbZslBuffer.currentIndex = cbZslBuffer.model.indexOf(camControls.zslBufferMb)
+                            onCurrentIndexChanged: {
+                                if (currentIndex > -1) camControls.zslBufferMb = model[currentIndex]
+                            }
+                        }
+                        Label {
+                            id: lblPipelineStats
+                            Layout.preferredWidth: 300
+                            color: appStyle.secondaryFontColor
+                            font.pixelSize: root.labelSize
+                            property var stats: camControls.pipelineStats
+                            text: stats && stats.camera_fps !== undefined ?
+                                "Camera: " + stats.camera_fps + " fps\nProcessor: " + stats.processor_fps +
+                                " fps @ " + stats.processing_tier + "\nDropped: " + stats.dropped_per_s + "/s" : "Camera: -- fps"
+                        }
+                        FramCamButton {
+                            text: "Log\nStats"
+                            Layout.preferredHeight: 75
+                            Layout.preferredWidth: 75
+                            onClicked: camControls.logPipelineStats()
+                        }
                     }
                 }  // camera group box end
             }